@@ -0,0 +1,333 @@
+import ast
+import copy
+
+import numpy as np
+
+import frontend
+
+# Operations of the tape: name -> NumPy function computing the value.
+# powc is a power whose exponent does not depend on the variables, rpow one
+# whose base does not; their derivatives skip the term that is known to be zero.
+_OPERATIONS = {
+    'add': np.add, 'sub': np.subtract, 'mul': np.multiply, 'div': np.divide,
+    'powc': np.power, 'rpow': np.power, 'pow': np.power,
+    'neg': np.negative,
+    'sqrt': np.sqrt, 'sin': np.sin, 'cos': np.cos, 'tan': np.tan,
+    'log': np.log, 'exp': np.exp,
+}
+_BINARY = {ast.Add: 'add', ast.Sub: 'sub', ast.Mult: 'mul', ast.Div: 'div', ast.Pow: 'pow'}
+_FUNCTIONS = {'sqrt': 'sqrt', 'sin': 'sin', 'cos': 'cos', 'tan': 'tan', 'log': 'log', 'ln': 'log', 'exp': 'exp'}
+
+
+# Forward-mode rules: tangent of the result from the operands' values (a, b),
+# the result's value (v) and the operands' tangents (Ta, Tb)
+def _tangent(op, a, b, v, Ta, Tb):
+    if op == 'add':
+        return Ta + Tb
+    if op == 'sub':
+        return Ta - Tb
+    if op == 'mul':
+        return Ta * b + a * Tb
+    if op == 'div':
+        return (Ta - v * Tb) / b
+    if op == 'powc':
+        return b * a ** (b - 1) * Ta
+    if op == 'rpow':
+        return v * np.log(a) * Tb
+    if op == 'pow':
+        return b * a ** (b - 1) * Ta + v * np.log(a) * Tb
+    if op == 'neg':
+        return -Ta
+    if op == 'sqrt':
+        return Ta / (2 * v)
+    if op == 'sin':
+        return np.cos(a) * Ta
+    if op == 'cos':
+        return -np.sin(a) * Ta
+    if op == 'tan':
+        return (1 + v * v) * Ta
+    if op == 'log':
+        return Ta / a
+    return v * Ta  # exp
+
+
+def color_columns(incidence, n_vars):
+    '''Greedy coloring of the Jacobian's columns for compressed seeding.
+
+    Two columns get different colors when some equation contains both
+    variables, so one forward pass per color yields every entry: the
+    derivative along the sum of a color's unit vectors, taken for equation i,
+    is the entry of the one variable of that color in equation i.
+
+    Returns:
+    - (colors, n_colors), colors holding one color index per variable.
+    '''
+    rows_of = [[] for _ in range(n_vars)]
+    for i, cols in enumerate(incidence):
+        for j in cols:
+            rows_of[j].append(i)
+    colors = [-1] * n_vars
+    for j in range(n_vars):
+        taken = {colors[k] for i in rows_of[j] for k in incidence[i]}
+        color = 0
+        while color in taken:
+            color += 1
+        colors[j] = color
+    return colors, max(colors, default=-1) + 1
+
+
+class _Builder:
+    '''Records the parsed residuals as a tape, one node per distinct operation.
+
+    Identical operations on identical operands share a node, and operations
+    on constants only are folded, so the tape is linear in the size of the
+    equations.
+    '''
+    def __init__(self, names):
+        self.names = names  # name -> slot or ('const', value)
+        self.ops = []  # (op, out, a, b)
+        self.depends = []  # whether the slot depends on the variables
+        self.constants = {}  # value -> slot
+        self.folded = {}  # slot -> value
+        self.nodes = {}
+
+    def slot(self, depends):
+        self.depends.append(depends)
+        return len(self.depends) - 1
+
+    def constant(self, value):
+        value = float(value)
+        if value not in self.constants:
+            self.constants[value] = self.slot(False)
+            self.folded[self.constants[value]] = value
+        return self.constants[value]
+
+    def operation(self, op, a, b=-1):
+        if op == 'pow':
+            op = 'powc' if not self.depends[b] else 'rpow' if not self.depends[a] else 'pow'
+        if op in ('add', 'mul') and b < a:
+            a, b = b, a
+        key = (op, a, b)
+        if key in self.nodes:
+            return self.nodes[key]
+        if a in self.folded and (b == -1 or b in self.folded):
+            args = [np.float64(self.folded[slot]) for slot in (a, b) if slot != -1]
+            with np.errstate(all='ignore'):
+                return self.constant(_OPERATIONS[op](*args))
+        out = self.slot(self.depends[a] or (b != -1 and self.depends[b]))
+        self.ops.append((op, out, a, b))
+        self.nodes[key] = out
+        return out
+
+    def visit(self, node):
+        if isinstance(node, ast.BinOp):
+            return self.operation(_BINARY[type(node.op)], self.visit(node.left), self.visit(node.right))
+        if isinstance(node, ast.UnaryOp):
+            operand = self.visit(node.operand)
+            return self.operation('neg', operand) if isinstance(node.op, ast.USub) else operand
+        if isinstance(node, ast.Call):
+            return self.operation(_FUNCTIONS[node.func.id], self.visit(node.args[0]))
+        if isinstance(node, ast.Name):
+            if node.id not in self.names:
+                raise ValueError(f"name '{node.id}' is not defined")
+            slot = self.names[node.id]
+            return self.constant(slot[1]) if isinstance(slot, tuple) else slot
+        return self.constant(node.value)
+
+
+class Tape:
+    '''Residuals and forward-mode Jacobian of a system, evaluated in batches.
+
+    The tape's operations run in batches of one kind whose operands are all
+    computed, one NumPy call per batch, so the Python work per evaluation
+    grows with the depth of the equations, not their number. Tangents are carried
+    for one seed direction per column color (see color_columns), so a Jacobian
+    costs one pass with n_colors directions instead of one per variable.
+
+    Use build() to record a tape; to_dict()/from_dict() serialize it.
+    bind() fixes the parameters of a tape recorded with some.
+    '''
+    def __init__(self, n_vars, n_params, n_nodes, constant_slots, constant_values, program, roots,
+                 colors=None, jac_rows=None, jac_cols=None):
+        self.n_vars = n_vars
+        self.n_params = n_params
+        self.n_nodes = n_nodes
+        self.constant_slots = np.asarray(constant_slots, dtype=np.intp)
+        self.constant_values = np.asarray(constant_values, dtype=np.float64)
+        # (operation, output slots, first operand slots, second operand slots or None)
+        self.program = [(op, np.asarray(out, dtype=np.intp), np.asarray(a, dtype=np.intp),
+                         None if b is None else np.asarray(b, dtype=np.intp)) for op, out, a, b in program]
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.colors = None
+        self.n_colors = 0
+        if colors is not None:
+            self.seed(jac_rows, jac_cols, colors)
+
+    def seed(self, jac_rows, jac_cols, colors):
+        '''Sets the Jacobian entries fused() computes and the column colors used to seed them.'''
+        self.colors = np.asarray(colors, dtype=np.intp)
+        self.n_colors = int(self.colors.max(initial=-1)) + 1
+        # Entry k is the tangent of its equation's root along its variable's color
+        self._entry_slots = self.roots[np.asarray(jac_rows, dtype=np.intp)]
+        self._entry_colors = self.colors[np.asarray(jac_cols, dtype=np.intp)]
+
+    def _values(self, x, params):
+        try:
+            x = np.asarray(x)
+        except ValueError:  # scalars mixed with arrays
+            x = np.array(np.broadcast_arrays(*x))
+        shape = np.broadcast_shapes(x.shape[1:], *(np.shape(p) for p in params))
+        # float32 variables are evaluated in float32, anything else in float64
+        V = np.empty((self.n_nodes,) + shape, dtype=np.float32 if x.dtype == np.float32 else np.float64)
+        V[:self.n_vars] = x
+        for j, value in enumerate(params):
+            V[self.n_vars + j] = value
+        V[self.constant_slots] = self.constant_values.reshape((-1,) + (1,) * len(shape))
+        return V
+
+    def residuals(self, x, F, params=()):
+        '''Writes the residuals at x into F and returns F.'''
+        V = self._values(x, params)
+        with np.errstate(all='ignore'):
+            for op, out, a, b in self.program:
+                V[out] = _OPERATIONS[op](V[a]) if b is None else _OPERATIONS[op](V[a], V[b])
+        F[:] = V[self.roots]
+        return F
+
+    def fused(self, x, F, J, params=()):
+        '''Writes the residuals into F and the Jacobian entries into J; returns (F, J).'''
+        V = self._values(x, params)
+        shape = V.shape[1:]
+        T = np.zeros((self.n_nodes, self.n_colors) + shape, dtype=V.dtype)
+        T[np.arange(self.n_vars), self.colors] = 1
+        with np.errstate(all='ignore'):
+            for op, out, a, b in self.program:
+                # Values gain an axis so they broadcast over the seed directions
+                Va = V[a][:, None]
+                if b is None:
+                    Vb = Tb = None
+                    v = _OPERATIONS[op](Va)
+                else:
+                    Vb, Tb = V[b][:, None], T[b]
+                    v = _OPERATIONS[op](Va, Vb)
+                V[out] = v[:, 0]
+                T[out] = _tangent(op, Va, Vb, v, T[a], Tb)
+        F[:] = V[self.roots]
+        J[:] = T[self._entry_slots, self._entry_colors]
+        return F, J
+
+    def bind(self, params):
+        '''Returns a tape of the variables only, with the parameters fixed at params.
+
+        The operations that do not depend on the variables run here, once, and
+        their results join the constants.
+        '''
+        V = self._values(np.zeros(self.n_vars), params)
+        depends = np.zeros(self.n_nodes, dtype=bool)
+        depends[:self.n_vars] = True
+        program = []
+        with np.errstate(all='ignore'):
+            for op, out, a, b in self.program:
+                varying = depends[a] if b is None else depends[a] | depends[b]
+                fixed = ~varying
+                if fixed.any():
+                    V[out[fixed]] = _OPERATIONS[op](V[a[fixed]]) if b is None else \
+                        _OPERATIONS[op](V[a[fixed]], V[b[fixed]])
+                if varying.any():
+                    depends[out[varying]] = True
+                    program.append((op, out[varying], a[varying], None if b is None else b[varying]))
+        tape = copy.copy(self)
+        tape.n_params = 0
+        tape.constant_slots = np.flatnonzero(~depends)
+        tape.constant_values = V[tape.constant_slots]
+        tape.program = program
+        return tape
+
+    def to_dict(self):
+        return {
+            "n_vars": self.n_vars,
+            "n_params": self.n_params,
+            "n_nodes": self.n_nodes,
+            "constant_slots": self.constant_slots.tolist(),
+            "constant_values": self.constant_values.tolist(),
+            "program": [[op, out.tolist(), a.tolist(), None if b is None else b.tolist()]
+                        for op, out, a, b in self.program],
+            "roots": self.roots.tolist(),
+            "colors": None if self.colors is None else self.colors.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data, jac_rows=None, jac_cols=None):
+        return cls(data["n_vars"], data["n_params"], data["n_nodes"], data["constant_slots"],
+                   data["constant_values"], data["program"], data["roots"], data["colors"], jac_rows, jac_cols)
+
+
+def build(system, variables, coefficients, parameters=()):
+    '''Records a system's residuals as a Tape, without symbolic differentiation.
+
+    Parameters:
+    - system: frontend.EquationSystem.
+    - variables: variable names, in argument order.
+    - coefficients: constant name -> value; substituted into the tape.
+    - parameters: names of constants kept as inputs (trailing arguments).
+
+    Returns:
+    - Tape computing the residuals; call its seed() with jacobian_pattern()
+      to compute Jacobian entries as well.
+    '''
+    names = {name: ('const', value) for name, value in frontend.NUMPY_NAMES.items() if not callable(value)}
+    names.update({name: ('const', value) for name, value in coefficients.items() if name not in parameters})
+    builder = _Builder(names)
+    for name in variables:
+        names[name] = builder.slot(True)
+    for name in parameters:
+        names[name] = builder.slot(False)
+    roots = [builder.visit(expression.tree) for expression in system.expressions]
+    return Tape(len(variables), len(parameters), len(builder.depends), list(builder.folded),
+                list(builder.folded.values()), _schedule(builder.ops), roots)
+
+
+def _schedule(ops):
+    '''Orders the operations into batches of one kind, one NumPy call each.
+
+    List scheduling: of the operations whose operands are computed, the kind
+    with the most ready operations runs next, so operations of a kind wait
+    for each other and the tape needs few batches.
+    '''
+    computed_by = {out: (op, out, a, b) for op, out, a, b in ops}
+    users = {}
+    waiting = {}
+    ready = {}
+    for op, out, a, b in ops:
+        operands = {slot for slot in (a, b) if slot in computed_by}
+        waiting[out] = len(operands)
+        for slot in operands:
+            users.setdefault(slot, []).append(out)
+        if not operands:
+            ready.setdefault(op, []).append(out)
+    program = []
+    while ready:
+        op = max(ready, key=lambda kind: len(ready[kind]))
+        batch = ready.pop(op)
+        nodes = [computed_by[out] for out in batch]
+        program.append((op, [n[1] for n in nodes], [n[2] for n in nodes],
+                        None if nodes[0][3] == -1 else [n[3] for n in nodes]))
+        for out in batch:
+            for user in users.get(out, ()):
+                waiting[user] -= 1
+                if not waiting[user]:
+                    ready.setdefault(computed_by[user][0], []).append(user)
+    return program
+
+
+def jacobian_pattern(system, variables):
+    '''Structurally nonzero Jacobian entries (the variables each equation contains) and column colors.
+
+    Returns:
+    - (jac_rows, jac_cols, colors), entries ordered by row, then column.
+    '''
+    incidence = [sorted(cols) for cols in system.incidence(variables)]
+    colors, _ = color_columns(incidence, len(variables))
+    rows = [i for i, cols in enumerate(incidence) for _ in cols]
+    cols = [j for cols in incidence for j in cols]
+    return rows, cols, colors
@@ -1,12 +1,74 @@
-from flask import Flask, render_template, request, jsonify
-from core_runner import solve_equations
-from core_runner import extract_var
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+from core_runner import SOLVERS, get_system, find_system, solve_job, warm_up
+import atexit
+import guess_store
+import jobs
+import json
+import multiprocessing
+import result_cache
+import shutil
+import system_cache
+import tempfile
 import webbrowser
 import threading
 import os
+import sys
 
 app = Flask(__name__)
 
+# Solves run in worker processes; share compiled systems between them through the on-disk cache.
+# Cached entries are executed when loaded, so without NLSOLVER_CACHE_DIR the server uses a private
+# directory (mode 0700, unpredictable name) removed at exit, and hands it to its job processes
+# through the environment.
+if not os.environ.get("NLSOLVER_CACHE_DIR") and multiprocessing.parent_process() is None:
+    os.environ["NLSOLVER_CACHE_DIR"] = tempfile.mkdtemp(prefix="nlsolver_cache_")
+    atexit.register(shutil.rmtree, os.environ["NLSOLVER_CACHE_DIR"], ignore_errors=True)
+system_cache.configure(disk_dir=os.environ.get("NLSOLVER_CACHE_DIR"))
+# Solves start from the last converged solution of their system
+guess_store.configure(path=os.environ.get("NLSOLVER_GUESS_DB") or guess_store.DEFAULT_PATH)
+
+job_queue = jobs.JobQueue(
+    max_workers=int(os.environ.get("NLSOLVER_WORKERS", 0)) or None,
+    timeout=float(os.environ.get("NLSOLVER_JOB_TIMEOUT", 300)),
+)
+
+# Repeated identical solves are served from memory, and identical solves in flight share one job
+solve_results = result_cache.ResultCache(
+    max_size=int(os.environ.get("NLSOLVER_RESULT_CACHE_SIZE", 256)),
+    max_age=float(os.environ.get("NLSOLVER_RESULT_CACHE_TTL", 3600)) or None,
+    max_bytes=int(os.environ.get("NLSOLVER_RESULT_CACHE_BYTES", 64 * 2**20)),
+)
+
+# Import and warm up the backends once at boot, before any job process is forked, so neither the
+# first request nor each job pays for the SymPy/SciPy/GEKKO imports. NLSOLVER_PRELOAD lists the
+# solvers to warm up (comma-separated, default all; empty to skip).
+# Job processes are forked (see jobs.process_context); where fork is unavailable they import this
+# module again, and skip the warm-up, which only the server process needs.
+if multiprocessing.parent_process() is None:
+    preloaded = warm_up([name.strip() for name in os.environ.get("NLSOLVER_PRELOAD", ",".join(SOLVERS)).split(",")
+                         if name.strip()])
+    for name, result in preloaded.items():
+        if isinstance(result, str):
+            print(f"Preloading the {name} solver failed: {result}", file=sys.stderr)
+
+def parse_equations(equations_raw):
+    equations_raw = equations_raw.strip()
+
+    # Step 1: Split into blocks if multiple equation blocks are separated by '---'
+    eq_blocks = [block.strip() for block in equations_raw.split('---')]
+
+    equations = []
+
+    # Step 2: For each block, process each line
+    for block in eq_blocks:
+        lines = block.split('\n')
+        for line in lines:
+            # Remove comments and strip whitespace
+            clean = line.split('#', 1)[0].strip()
+            if clean:
+                equations.append(clean)
+    return equations
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -19,63 +81,136 @@ def extract_variables():
     constants_raw = data.get('constants', '')
 
     try:
-        equations_raw = equations_raw.strip()
-
-        # Step 1: Split into blocks if multiple equation blocks are separated by '---'
-        eq_blocks = [block.strip() for block in equations_raw.split('---')]
-
-        equations = []
-
-        # Step 2: For each block, process each line
-        for block in eq_blocks:
-            lines = block.split('\n')
-            for line in lines:
-                # Remove comments and strip whitespace
-                clean = line.split('#', 1)[0].strip()
-                if clean:
-                    equations.append(clean)
-
+        equations = parse_equations(equations_raw)
 
         # Now pass cleaned equations to your solver
-        results = extract_var(solver, equations, constants_raw)
+        system = get_system(solver, equations, constants_raw)
 
         output_str = ""
-        for k in results:
+        for k in system.variables:
             output_str += f"{k} = \n"
 
-        return jsonify({"success": True, "solution": output_str})
+        return jsonify({"success": True, "solution": output_str, "system_id": system.system_id})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/solve', methods=['POST'])
-def solve(): 
-    data = request.json
+def submit_solve(data):
     solver = data.get('solver')
     equations_raw = data.get('equations')
     constants_raw = data.get('constants', '')
     initial_guesses = data.get('initial_guesses', '')
+    decompose = bool(data.get('decompose', False))
+    timeout = data.get('timeout')
+    profile = bool(data.get('profile', False))
+    trace_memory = bool(data.get('trace_memory', False))
+    warm_start = bool(data.get('warm_start', True))
+    seed = data.get('seed')
+    seed = int(seed) if seed is not None and seed != '' else None
+
+    if equations_raw:
+        system = get_system(solver, parse_equations(equations_raw), constants_raw)
+    else:
+        # Re-solve a previously compiled system by its ID alone
+        system = find_system(data.get('system_id'))
+        if system is None:
+            raise ValueError("Unknown or expired system_id; send the equations again.")
+
+    if system.solver_name == "gekko":
+        # Build the GEKKO model once here; every job's worker process inherits it instead of rebuilding
+        system.gekko_model()
+
+    def start():
+        return job_queue.submit(solve_job, system.solver_name, system.equations, initial_guesses or None,
+                                system.constants_str, decompose, progress=True,
+                                timeout=float(timeout) if timeout else None,
+                                profile=profile, trace_memory=trace_memory, warm_start=warm_start, seed=seed)
+
+    if profile or trace_memory:
+        # Profiles and memory traces describe one run, so these solves always run
+        return start(), system, None
+    key = result_cache.result_key(system.system_id, initial_guesses or None, decompose=decompose,
+                                  warm_start=warm_start, seed=seed)
+    result, job = solve_results.solve(key, start)
+    if result is not None:
+        # Nothing to wait for, so the request does not hold a place in the cache's flight
+        return job_queue.completed({**result, "cached": True}), system, None
+    return job, system, key
 
+@app.route('/solve', methods=['POST'])
+def solve(): 
     try:
-        equations_raw = equations_raw.strip()
-        # Step 1: Split into blocks if multiple equation blocks are separated by '---'
-        eq_blocks = [block.strip() for block in equations_raw.split('---')]
-
-        equations = []
+        job, system, _ = submit_solve(request.json)
+        return jsonify({"success": True, "job_id": job.id, "system_id": system.system_id}), 202
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
 
-        # Step 2: For each block, process each line
-        for block in eq_blocks:
-            lines = block.split('\n')
-            for line in lines:
-                # Remove comments and strip whitespace
-                clean = line.split('#', 1)[0].strip()
-                if clean:
-                    equations.append(clean)
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        results = solve_equations(solver, equations, initial_guesses, constants_raw)
+@app.route('/solve/stream', methods=['POST'])
+def solve_stream():
+    '''Queues a solve and streams its iterations as server-sent events.
 
-        return jsonify({"success": True, "solution": results['log']})
+    Events: "job" (job_id, system_id), one "iteration" per solver iteration,
+    then "result" or "error". Closing the connection cancels the solve.
+    '''
+    try:
+        job, system, key = submit_solve(request.json)
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)})
+        return Response(sse("error", {"status": "failed", "error": str(e)}), mimetype='text/event-stream')
+
+    def generate():
+        sent = 0
+        try:
+            yield sse("job", {"job_id": job.id, "system_id": system.system_id})
+            while True:
+                events, finished = job_queue.wait_events(job, sent, timeout=15)
+                for event in events:
+                    yield sse("iteration", event)
+                sent += len(events)
+                if finished:
+                    break
+                if not events:
+                    yield ": keep-alive\n\n"
+            if job.status == jobs.DONE:
+                yield sse("result", job.result)
+            else:
+                yield sse("error", {"status": job.status, "error": job.error or f"Solve {job.status}."})
+        finally:
+            # Runs when the client disconnects too; a solve shared with other requests goes on
+            if key is None or solve_results.leave(key, job):
+                job_queue.cancel(job.id, wait=0)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown job."}), 404
+    return jsonify({"success": True, **job.to_dict()})
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if job_queue.get(job_id) is None:
+        return jsonify({"success": False, "error": "Unknown job."}), 404
+    if not solve_results.cancellable(job_id):
+        return jsonify({"success": False, "error": "Other requests are waiting for this solve; "
+                                                   "close the stream to leave it."}), 409
+    cancelled = job_queue.cancel(job_id)
+    return jsonify({"success": cancelled, **job_queue.get(job_id).to_dict()})
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    '''Result cache (hit rate, bytes used, coalesced solves), job queue and compiled-system cache counters.'''
+    return jsonify({
+        "success": True,
+        "results": solve_results.stats(),
+        "jobs": job_queue.stats(),
+        "compiled_systems": system_cache.default_cache.stats(),
+    })
 
 
 def open_browser():
@@ -0,0 +1,179 @@
+import csv
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import jobs
+from core_runner import SOLVERS, get_system, load_solver
+from frontend import load_equations, load_guesses
+
+# Columns of the CSV output; nested values (solution, residuals, timings) are JSON-encoded
+FIELDS = ("case", "solver", "success", "error", "residual_norm", "wall_time", "warm_start",
+          "solution", "residuals", "timings")
+
+
+def _resolve(base_dir, path):
+    return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+
+def load_manifest(path, default_solver=None):
+    '''Reads a batch manifest.
+
+    A manifest is a .json file holding a list of cases (or {"cases": [...]}),
+    or a .jsonl file with one case per line. Each case is a dictionary:
+    - equations: equations file, or list of files (required).
+    - solver: 'numpy', 'scipyroot', 'scipyls' or 'gekko' (default: default_solver).
+    - name: label for the output record (default: the case's position).
+    - constants: optional constants file.
+    - guesses: optional initial guesses, a file (name = value per line) or a dictionary.
+    - decompose: solve block by block.
+    - options: keyword arguments for the solver, e.g. {"backend": "cse", "sparse": true}.
+    Relative paths are relative to the manifest's directory.
+
+    Returns:
+    - List of cases with the paths resolved and the defaults filled in.
+    '''
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r') as f:
+        if path.lower().endswith('.jsonl'):
+            entries = [json.loads(line) for line in f if line.strip()]
+        else:
+            entries = json.load(f)
+    if isinstance(entries, dict):
+        entries = entries.get("cases", [])
+
+    cases = []
+    for index, entry in enumerate(entries):
+        if not entry.get("equations"):
+            raise ValueError(f"Manifest case {index} has no equations.")
+        solver = entry.get("solver") or default_solver
+        if solver is None:
+            raise ValueError(f"Manifest case {index} has no solver; add one or pass a default solver.")
+        if solver not in SOLVERS:
+            raise ValueError(f"Manifest case {index}: unknown solver '{solver}'. Choose one of {list(SOLVERS)}.")
+        equations = entry["equations"]
+        if isinstance(equations, str):
+            equations = [equations]
+        guesses = entry.get("guesses")
+        if isinstance(guesses, str):
+            guesses = _resolve(base_dir, guesses)
+        cases.append({
+            "name": str(entry.get("name", index)),
+            "solver": solver,
+            "equations": [_resolve(base_dir, p) for p in equations],
+            "constants": _resolve(base_dir, entry["constants"]) if entry.get("constants") else None,
+            "guesses": guesses,
+            "decompose": bool(entry.get("decompose", False)),
+            "options": dict(entry.get("options") or {}),
+        })
+    return cases
+
+
+def run_case(case, tol=1e-6, warm_start=False):
+    '''Solves one manifest case; runs inside a worker process.
+
+    Returns:
+    - The case's output record (see FIELDS); "success" means the residual
+      norm reached tol. Errors are recorded, not raised.
+    '''
+    record = {"case": case["name"], "solver": case["solver"], "success": False, "error": None,
+              "residual_norm": None, "wall_time": None, "warm_start": False,
+              "solution": None, "residuals": None, "timings": None}
+    start = time.perf_counter()
+    try:
+        equations = load_equations(case["equations"])
+        constants_text = None
+        if case["constants"]:
+            with open(case["constants"], 'r') as f:
+                constants_text = f.read()
+        guesses = case["guesses"]
+        if isinstance(guesses, str):
+            guesses = load_guesses(guesses)
+        # Registered per process, so a worker compiles a system shared by several cases only once
+        system = get_system(case["solver"], equations, constants_text, **case["options"])
+        answers = system.solve(guesses or None, decompose=case["decompose"], warm_start=warm_start)
+        solution = {str(k): float(v) for k, v in answers["solution_dict"].items()}
+        residuals = system.residuals_at(solution)
+        norm = float(np.linalg.norm(residuals))
+        record.update(success=bool(norm <= tol), residual_norm=norm,
+                      warm_start=answers.get("warm_start", False), solution=solution,
+                      residuals=residuals.tolist(), timings=answers.get("timings", {}))
+    except Exception as e:
+        record["error"] = str(e)
+    record["wall_time"] = round(time.perf_counter() - start, 6)
+    return record
+
+
+def write_records(path, records):
+    '''Writes records to a .jsonl or .csv file atomically.
+
+    The file is written under a temporary name in the same directory and
+    then renamed, so readers (and concurrent batches writing the same path)
+    only ever see a complete file.
+    '''
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in ('.jsonl', '.csv'):
+        raise ValueError(f"Unsupported output format '{extension}'; use .jsonl or .csv.")
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', newline='') as f:
+            if extension == '.jsonl':
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+            else:
+                writer = csv.DictWriter(f, fieldnames=FIELDS)
+                writer.writeheader()
+                for record in records:
+                    writer.writerow({key: json.dumps(value) if isinstance(value, (dict, list)) else value
+                                     for key, value in record.items()})
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def run(manifest, output, workers=None, default_solver=None, tol=1e-6, warm_start=False):
+    '''Solves every case of a manifest and writes one record per case to output.
+
+    Parameters:
+    - manifest: path of the manifest (see load_manifest).
+    - output: .jsonl or .csv file for the records (see write_records).
+    - workers: number of worker processes (default: os.cpu_count()); 1 solves
+      in the current process.
+    - default_solver: solver for cases that do not name one.
+    - tol: residual norm a case must reach to count as a success.
+    - warm_start: start each case from the guess store (see guess_store.py).
+
+    Returns:
+    - Dictionary with "cases", "succeeded", "failed" and "wall_time".
+    '''
+    start = time.perf_counter()
+    cases = load_manifest(manifest, default_solver)
+    workers = min(workers or os.cpu_count() or 1, max(len(cases), 1))
+    records = [None] * len(cases)
+    if workers == 1:
+        for index, case in enumerate(cases):
+            records[index] = run_case(case, tol, warm_start)
+    else:
+        # Import the solver modules before the pool starts, so forked workers inherit them
+        for solver in {case["solver"] for case in cases}:
+            load_solver(solver)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=jobs.process_context()) as executor:
+            futures = {executor.submit(run_case, case, tol, warm_start): index
+                       for index, case in enumerate(cases)}
+            for future in as_completed(futures):
+                records[futures[future]] = future.result()
+    write_records(output, records)
+    succeeded = sum(record["success"] for record in records)
+    return {
+        "cases": len(records),
+        "succeeded": succeeded,
+        "failed": len(records) - succeeded,
+        "wall_time": round(time.perf_counter() - start, 4),
+    }
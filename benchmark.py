@@ -0,0 +1,447 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import core_runner
+import system_cache
+from frontend import load_equations, load_guesses
+
+
+def benchmark_cse(equation_files, constants=None, repeat=2000, seed=0):
+    '''Compares the lambdify, cse and ad backends on one residual + Jacobian evaluation.
+
+    Returns:
+    - Dictionary with compile time and per-iteration evaluation time (microseconds)
+      for each backend, plus the per-iteration speedup of cse and ad over lambdify.
+    '''
+    import newton_raphson
+    s = newton_raphson.Solution()
+    s.constantspath = constants
+    equations = s.process_equations(load_equations(equation_files))
+    s.get_variables(equations)
+    x = np.random.default_rng(seed).uniform(0.5, 2, size=len(s.variables))
+
+    report = {"equations": len(equations), "variables": len(s.variables)}
+    results = {}
+    for backend in system_cache.BACKENDS:
+        start = time.perf_counter()
+        compiled = system_cache.compile_system(equations, s.variables, s.coefficients, backend=backend)
+        compile_time = time.perf_counter() - start
+
+        F = np.empty(compiled.n_equations)
+        J = np.empty(compiled.nnz)
+        compiled.evaluate(x, F, J)  # warm-up
+        start = time.perf_counter()
+        for _ in range(repeat):
+            compiled.evaluate(x, F, J)
+        per_iteration = (time.perf_counter() - start) / repeat
+        # Compared densely: the ad backend also keeps entries that are zero symbolically
+        dense = np.zeros((compiled.n_equations, len(s.variables)))
+        dense[compiled.jac_rows, compiled.jac_cols] = J
+        results[backend] = (F.copy(), dense)
+        report[backend] = {
+            "compile_seconds": round(compile_time, 4),
+            "evaluation_microseconds": round(per_iteration * 1e6, 2),
+        }
+
+    F_a, J_a = results['lambdify']
+    report["max_abs_difference"] = float(max(max(np.max(np.abs(F_a - F_b)), np.max(np.abs(J_a - J_b)))
+                                             for F_b, J_b in results.values()))
+    report["speedup"] = round(report['lambdify']["evaluation_microseconds"]
+                              / report['cse']["evaluation_microseconds"], 2)
+    report["ad_speedup"] = round(report['lambdify']["evaluation_microseconds"]
+                                 / report['ad']["evaluation_microseconds"], 2)
+    return report
+
+
+def benchmark_batch(equation_files, constants=None, guesses=None, rows=10000, spread=0.05, seed=0):
+    '''Times batch Newton (newton_raphson batch_solution) in double and mixed precision.
+
+    Every row starts from the guesses file's values (or 1.0) scaled by a
+    uniform factor in [1 - spread, 1 + spread] per variable. Peak memory
+    counts the Python and NumPy allocations (tracemalloc) of one extra,
+    untimed solve, so it shows the size of the per-row buffers.
+
+    Returns:
+    - Dictionary with, per precision, "seconds", "peak_memory_kb",
+      "converged" (fraction of rows) and "max_residual_norm" (over converged
+      rows), plus "matching_roots": the fraction of rows converged in both
+      whose solutions agree to a relative 2-norm difference of 1e-6.
+    '''
+    import newton_raphson
+    s = newton_raphson.Solution()
+    s.constantspath = constants
+    equations = load_equations(equation_files)
+    s.get_variables(s.process_equations(equations))
+    center = load_guesses(guesses) if guesses else {}
+    x0 = np.array([center.get(var, 1.0) for var in s.variables])
+    starts = x0 * np.random.default_rng(seed).uniform(1 - spread, 1 + spread, size=(rows, len(x0)))
+    s.batch_solution(equations, starts[:1])  # compiles outside the timed solves
+
+    report = {"equations": len(equations), "variables": len(s.variables), "rows": rows}
+    results = {}
+    for precision in newton_raphson.PRECISIONS:
+        start = time.perf_counter()
+        result = s.batch_solution(equations, starts, variables=list(s.variables), precision=precision)
+        seconds = time.perf_counter() - start
+        # Traced on a second solve, since tracing slows the timed one down
+        tracemalloc.start()
+        s.batch_solution(equations, starts, variables=list(s.variables), precision=precision)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[precision] = result
+        converged = result["converged"]
+        report[precision] = {
+            "seconds": round(seconds, 4),
+            "peak_memory_kb": round(peak / 1024, 1),
+            "converged": round(float(converged.mean()), 4),
+            "max_residual_norm": float(result["residual_norms"][converged].max()) if converged.any() else None,
+        }
+    both = results['double']["converged"] & results['mixed']["converged"]
+    reference = results['double']["solutions"][both]
+    difference = (np.linalg.norm(results['mixed']["solutions"][both] - reference, axis=1)
+                  / np.linalg.norm(reference, axis=1))
+    # A few starts can land on different roots of the two precisions
+    report["matching_roots"] = round(float(np.mean(difference <= 1e-6)), 4) if both.any() else None
+    return report
+
+
+SOLVERS = tuple(core_runner.SOLVERS)
+
+# Bundled systems: name -> (equation files, constants file, initial guesses file).
+# The MBE and TEE files share variables and are only square together, so they
+# form one case; their seeded starts perturb initial_guesses.txt, since random
+# starts in the default box almost never converge on them.
+BUNDLED_CASES = {
+    "MBE+TEE": (["system_of_equations_MBE.txt", "system_of_equations_TEE.txt"], "constants.txt",
+                "initial_guesses.txt"),
+    "_Equations": (["_Equations.txt"], "_Coefficients.txt", None),
+}
+
+# Metrics compared against a baseline, and whether a larger value is worse
+METRICS = {
+    "parse_seconds": True,
+    "compile_seconds": True,
+    "solve_seconds": True,
+    "iterations": True,
+    "function_evaluations": True,
+    "peak_memory_kb": True,
+    "success_rate": False,
+}
+
+
+def broyden_tridiagonal(n):
+    '''Broyden's tridiagonal problem with n variables, a scalable sparse test system.'''
+    equations = []
+    for i in range(1, n + 1):
+        eq = f"(3 - 2*x{i})*x{i}"
+        if i > 1:
+            eq += f" - x{i - 1}"
+        if i < n:
+            eq += f" - 2*x{i + 1}"
+        equations.append(eq + " + 1 = 0")
+    return equations
+
+
+def suite_cases(sizes=(50, 200), base_dir='.'):
+    '''Benchmark cases: name -> keyword arguments for benchmark_case.'''
+    cases = {}
+    for name, (files, constants, guesses) in BUNDLED_CASES.items():
+        with open(os.path.join(base_dir, constants), 'r') as f:
+            constants_text = f.read()
+        case = {"equations": load_equations([os.path.join(base_dir, file) for file in files]),
+                "constants_text": constants_text}
+        if guesses:
+            case["center"] = load_guesses(os.path.join(base_dir, guesses))
+        cases[name] = case
+    for n in sizes:
+        cases[f"broyden-{n}"] = {"equations": broyden_tridiagonal(n), "bounds": (-1.5, -0.5)}
+    return cases
+
+
+def _median(values):
+    return float(np.median(values)) if values else None
+
+
+def seeded_starts(variables, seeds, bounds=(0.0, 2.0), center=None, spread=0.1):
+    '''One start point per seed: uniform in `bounds`, or `center` scaled by
+    a uniform factor in [1 - spread, 1 + spread] per variable.'''
+    from multistart import sample_starts
+    # Sorted, so a seed gives every variable the same value whatever the parse order
+    variables = sorted(variables)
+    if center is None:
+        return [sample_starts(1, variables, 'uniform', bounds[0], bounds[1], seed)[0] for seed in range(seeds)]
+    starts = []
+    for seed in range(seeds):
+        factors = sample_starts(1, variables, 'uniform', 1 - spread, 1 + spread, seed)[0]
+        starts.append({var: center[var] * factors[var] for var in variables})
+    return starts
+
+
+def benchmark_case(solver_name, equations, constants_text=None, bounds=(0.0, 2.0), center=None,
+                   seeds=5, tol=1e-6):
+    '''Runs one solver on one system from `seeds` seeded start points (see seeded_starts).
+
+    Parse and compile are timed once, from cold caches (see system_cache.clear_caches); the
+    solve metrics are medians over the seeds. Peak memory (Python allocations,
+    via tracemalloc) is measured on one extra solve so it does not slow down
+    the timed ones.
+
+    Returns:
+    - Dictionary of metrics; "success_rate" is the fraction of seeds whose
+      solution has a residual norm below tol.
+    '''
+    from core_runner import CompiledSystem, load_solver
+
+    load_solver(solver_name)  # module import time is not parse time
+    if solver_name != "gekko":
+        # Nor are the modules SymPy imports lazily, which would land on whichever solver compiles first
+        CompiledSystem(solver_name, ["x - 1"]).compiled
+    system_cache.clear_caches()
+    start = time.perf_counter()
+    system = CompiledSystem(solver_name, equations, constants_text)
+    parse_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    system.compiled
+    compile_seconds = time.perf_counter() - start
+
+    guesses = seeded_starts(system.variables, seeds, bounds, center)
+    times, iterations, evaluations, errors = [], [], [], []
+    successes = 0
+    for guess in guesses:
+        events = []
+        start = time.perf_counter()
+        try:
+            answers = system.solve(guess, callback=events.append)
+        except Exception as e:
+            answers = None
+            errors.append(str(e))
+        # Failed solves count towards the timings too
+        times.append(time.perf_counter() - start)
+        # Events are iterations (residual evaluations for MINPACK's hybr and lm)
+        if events:
+            iterations.append(max(event["iteration"] for event in events))
+        if answers is None:
+            continue
+        x = [float(answers["solution_dict"][var]) for var in system.variables]
+        norm = np.linalg.norm(system.residual(x))
+        successes += bool(np.isfinite(norm) and norm <= tol)
+        if "function_evaluations" in answers:
+            evaluations.append(answers["function_evaluations"])
+
+    tracemalloc.start()
+    try:
+        system.solve(guesses[0])
+    except Exception:
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "equations": len(system.equations),
+        "variables": len(system.variables),
+        "parse_seconds": round(parse_seconds, 4),
+        # GEKKO builds its own model inside the solve
+        "compile_seconds": None if solver_name == "gekko" else round(compile_seconds, 4),
+        "solve_seconds": round(_median(times), 4),
+        "iterations": _median(iterations),
+        "function_evaluations": _median(evaluations),
+        "peak_memory_kb": round(peak / 1024, 1),
+        "success_rate": round(successes / seeds, 3),
+        "errors": sorted(set(errors)),
+    }
+
+
+# Import-time budget (seconds in a fresh interpreter) of the modules a short run or
+# the web server loads; the suite reports modules over budget. The web server's
+# backend warm-up (NLSOLVER_PRELOAD) is boot work, not import cost, and is skipped.
+IMPORT_BUDGET = {
+    "core_runner": 0.3,
+    "newton_raphson": 0.5,
+    "scipy_root_solver": 0.5,
+    "scipy_ls_solver": 0.5,
+    "gekko_solver": 0.6,
+    "app": 1.0,
+}
+
+
+def measure_imports(modules=tuple(IMPORT_BUDGET), repeat=3, base_dir='.'):
+    '''Times importing each module in a fresh interpreter.
+
+    Returns:
+    - Dictionary of module -> {"seconds" (median of repeat runs), "budget",
+      "within_budget"}, or {"error"} if the import fails.
+    '''
+    import subprocess
+    code = "import sys, time; t = time.perf_counter(); import {}; print(time.perf_counter() - t)"
+    report = {}
+    for module in modules:
+        times = []
+        for _ in range(repeat):
+            run = subprocess.run([sys.executable, "-c", code.format(module)], cwd=base_dir,
+                                 capture_output=True, text=True, env={**os.environ, "NLSOLVER_PRELOAD": ""})
+            if run.returncode != 0:
+                report[module] = {"error": run.stderr.strip().splitlines()[-1] if run.stderr.strip() else "failed"}
+                break
+            times.append(float(run.stdout.split()[-1]))
+        else:
+            seconds = round(_median(times), 4)
+            budget = IMPORT_BUDGET.get(module)
+            report[module] = {"seconds": seconds, "budget": budget,
+                              "within_budget": budget is None or seconds <= budget}
+    return report
+
+
+def benchmark_suite(solvers=SOLVERS, cases=None, sizes=(50, 200), seeds=5, tol=1e-6):
+    '''Runs every solver on every case.
+
+    Returns:
+    - Report dictionary: "environment" (versions, seeds), "imports" (see
+      measure_imports) and "results" keyed "<case>/<solver>" (see benchmark_case).
+    '''
+    import scipy
+    import sympy
+    all_cases = suite_cases(sizes)
+    selected = cases or list(all_cases)
+    unknown = set(selected) - set(all_cases)
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases {sorted(unknown)}. Choose from {list(all_cases)}.")
+
+    results = {}
+    for name in selected:
+        for solver_name in solvers:
+            results[f"{name}/{solver_name}"] = benchmark_case(solver_name, seeds=seeds, tol=tol, **all_cases[name])
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "sympy": sympy.__version__,
+            "platform": platform.platform(),
+            "seeds": seeds,
+            "tol": tol,
+        },
+        "imports": measure_imports(base_dir=os.path.dirname(os.path.abspath(__file__))),
+        "results": results,
+    }
+
+
+def compare_reports(baseline, report, threshold=0.25):
+    '''Lists regressions of `report` against `baseline`.
+
+    A metric regresses when it is worse by more than `threshold` (relative), or
+    for "success_rate" when it drops at all. Module import times are compared
+    the same way. Entries missing from either report are skipped.
+
+    Returns:
+    - List of dictionaries with "case", "metric", "baseline" and "current".
+    '''
+    regressions = []
+    for case, current in report["results"].items():
+        previous = baseline.get("results", {}).get(case)
+        if previous is None:
+            continue
+        for metric, larger_is_worse in METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            if larger_is_worse:
+                worse = new > old * (1 + threshold) and new - old > 1e-3
+            else:
+                worse = new < old
+            if worse:
+                regressions.append({"case": case, "metric": metric, "baseline": old, "current": new})
+    for module, current in report.get("imports", {}).items():
+        old = baseline.get("imports", {}).get(module, {}).get("seconds")
+        new = current.get("seconds")
+        if old is not None and new is not None and new > old * (1 + threshold) and new - old > 1e-2:
+            regressions.append({"case": f"import {module}", "metric": "seconds", "baseline": old, "current": new})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the nonlinear equation solvers.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    cse_parser = subparsers.add_parser(
+        "cse", help="Compile and per-iteration residual + Jacobian evaluation time of the lambdify, cse and ad backends")
+    cse_parser.add_argument("--equations", nargs='+', default=["system_of_equations_MBE.txt"],
+                            help="Equation file(s) (default: system_of_equations_MBE.txt)")
+    cse_parser.add_argument("--constants", default="constants.txt",
+                            help="Constants file (default: constants.txt)")
+    cse_parser.add_argument("--repeat", type=int, default=2000,
+                            help="Number of timed evaluations (default: 2000)")
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="Time and peak memory of batch Newton in double and mixed (float32) precision")
+    batch_parser.add_argument("--equations", nargs='+',
+                              default=["system_of_equations_MBE.txt", "system_of_equations_TEE.txt"],
+                              help="Equation file(s) (default: the MBE and TEE systems)")
+    batch_parser.add_argument("--constants", default="constants.txt",
+                              help="Constants file (default: constants.txt)")
+    batch_parser.add_argument("--guesses", default="initial_guesses.txt",
+                              help="Initial guesses the starts are perturbed from (default: initial_guesses.txt)")
+    batch_parser.add_argument("--rows", type=int, default=10000,
+                              help="Number of start points solved at once (default: 10000)")
+
+    suite_parser = subparsers.add_parser(
+        "suite", help="Parse/compile/solve metrics for every solver on the bundled and synthetic systems")
+    suite_parser.add_argument("--solvers", nargs='+', choices=SOLVERS, default=list(SOLVERS),
+                              help="Solvers to run (default: all)")
+    suite_parser.add_argument("--cases", nargs='+',
+                              help="Cases to run, e.g. MBE+TEE _Equations broyden-50 (default: all)")
+    suite_parser.add_argument("--sizes", nargs='+', type=int, default=[50, 200],
+                              help="Sizes of the synthetic Broyden tridiagonal systems (default: 50 200)")
+    suite_parser.add_argument("--seeds", type=int, default=5,
+                              help="Seeded start points per case and solver (default: 5)")
+    suite_parser.add_argument("--tol", type=float, default=1e-6,
+                              help="Residual norm a solve must reach to count as a success (default: 1e-6)")
+    suite_parser.add_argument("--output", help="Write the JSON report to this file")
+    suite_parser.add_argument("--baseline", help="Compare against a stored report and exit 1 on regressions")
+    suite_parser.add_argument("--threshold", type=float, default=0.25,
+                              help="Relative slowdown counted as a regression (default: 0.25)")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two suite reports")
+    compare_parser.add_argument("baseline", help="Baseline report")
+    compare_parser.add_argument("report", help="New report")
+    compare_parser.add_argument("--threshold", type=float, default=0.25,
+                                help="Relative slowdown counted as a regression (default: 0.25)")
+
+    args = parser.parse_args()
+    if args.command == "cse":
+        report = benchmark_cse(args.equations, args.constants, repeat=args.repeat)
+    elif args.command == "batch":
+        report = benchmark_batch(args.equations, args.constants, args.guesses, rows=args.rows)
+    elif args.command == "suite":
+        report = benchmark_suite(args.solvers, args.cases, args.sizes, args.seeds, args.tol)
+        for module, entry in report["imports"].items():
+            if not entry.get("within_budget", True):
+                print(f"OVER BUDGET import {module}: {entry['seconds']} s > {entry['budget']} s", file=sys.stderr)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        with open(args.report, 'r') as f:
+            report = json.load(f)
+    if args.command in ("suite", "compare") and (args.command == "compare" or args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['case']} {r['metric']}: {r['baseline']} -> {r['current']}", file=sys.stderr)
+        if args.command == "compare":
+            print(json.dumps(regressions, indent=2))
+        else:
+            print(json.dumps(report, indent=2, sort_keys=True))
+        sys.exit(1 if regressions else 0)
+    print(json.dumps(report, indent=2, sort_keys=args.command == "suite"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+import math
+import random
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import root_scalar
+from scipy.sparse.csgraph import maximum_bipartite_matching
+
+import frontend
+import profiling
+import progress
+import system_cache
+
+
+class DecompositionError(ValueError):
+    '''Raised when a system has no block-triangular form (non-square or structurally singular).'''
+
+
+class Block:
+    '''One diagonal block of the block-triangular form.
+
+    - equations: indices into the equation list.
+    - variables: names of the variables solved by this block.
+    - inputs: names of variables from earlier blocks the equations depend on.
+    '''
+    def __init__(self, equations, variables, inputs):
+        self.equations = equations
+        self.variables = variables
+        self.inputs = inputs
+
+    def __len__(self):
+        return len(self.variables)
+
+
+def incidence(equations, coefficients):
+    '''Builds the equation-variable incidence structure.
+
+    Parameters:
+    - equations: list of residual expressions.
+    - coefficients: dictionary of constants (excluded from the variables).
+
+    Returns:
+    - variables: variable names in order of first appearance.
+    - rows: for each equation, the list of variable indices it contains.
+    '''
+    system = frontend.parse_system(equations)
+    variables = system.variables(coefficients)
+    return variables, system.incidence(variables)
+
+
+def strongly_connected_components(n, successors):
+    '''Tarjan's algorithm, iterative so deep dependency chains do not hit the recursion limit.
+
+    Components are returned in reverse topological order: every component
+    appears after all components reachable from it.
+    '''
+    index = [None] * n
+    lowlink = [0] * n
+    on_stack = [False] * n
+    stack = []
+    components = []
+    counter = 0
+
+    for start in range(n):
+        if index[start] is not None:
+            continue
+        work = [(start, 0)]
+        while work:
+            node, child = work.pop()
+            if child == 0:
+                index[node] = lowlink[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack[node] = True
+            recurse = False
+            for k in range(child, len(successors[node])):
+                nxt = successors[node][k]
+                if index[nxt] is None:
+                    work.append((node, k + 1))
+                    work.append((nxt, 0))
+                    recurse = True
+                    break
+                if on_stack[nxt]:
+                    lowlink[node] = min(lowlink[node], index[nxt])
+            if recurse:
+                continue
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+    return components
+
+
+def block_triangularize(equations, coefficients):
+    '''Splits a square system into blocks that can be solved in sequence.
+
+    A maximum matching assigns each equation the variable it solves for; the
+    strongly connected components of the resulting dependency graph are the
+    irreducible blocks of the (fine) Dulmage-Mendelsohn decomposition.
+
+    Returns:
+    - List of Block in solve order.
+
+    Raises DecompositionError if the system is not square or is structurally singular.
+    '''
+    variables, rows = incidence(equations, coefficients)
+    n_eqs, n_vars = len(equations), len(variables)
+    if n_eqs != n_vars:
+        raise DecompositionError(f"Block decomposition needs a square system, got {n_eqs} equations "
+                                 f"and {n_vars} variables.")
+
+    indptr = np.cumsum([0] + [len(row) for row in rows])
+    indices = np.array([j for row in rows for j in row], dtype=np.int32)
+    graph = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n_eqs, n_vars))
+    matched_var = maximum_bipartite_matching(graph, perm_type='column')
+    if np.any(matched_var < 0):
+        raise DecompositionError("System is structurally singular; no equation can be assigned to every variable.")
+
+    # Edge i -> j when equation i uses the variable equation j is matched to
+    solved_by = np.empty(n_vars, dtype=np.intp)
+    solved_by[matched_var] = np.arange(n_eqs)
+    successors = [[int(solved_by[j]) for j in row if solved_by[j] != i] for i, row in enumerate(rows)]
+
+    blocks = []
+    known = set()
+    for component in strongly_connected_components(n_eqs, successors):
+        component.sort()
+        block_vars = [variables[matched_var[i]] for i in component]
+        inputs = []
+        for i in component:
+            for j in rows[i]:
+                name = variables[j]
+                if name in known and name not in inputs:
+                    inputs.append(name)
+        blocks.append(Block(component, block_vars, inputs))
+        known.update(block_vars)
+    return blocks
+
+
+def solve_scalar(equation, variable, inputs, coefficients, guess, tol=1e-10, max_iter=100):
+    '''Solves a single equation for a single variable with a scalar root finder.
+
+    Upstream values and constants are compiled as parameters, so the block is
+    only compiled once however often its inputs or the constants change.
+    '''
+    constants = frontend.parse_system([equation]).constants(coefficients)
+    values = {**{name: coefficients[name] for name in constants}, **inputs}
+    compiled = system_cache.get_bound([equation], [variable], values, list(values))
+
+    def f(x):
+        return float(compiled.f(x)[0])
+
+    def fprime(x):
+        return float(compiled.jac_entries(x)[0]) if len(compiled.jac_rows) else 0.0
+
+    sol = root_scalar(f, x0=guess, fprime=fprime, method='newton', xtol=tol, maxiter=max_iter)
+    if not sol.converged or not math.isfinite(sol.root):
+        # Newton can stall on a flat derivative; retry derivative-free
+        sol = root_scalar(f, x0=guess, x1=guess + 0.1 * (abs(guess) + 1), method='secant',
+                          xtol=tol, maxiter=max_iter)
+    if not sol.converged or not math.isfinite(sol.root):
+        raise ValueError(f"Scalar root finder failed for '{variable}': {sol.flag}")
+    return sol.root, sol.iterations
+
+
+def residuals(equations, values):
+    '''Evaluates residual expressions numerically with the plain math module.'''
+    names = {**frontend.MATH_NAMES, **values}
+    return [frontend.lower(expression, names) for expression in frontend.parse_system(equations).expressions]
+
+
+def solve_by_blocks(equations, coefficients, new_solution, initial_guess=None, callback=None, options=None):
+    '''Solves a system block by block, feeding solved values forward.
+
+    Parameters:
+    - equations: list of equations as strings ('expression = 0').
+    - coefficients: dictionary of parsed constants.
+    - new_solution: callable returning a fresh backend Solution; used for
+      blocks with more than one variable.
+    - initial_guess: optional dictionary of variable name -> starting value.
+    - callback: optional per-iteration callable (see progress.SolveLog); events
+      carry an extra "block" number. Scalar blocks report once, when solved.
+    - options: optional dictionary of keyword arguments for the solution() of
+      every block with more than one variable.
+
+    Returns:
+    - Dictionary with "solution_dict", "log", "blocks" (block sizes in solve
+      order) and "timings" (phase spans summed over the blocks).
+    '''
+    timings = profiling.Timings()
+    initial_guess = initial_guess or {}
+    residual_eqs = [frontend.residual_text(eq) for eq in equations]
+    with timings.span("decompose"):
+        blocks = block_triangularize(residual_eqs, coefficients)
+
+    solved = {}
+    reporter = progress.SolveLog(callback)
+    log = [f"\nBlock decomposition: {len(blocks)} blocks, "
+           f"largest has {max(len(b) for b in blocks)} variables"]
+    for k, block in enumerate(blocks, 1):
+        inputs = {name: solved[name] for name in block.inputs}
+        if len(block) == 1:
+            var = block.variables[0]
+            guess = initial_guess.get(var, random.uniform(0, 2))
+            with timings.span("scalar_blocks"):
+                value, iterations = solve_scalar(residual_eqs[block.equations[0]], var, inputs,
+                                                 coefficients, float(guess))
+            solved[var] = value
+            reporter.iteration(iterations, abs(residuals([residual_eqs[block.equations[0]]],
+                                                         {**coefficients, **inputs, var: value})[0]), block=k)
+            log.append(f"\nBlock {k}: {var} = {value:.6f} (scalar Newton, {iterations} iterations)")
+        else:
+            s = new_solution()
+            # Upstream results enter the block as constants
+            s.coefficients.update(inputs)
+            block_callback = None
+            if callback is not None:
+                block_callback = lambda event, k=k: callback({**event, "block": k})
+            answers = s.solution([equations[i] for i in block.equations], initial_guess=initial_guess,
+                                 callback=block_callback, **(options or {}))
+            solved.update({var: answers["solution_dict"][var] for var in block.variables})
+            timings.add(answers.get("timings", {}))
+            log.append(f"\nBlock {k}: {', '.join(block.variables)}")
+            log.append(answers["log"])
+
+    res = residuals(residual_eqs, {**coefficients, **solved})
+    log.append("\nResiduals:")
+    for i, val in enumerate(res):
+        log.append(f"Eq{i+1}: {val:.4e},")
+    log.append(f"\nFinal Residual Norm: {np.linalg.norm(res):.4e}")
+
+    return {
+        "solution_dict": solved,
+        "log": "\n".join(log),
+        "blocks": [len(b) for b in blocks],
+        "timings": timings.as_dict(),
+    }
@@ -2,21 +2,22 @@ import argparse
 import time
 import os
 
+from core_runner import SOLVERS, load_solver
+from frontend import load_equations
+
 # --- Argument parser setup ---
 parser = argparse.ArgumentParser(description="Run nonlinear equation solver.")
 
 parser.add_argument(
     "--solver",
-    choices=["gekko", "scipyroot", "scipyls", "numpy"],
-    required=True,
-    help="Choose the solver to use: 'gekko' or 'scipy'"
+    choices=list(SOLVERS),
+    help="Choose the solver to use: 'gekko' or 'scipy' (required; with --batch, the default for cases without one)"
 )
 
 parser.add_argument(
     "--equations",
-    required=True,
     nargs='+',  # Accepts one or more files
-    help="One or more paths to equations files (required)"
+    help="One or more paths to equations files (required unless --batch is given)"
 )
 
 parser.add_argument(
@@ -31,50 +32,269 @@ parser.add_argument(
     help="Directory to save _Answers.txt (default: current directory)"
 )
 
-args = parser.parse_args()
+parser.add_argument(
+    "--cache-dir",
+    required=False,
+    help="Optional directory for the on-disk compiled-system cache (reused across runs)"
+)
 
-# --- Select solver ---
-if args.solver == "gekko":
-    import gekko_solver as selected_solver
-if args.solver == "scipyroot":
-    import scipy_root_solver as selected_solver
-if args.solver == "scipyls":
-    import scipy_ls_solver as selected_solver
-if args.solver == "numpy":
-    import newton_raphson as selected_solver 
+parser.add_argument(
+    "--sparse",
+    action="store_true",
+    help="Use the sparse Jacobian engine (numpy and scipyls solvers)"
+)
 
+parser.add_argument(
+    "--linear-solver",
+    choices=["direct", "gmres", "lgmres", "bicgstab"],
+    default="direct",
+    help="Sparse linear solver for the numpy solver with --sparse (default: direct)"
+)
 
-s = selected_solver.Solution()
-if args.constants:
-    s.constantspath = args.constants
+parser.add_argument(
+    "--backend",
+    choices=["lambdify", "cse", "ad"],
+    default="lambdify",
+    help="Code generation backend: lambdify, cse to share common subexpressions between residuals and Jacobian, "
+         "or ad for a NumPy tape with forward-mode automatic differentiation (no SymPy; fast setup on large systems)"
+)
+
+parser.add_argument(
+    "--numerical-jacobian",
+    action="store_true",
+    help="Use finite-difference Jacobians instead of the exact symbolic one (scipyroot and scipyls solvers)"
+)
+
+parser.add_argument(
+    "--decompose",
+    action="store_true",
+    help="Solve the system as a sequence of strongly connected blocks (block-triangular decomposition)"
+)
+
+parser.add_argument(
+    "--globalization",
+    choices=["armijo", "dogleg"],
+    help="Globalize Newton's method (numpy solver): armijo line search or dogleg trust region (default: full steps)"
+)
+
+parser.add_argument(
+    "--jacobian-update",
+    choices=["newton", "chord", "shamanskii", "broyden"],
+    default="newton",
+    help="Jacobian strategy for the numpy solver: newton (every iteration), chord/shamanskii (reuse LU factors) "
+         "or broyden (rank-one updates) (default: newton)"
+)
+
+parser.add_argument(
+    "--multistart",
+    type=int,
+    metavar="K",
+    help="Solve from K sampled start points in parallel and keep the best converged one"
+)
+
+parser.add_argument(
+    "--workers",
+    type=int,
+    help="Worker processes for --multistart and --batch (default: number of CPUs)"
+)
+
+parser.add_argument(
+    "--sampling",
+    choices=["uniform", "lhs", "sobol"],
+    default="uniform",
+    help="Start point sampling for --multistart: uniform, lhs (Latin hypercube) or sobol (default: uniform)"
+)
+
+parser.add_argument(
+    "--all-roots",
+    action="store_true",
+    help="With --multistart, run every start instead of stopping at the first converged one, and report all distinct roots"
+)
+
+parser.add_argument(
+    "--sweep",
+    nargs=3,
+    metavar=("NAME", "START", "STOP"),
+    help="Trace the solution while constant NAME (from --constants) moves from START to STOP, "
+         "warm-starting each point from the previous one"
+)
+
+parser.add_argument(
+    "--continuation",
+    choices=["natural", "arclength"],
+    default="natural",
+    help="Continuation method for --sweep: natural (step the constant) or arclength "
+         "(pseudo-arclength, follows turning points) (default: natural)"
+)
+
+parser.add_argument(
+    "--sweep-step",
+    type=float,
+    help="Initial step for --sweep; adapted as the sweep runs (default: (STOP - START) / 20)"
+)
+
+parser.add_argument(
+    "--sweep-output",
+    help="File the --sweep points are streamed to, .csv or .parquet, or a .store directory of memory-mapped "
+         "column chunks (default: _Sweep.csv next to _Answers.txt)"
+)
+
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="Continue an interrupted --sweep from the last point in its .store output instead of starting over"
+)
+
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="Run the solve under cProfile and save the slowest functions (by cumulative time) with the answers"
+)
+
+parser.add_argument(
+    "--trace-memory",
+    action="store_true",
+    help="Trace Python allocations with tracemalloc and save the peak and the top allocation sites with the answers"
+)
+
+parser.add_argument(
+    "--guess-store",
+    help="SQLite file with the last converged solution of each system, used as the starting point "
+         "of later runs (default: nlsolver_guesses.sqlite in the temp directory)"
+)
+
+parser.add_argument(
+    "--no-warm-start",
+    action="store_true",
+    help="Start from random guesses instead of the last converged solution in the guess store"
+)
+
+parser.add_argument(
+    "--batch",
+    metavar="MANIFEST",
+    help="Solve every case of a .json/.jsonl manifest (equations, constants, guesses, solver, options) "
+         "on a worker pool and write one record per case to --batch-output"
+)
+
+parser.add_argument(
+    "--batch-output",
+    help="File the --batch records are written to, .jsonl or .csv (default: _Batch.jsonl next to _Answers.txt)"
+)
+
+args = parser.parse_args()
+
+if args.cache_dir:
+    import system_cache
+    system_cache.configure(disk_dir=args.cache_dir)
 
 # --- Output path ---
 output_dir = args.answers if args.answers else os.getcwd()
 os.makedirs(output_dir, exist_ok=True)
 output_path = os.path.join(output_dir, "_Answers.txt")
 
+# --- Batch mode ---
+if args.batch:
+    import batch
+    import guess_store
+    guess_store.configure(path=args.guess_store or guess_store.DEFAULT_PATH)
+    batch_output = args.batch_output or os.path.join(output_dir, "_Batch.jsonl")
+    try:
+        summary = batch.run(args.batch, batch_output, workers=args.workers, default_solver=args.solver,
+                            warm_start=not args.no_warm_start)
+    except (OSError, ValueError) as e:
+        parser.error(f"--batch: {e}")
+    print(f"{summary['succeeded']} of {summary['cases']} cases converged in {summary['wall_time']:.4f} seconds; "
+          f"records written to {batch_output}")
+    raise SystemExit(1 if summary["failed"] else 0)
+if not args.solver or not args.equations:
+    parser.error("--solver and --equations are required unless --batch is given")
+
+# --- Select solver ---
+# Only the chosen backend (and the SymPy/SciPy/GEKKO modules it needs) is imported
+selected_solver = load_solver(args.solver)
+
+
+s = selected_solver.Solution()
+if args.constants:
+    s.constantspath = args.constants
+
 # --- Load equations ---
-equations = []
-for eq_file in args.equations:
-    if not os.path.isfile(eq_file):
-        raise FileNotFoundError(f"Equations file not found: {eq_file}")
-    with open(eq_file, 'r') as f:
-        for line in f:
-            line = line.split('#', 1)[0].strip()  # Remove comments and trailing spaces
-            if line:
-                equations.append(line)
+equations = load_equations(args.equations)
 
 # --- Solve ---
 start_time = time.time()
-answers = s.solution(equations)
+solver_options = {}
+if args.backend != "lambdify":
+    solver_options["backend"] = args.backend
+if args.sparse:
+    if args.solver not in ("numpy", "scipyls"):
+        parser.error("--sparse is only supported by the numpy and scipyls solvers")
+    solver_options["sparse"] = True
+    if args.solver == "numpy":
+        solver_options["linear_solver"] = args.linear_solver
+if args.numerical_jacobian:
+    if args.solver not in ("scipyroot", "scipyls"):
+        parser.error("--numerical-jacobian is only supported by the scipyroot and scipyls solvers")
+    solver_options["numerical_jacobian"] = True
+if args.globalization or args.jacobian_update != "newton":
+    if args.solver != "numpy":
+        parser.error("--globalization and --jacobian-update are only supported by the numpy solver")
+    if args.globalization:
+        solver_options["globalization"] = args.globalization
+    if args.jacobian_update != "newton":
+        solver_options["jacobian_update"] = args.jacobian_update
+import profiling
+with profiling.capture(cprofile=args.profile, memory=args.trace_memory) as report:
+    if args.resume and not args.sweep:
+        parser.error("--resume needs --sweep")
+    if args.sweep:
+        if args.multistart or args.decompose:
+            parser.error("--sweep cannot be combined with --multistart or --decompose")
+        if not s.constantspath:
+            parser.error("--sweep needs --constants defining the swept constant")
+        import continuation
+        with open(s.constantspath, 'r') as f:
+            constants_text = f.read()
+        name, sweep_start, sweep_stop = args.sweep[0], float(args.sweep[1]), float(args.sweep[2])
+        sweep_output = args.sweep_output or os.path.join(output_dir, "_Sweep.csv")
+        answers = continuation.run(sweep_output, args.solver, equations, constants_text, name, sweep_start,
+                                   sweep_stop, step=args.sweep_step, method=args.continuation,
+                                   resume=args.resume, **solver_options)
+        answers["output"] = sweep_output
+    elif args.multistart:
+        if args.decompose:
+            parser.error("--multistart cannot be combined with --decompose")
+        from multistart import multistart
+        constants_text = None
+        if s.constantspath:
+            with open(s.constantspath, 'r') as f:
+                constants_text = f.read()
+        answers = multistart(args.solver, equations, constants_text, n_starts=args.multistart,
+                             workers=args.workers, sampling=args.sampling,
+                             stop_on_first=not args.all_roots, **solver_options)
+    else:
+        import guess_store
+        from core_runner import CompiledSystem
+        guess_store.configure(path=args.guess_store or guess_store.DEFAULT_PATH)
+        constants_text = None
+        if s.constantspath:
+            with open(s.constantspath, 'r') as f:
+                constants_text = f.read()
+        system = CompiledSystem(args.solver, equations, constants_text, **solver_options)
+        answers = system.solve(decompose=args.decompose, warm_start=not args.no_warm_start)
 end_time = time.time()
+answers.update(report)
 
 # --- Save results ---
-with open(output_path, 'a') as f:  # <-- Use append mode
-    f.write(f"\n--- Solving---\n")
-    f.write(f"Total time: {end_time - start_time:.4f} seconds\n")
-    for key, value in answers.items():
-        f.write(f"{key} = {value}\n")
+record = f"\n--- Solving---\nTotal time: {end_time - start_time:.4f} seconds\n"
+for key, value in answers.items():
+    record += f"{key} = {value}\n"
+# One O_APPEND write per run, so concurrent runs appending to the same file do not interleave
+fd = os.open(output_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+try:
+    os.write(fd, record.encode())
+finally:
+    os.close(fd)
 
         
         
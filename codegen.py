@@ -0,0 +1,78 @@
+import numpy as np
+
+# Names used inside generated code; variables, parameters and subexpressions are
+# renamed to _v<i>, _p<i> and _c<i>, so user identifiers can never clash with them.
+RESIDUAL_FUNCTION = "residuals"
+FUSED_FUNCTION = "fused"
+
+
+def _rename(exprs, sym_vars, sym_params):
+    import sympy as sp
+    mapping = {sym: sp.Symbol(f"_v{i}") for i, sym in enumerate(sym_vars)}
+    mapping.update({sym: sp.Symbol(f"_p{i}") for i, sym in enumerate(sym_params)})
+    return [sp.sympify(expr).xreplace(mapping) for expr in exprs]
+
+
+def _function_source(name, outputs, exprs, n_vars, n_params):
+    '''Emits a function that writes CSE-reduced expressions into preallocated arrays.
+
+    outputs is a list of (array argument, count) pairs; exprs holds the
+    expressions for all outputs back to back.
+    '''
+    import sympy as sp
+    from sympy.printing.numpy import NumPyPrinter
+    printer = NumPyPrinter()
+    replacements, reduced = sp.cse(exprs, symbols=sp.numbered_symbols("_c"), optimizations='basic')
+
+    out_args = ", ".join(arg for arg, _ in outputs)
+    lines = [f"def {name}(_x, {out_args}, _p=()):"]
+    if n_vars:
+        lines.append("    " + "".join(f"_v{i}, " for i in range(n_vars)) + "= _x")
+    if n_params:
+        lines.append("    " + "".join(f"_p{i}, " for i in range(n_params)) + "= _p")
+    for sym, expr in replacements:
+        lines.append(f"    {sym} = {printer.doprint(expr)}")
+    k = 0
+    for arg, count in outputs:
+        for i in range(count):
+            lines.append(f"    {arg}[{i}] = {printer.doprint(reduced[k])}")
+            k += 1
+    lines.append(f"    return {out_args}")
+    return "\n".join(lines) + "\n"
+
+
+def generate(sym_eqs, jac_values, sym_vars, sym_params=()):
+    '''Generates common-subexpression-eliminated evaluation code for a system.
+
+    Parameters:
+    - sym_eqs: SymPy residual expressions.
+    - jac_values: SymPy expressions of the structurally nonzero Jacobian entries.
+    - sym_vars: variable symbols, in argument order.
+    - sym_params: parameter symbols, in argument order.
+
+    Returns:
+    - Python source defining
+      residuals(_x, _F, _p=()) -> _F
+      fused(_x, _F, _J, _p=()) -> (_F, _J)
+      where _x holds the variable values, _F receives the residuals and _J the
+      Jacobian entries. Subexpressions shared between residuals and Jacobian
+      are computed once. Arrays of shape (n, N) work as well as flat vectors.
+    '''
+    sym_eqs = _rename(sym_eqs, sym_vars, sym_params)
+    jac_values = _rename(jac_values, sym_vars, sym_params)
+    n_vars, n_params = len(sym_vars), len(sym_params)
+    residual_source = _function_source(RESIDUAL_FUNCTION, [("_F", len(sym_eqs))],
+                                       sym_eqs, n_vars, n_params)
+    fused_source = _function_source(FUSED_FUNCTION, [("_F", len(sym_eqs)), ("_J", len(jac_values))],
+                                    sym_eqs + jac_values, n_vars, n_params)
+    return residual_source + "\n" + fused_source
+
+
+def load(source):
+    '''Executes generated source and returns the (residuals, fused) functions.
+
+    Needs only NumPy, so systems loaded from the on-disk cache skip the SymPy import.
+    '''
+    namespace = {"numpy": np}
+    exec(compile(source, "<cse system>", "exec"), namespace)
+    return namespace[RESIDUAL_FUNCTION], namespace[FUSED_FUNCTION]
@@ -0,0 +1,330 @@
+import csv
+import os
+
+import numpy as np
+
+import newton_engine
+import result_store
+import system_cache
+from core_runner import get_system
+
+METHODS = ('natural', 'arclength')
+
+# Step size adaptation: grow after an easy correction, shrink after a hard one
+EASY_ITERATIONS = 3
+HARD_ITERATIONS = 6
+GROW = 1.5
+SHRINK = 0.5
+# A corrected point is rejected (and the step halved) when it lands farther than
+# MAX_CORRECTION * step from the predictor or turns the tangent by more than
+# arccos(MIN_TANGENT_COS); both signal a jump to another branch.
+MAX_CORRECTION = 1.0
+MIN_TANGENT_COS = 0.8
+
+
+class ParametricSystem:
+    '''A system compiled with its constants left symbolic, solved as one constant varies.
+
+    Every constant the equations use is a compiled parameter, so the compiled
+    entry is shared with every other sweep and solve of the system; for each
+    value of the varied constant, the constants derived from it are
+    recomputed (see frontend.Constants.evaluate) and bound.
+
+    Parameters:
+    - equations: list of equations as strings.
+    - constants_text: contents of a constants file; must define `parameter`.
+    - parameter: name of the constant to vary.
+    '''
+    def __init__(self, equations, constants_text, parameter):
+        import newton_raphson
+        s = newton_raphson.Solution()
+        s.constants_text = constants_text
+        residual_equations = s.process_equations(equations)
+        s.get_variables(residual_equations)
+        if parameter not in s.coefficients:
+            raise ValueError(f"'{parameter}' is not defined in the constants file.")
+        self.parameter = parameter
+        self._solution = s
+
+        parameters = s.system.constants(s.coefficients)
+        self.compiled = system_cache.get_compiled(residual_equations, s.variables,
+                                                  {k: s.coefficients[k] for k in parameters},
+                                                  jacobian=True, parameters=parameters)
+        self.variables = list(self.compiled.variables)
+        self._bound = {}
+
+    def bound(self, value):
+        '''The compiled system with its constants bound for the continuation parameter equal to value.'''
+        if value not in self._bound:
+            values = self._solution.evaluate_constants({self.parameter: value})
+            if len(self._bound) > 64:
+                self._bound.clear()
+            self._bound[value] = self.compiled.bind([float(values[k]) for k in self.compiled.parameters])
+        return self._bound[value]
+
+    def residual(self, x, value):
+        return self.bound(value).residual(x)
+
+    def jacobian(self, x, value):
+        return self.bound(value).jacobian(x)
+
+    def parameter_derivative(self, x, value):
+        '''dF/d(parameter) by central differences (derived constants make it non-polynomial).'''
+        h = 1e-6 * max(1.0, abs(value))
+        return (self.residual(x, value + h) - self.residual(x, value - h)) / (2 * h)
+
+    def tangent(self, x, value, previous):
+        '''Unit tangent of the solution curve in (x, parameter), oriented along `previous`.'''
+        J = self.jacobian(x, value)
+        A = np.vstack([np.hstack([J, self.parameter_derivative(x, value)[:, None]]), previous])
+        rhs = np.zeros(len(x) + 1)
+        rhs[-1] = 1.0
+        try:
+            t = np.linalg.solve(A, rhs)
+        except np.linalg.LinAlgError:
+            raise ValueError(f"Singular Jacobian at {self.parameter} = {value:.6g}; cannot compute the tangent.")
+        t /= np.linalg.norm(t)
+        return t if t @ previous >= 0 else -t
+
+
+def _correct_natural(system, x0, value, tol, max_iter):
+    result = newton_engine.solve(lambda x: system.residual(x, value), lambda x: system.jacobian(x, value),
+                                 x0, tol=tol, max_iter=max_iter)
+    return result["x"], value, result
+
+
+def _correct_arclength(system, y_pred, tangent, tol, max_iter):
+    '''Newton on F(x, p) = 0 plus the hyperplane tangent . (y - y_pred) = 0.'''
+    def residual(y):
+        return np.append(system.residual(y[:-1], y[-1]), tangent @ (y - y_pred))
+
+    def jacobian(y):
+        x, value = y[:-1], y[-1]
+        top = np.hstack([system.jacobian(x, value), system.parameter_derivative(x, value)[:, None]])
+        return np.vstack([top, tangent])
+
+    result = newton_engine.solve(residual, jacobian, y_pred, tol=tol, max_iter=max_iter)
+    return result["x"][:-1], float(result["x"][-1]), result
+
+
+def trace(solver_name, equations, constants_text, parameter, start, stop, step=None, method='natural',
+          initial_guess=None, tol=1e-8, corrector_iterations=8, min_step=None, max_step=None,
+          max_points=10000, **options):
+    '''Follows a solution branch while one constant moves from start to stop.
+
+    Parameters:
+    - solver_name: solver used for the first point ('numpy', 'scipyroot',
+      'scipyls' or 'gekko'); later points are corrected with Newton's method
+      from newton_engine, warm-started from the previous point.
+    - equations: list of equations as strings.
+    - constants_text: contents of the constants file defining `parameter`.
+    - parameter: name of the constant to vary.
+    - start, stop: range of the parameter.
+    - step: initial step (parameter units for 'natural', arclength units for
+      'arclength'); default (stop - start) / 20.
+    - method: 'natural' (step the parameter, predict with dx/dp from the
+      Jacobian) or 'arclength' (pseudo-arclength; follows the branch around
+      turning points, and ends where it leaves [start, stop], which is back
+      at start when it folds over before reaching stop; the last point is
+      clipped to that bound).
+    - initial_guess: optional dictionary of starting values for the first point.
+    - tol: residual norm for the corrector.
+    - corrector_iterations: Newton iterations allowed per point before the
+      step is halved and retried.
+    - min_step, max_step: step size limits (default |step| / 1e4 and |stop - start|).
+    - max_points: stop after this many points.
+    - options: passed to the first-point solver.
+
+    Yields:
+    - One dictionary per point: the parameter value, every variable,
+      "residual_norm", "iterations" (corrector) and "step".
+    Raises ValueError if the step size falls below min_step.
+    '''
+    if method not in METHODS:
+        raise ValueError(f"Unknown continuation method '{method}'. Choose one of {METHODS}.")
+    direction = 1.0 if stop >= start else -1.0
+    step = abs(step) if step else abs(stop - start) / 20
+    min_step = min_step or step * 1e-4
+    max_step = max_step or max(abs(stop - start), step)
+
+    system = ParametricSystem(equations, constants_text, parameter)
+
+    # First point: solve with the chosen solver at p = start
+    definitions = system._solution.constant_definitions
+    start_constants = "\n".join(f"{k} = {float(start)!r}" if k == parameter else f"{k} = {v}"
+                                for k, v in definitions)
+    first = get_system(solver_name, equations, start_constants, **options).solve(initial_guess)
+    x0 = np.array([float(first["solution_dict"][v]) for v in system.variables])
+    x, value, result = _correct_natural(system, x0, float(start), tol, corrector_iterations)
+
+    def point(x, value, iterations, step):
+        row = {parameter: value}
+        row.update(zip(system.variables, x.tolist()))
+        row["residual_norm"] = float(np.linalg.norm(system.residual(x, value)))
+        row["iterations"] = iterations
+        row["step"] = step
+        return row
+
+    yield point(x, value, result["iterations"], 0.0)
+
+    # Unit tangent in (x, p), initially pointing towards stop
+    e = np.zeros(len(x) + 1)
+    e[-1] = direction
+    tangent = system.tangent(x, value, e)
+    points = 1
+    while points < max_points and (stop - value) * direction > 0:
+        if method == 'natural':
+            h = min(step, abs(stop - value))
+            target = value + direction * h
+            # Tangent predictor: dx/dp = t_x / t_p
+            slope = tangent[:-1] / tangent[-1] if tangent[-1] != 0 else 0.0
+            x_pred = x + slope * (target - value)
+        else:
+            h = step
+            y_pred = np.append(x, value) + h * tangent
+        try:
+            if method == 'natural':
+                x_new, value_new, result = _correct_natural(system, x_pred, target, tol, corrector_iterations)
+            else:
+                x_new, value_new, result = _correct_arclength(system, y_pred, tangent, tol, corrector_iterations)
+                if np.linalg.norm(np.append(x_new, value_new) - y_pred) > MAX_CORRECTION * h:
+                    raise ValueError("Corrector left the neighbourhood of the predictor.")
+                # Past stop, or back past start after a fold: land exactly on the bound crossed
+                bound = stop if (value_new - stop) * direction > 0 else \
+                    start if (value_new - start) * direction < 0 else None
+                if bound is not None:
+                    fraction = (bound - value) / (value_new - value)
+                    x_new, value_new, result = _correct_natural(system, x + fraction * (x_new - x), float(bound),
+                                                                tol, corrector_iterations)
+            new_tangent = system.tangent(x_new, value_new, tangent)
+            if new_tangent @ tangent < MIN_TANGENT_COS:
+                raise ValueError("Tangent turned too sharply.")
+        except ValueError:
+            step *= SHRINK
+            if step < min_step:
+                raise ValueError(f"Continuation step fell below {min_step:.3g} at {parameter} = {value:.6g}.")
+            continue
+
+        x, value, tangent = x_new, value_new, new_tangent
+        points += 1
+        yield point(x, value, result["iterations"], h)
+        if method == 'arclength' and bound is not None:
+            # The branch left the range (at stop, or at start after folding back)
+            break
+        if result["iterations"] <= EASY_ITERATIONS:
+            step = min(step * GROW, max_step)
+        elif result["iterations"] >= HARD_ITERATIONS:
+            step = max(step * SHRINK, min_step)
+
+
+class CSVWriter:
+    '''Writes rows to a CSV file as they arrive; the header comes from the first row.'''
+    def __init__(self, path):
+        self._file = open(path, 'w', newline='')
+        self._writer = None
+
+    def write(self, row):
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file, fieldnames=list(row))
+            self._writer.writeheader()
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    '''Writes rows to a Parquet file in small row groups (needs pyarrow).'''
+    def __init__(self, path, batch_size=64):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow); use a .csv path instead.")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = path
+        self.batch_size = batch_size
+        self._rows = []
+        self._writer = None
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        table = self._pa.Table.from_pylist(self._rows)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+        self._rows = []
+
+    def close(self):
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+
+
+def open_writer(path, metadata=None, resume=False):
+    '''Returns a streaming row writer for a .csv or .parquet path, or a .store
+    directory (a memory-mapped result_store.ResultStore, which resume appends to).'''
+    if result_store.is_store(path):
+        return result_store.ResultStore(path, metadata=metadata, mode='a' if resume else 'w')
+    if resume:
+        raise ValueError("Only .store outputs can be resumed; use a .store path.")
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.parquet':
+        return ParquetWriter(path)
+    if extension == '.csv':
+        return CSVWriter(path)
+    raise ValueError(f"Unsupported output format '{extension}'; use .csv, .parquet or .store.")
+
+
+# Columns of a sweep row besides the parameter and the variables
+POINT_FIELDS = ("residual_norm", "iterations", "step")
+
+
+def run(output, solver_name, equations, constants_text, parameter, start, stop, resume=False, **kwargs):
+    '''Runs trace(...) and streams every point to `output` (.csv, .parquet or .store).
+
+    With resume, a sweep into a .store directory continues from the last
+    point stored by an earlier, interrupted run of the same sweep: that
+    point's solution is the starting guess, its step the first step, and it
+    is not written again.
+
+    Returns:
+    - Dictionary with "points" (number written by this run) and "last" (the final point).
+    '''
+    metadata = {"parameter": parameter, "start": float(start), "stop": float(stop),
+                "method": kwargs.get("method", 'natural')}
+    resumed = False
+    if resume and result_store.is_store(output) and os.path.exists(os.path.join(output, result_store.INDEX)):
+        store = result_store.open_store(output)
+        stored = {key: store.metadata.get(key) for key in ("parameter", "stop", "method")}
+        if stored != {key: metadata[key] for key in stored}:
+            raise ValueError(f"{output} holds a different sweep ({stored}); it cannot be resumed.")
+        last = store.last()
+        if last is not None:
+            start = last[parameter]
+            kwargs["initial_guess"] = {name: value for name, value in last.items()
+                                       if name != parameter and name not in POINT_FIELDS}
+            if last["step"]:
+                kwargs["step"] = last["step"]
+            resumed = True
+    writer = open_writer(output, metadata, resume)
+    points, last = 0, None
+    try:
+        for last in trace(solver_name, equations, constants_text, parameter, start, stop, **kwargs):
+            if resumed:
+                # The first point repeats the last stored one
+                resumed = False
+                continue
+            writer.write(last)
+            points += 1
+    finally:
+        writer.close()
+    return {"points": points, "last": last}
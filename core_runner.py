@@ -1,46 +1,322 @@
-def extract_var(solver_name, equations_list, constants_str=None):
-    if solver_name == "gekko":
-        import gekko_solver as selected_solver
-    elif solver_name == "scipyroot":
-        import scipy_root_solver as selected_solver
-    elif solver_name == "scipyls":
-        import scipy_ls_solver as selected_solver
-    elif solver_name == "numpy":
-        import newton_raphson as selected_solver
-    else:
-        raise ValueError("Unknown solver specified.")
-    
-    s = selected_solver.Solution()
-
-    if constants_str:
-        from tempfile import NamedTemporaryFile
-        with NamedTemporaryFile(delete=False, mode='w', suffix=".txt") as f:
-            f.write(constants_str)
-            s.constantspath = f.name
-    
-    equations_list = s.process_equations(equations_list)
-    s.get_variables(equations_list)
-    return s.variables
-
-def solve_equations(solver_name, equations_list, initial_guesses=None, constants_str=None): 
-    if solver_name == "gekko":
-        import gekko_solver as selected_solver
-    elif solver_name == "scipyroot":
-        import scipy_root_solver as selected_solver
-    elif solver_name == "scipyls":
-        import scipy_ls_solver as selected_solver
-    elif solver_name == "numpy":
-        import newton_raphson as selected_solver
-    else:
+import hashlib
+import importlib
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import frontend
+import profiling
+
+# Solver name -> backend module. Backends are imported on first use, so a run
+# only pays for the SymPy/SciPy/GEKKO imports of the solver it selects.
+SOLVERS = {
+    "numpy": "newton_raphson",
+    "scipyroot": "scipy_root_solver",
+    "scipyls": "scipy_ls_solver",
+    "gekko": "gekko_solver",
+}
+
+def load_solver(solver_name):
+    if solver_name not in SOLVERS:
         raise ValueError("Unknown solver specified.")
-    
-    s = selected_solver.Solution()
-
-    if constants_str:
-        from tempfile import NamedTemporaryFile
-        with NamedTemporaryFile(delete=False, mode='w', suffix=".txt") as f:
-            f.write(constants_str)
-            s.constantspath = f.name
-    
-    answers = s.solution(equations_list, initial_guess=initial_guesses)
-    return answers
+    return importlib.import_module(SOLVERS[solver_name])
+
+def system_id(solver_name, equations_list, constants_str=None, options=None):
+    '''Stable identifier for a solver + equations + constants + options combination.'''
+    payload = json.dumps([solver_name, list(equations_list), constants_str or "", options or {}],
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+class CompiledSystem:
+    '''A system parsed and compiled once, then solved or evaluated many times.
+
+    Parameters:
+    - solver_name: 'numpy', 'scipyroot', 'scipyls' or 'gekko'.
+    - equations_list: list of equations as strings.
+    - constants_str: optional contents of a constants file.
+    - options: keyword arguments passed to the solver's solution() on every
+      solve (e.g. backend='cse', sparse=True).
+
+    The variable ordering and coefficients are fixed at construction; the
+    residual and Jacobian callables (or, for the gekko solver, the GEKKO
+    model) are built on first use and kept for the lifetime of the object.
+    Each solve works on a fresh backend Solution, so one CompiledSystem can be
+    shared between threads; solves of the shared GEKKO model take turns.
+    The build phases (parsing, compiling or building the GEKKO model) are
+    recorded once in self.timings and included in every solve's "timings".
+    '''
+    def __init__(self, solver_name, equations_list, constants_str=None, **options):
+        self.solver_name = solver_name
+        self.module = load_solver(solver_name)
+        self.equations = list(equations_list)
+        self.constants_str = constants_str or None
+        self.options = options
+        self.system_id = system_id(solver_name, self.equations, self.constants_str, options)
+        self.residual_equations = [frontend.residual_text(eq) for eq in self.equations]
+
+        self.timings = profiling.Timings()  # build phases, shared by every solve
+        s = self.new_solution()
+        s.timings = self.timings
+        s.get_variables(self.residual_equations)
+        self.variables = list(s.variables)
+        self.coefficients = dict(s.coefficients)
+        self.constants = s.system.constants(self.coefficients)  # constants the equations use
+        self._compiled = None
+        self._model = None
+        self._numpy_residuals = None
+        self._lock = threading.Lock()
+
+    def new_solution(self):
+        s = self.module.Solution()
+        s.constants_text = self.constants_str
+        return s
+
+    @property
+    def compiled(self):
+        '''system_cache.CompiledFunctions for the residuals and Jacobian.'''
+        if self._compiled is None:
+            import system_cache
+            backend = self.options.get('backend') or 'lambdify'
+            if backend not in system_cache.BACKENDS:
+                backend = 'lambdify'
+            with self._lock:
+                if self._compiled is None:
+                    with self.timings.span("compile"):
+                        compiled = system_cache.get_bound(self.residual_equations, self.variables,
+                                                          self.coefficients, self.constants, backend=backend,
+                                                          timings=self.timings)
+                    # Map between the public variable order and the compiled one (they can differ
+                    # when the compiled functions come from the on-disk cache)
+                    self._order = [self.variables.index(v) for v in compiled.variables]
+                    self._compiled = compiled
+        return self._compiled
+
+    def gekko_model(self):
+        '''gekko_solver.Model of the system, built on first use and reused by every solve (gekko solver).
+
+        The model is shared with every system of the same equations, constant
+        names and backend (see _gekko_models); each solve sets its own
+        constant values on it instead of building another model.
+        '''
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    key = (tuple(self.residual_equations), tuple(self.coefficients), self.options.get('backend'))
+                    with _systems_lock:
+                        model = _gekko_models.get(key)
+                        if model is not None:
+                            _gekko_models.move_to_end(key)
+                    if model is None:
+                        s = self.new_solution()
+                        s.timings = self.timings
+                        model = s.build_model(self.equations, backend=self.options.get('backend'))
+                        with _systems_lock:
+                            model = _gekko_models.setdefault(key, model)
+                            while len(_gekko_models) > MAX_SYSTEMS:
+                                _gekko_models.popitem(last=False)
+                    self._model = model
+        return self._model
+
+    def _to_compiled_order(self, x):
+        return np.asarray(x, dtype=np.float64)[self._order]
+
+    def residual(self, x):
+        '''Residuals at x, given in the order of self.variables.'''
+        compiled = self.compiled
+        return compiled.residual(self._to_compiled_order(x))
+
+    def jacobian(self, x):
+        '''Dense Jacobian at x; columns follow the order of self.variables.'''
+        compiled = self.compiled
+        J_compiled = compiled.jacobian(self._to_compiled_order(x))
+        J = np.empty_like(J_compiled)
+        J[:, self._order] = J_compiled
+        return J
+
+    def residuals_at(self, solution):
+        '''Residuals at a solution dictionary, computed from the equations (all nan if a variable is missing).'''
+        if self._numpy_residuals is None:
+            self._numpy_residuals = frontend.parse_system(self.residual_equations).to_numpy(
+                self.variables, self.coefficients)
+        values = {str(k): v for k, v in solution.items()}
+        if any(v not in values for v in self.variables):
+            return np.full(len(self.equations), np.nan)
+        with np.errstate(all='ignore'):
+            return np.asarray(self._numpy_residuals([values[v] for v in self.variables]), dtype=np.float64)
+
+    def residual_norm(self, solution):
+        '''2-norm of the residuals at a solution dictionary (nan if a variable is missing).'''
+        return float(np.linalg.norm(self.residuals_at(solution)))
+
+    def solve(self, initial_guess=None, decompose=False, callback=None, warm_start=False):
+        '''Solves the system.
+
+        Parameters:
+        - initial_guess: dictionary of variable name -> value, or a sequence of
+          values in the order of self.variables. Missing variables get random guesses
+          (with the gekko solver, their values from the previous solve).
+        - decompose: solve block by block (see block_decomposition.py).
+        - callback: optional per-iteration callable (see progress.SolveLog).
+        - warm_start: start from the last converged solution in
+          guess_store.default_store (given guesses take precedence) and store
+          the result if it converges.
+
+        Returns:
+        - The solver's result dictionary ("solution_dict", "log", ...), with
+          "warm_start" True when a stored solution was used. Its "timings"
+          include the build phases of the system (see self.timings).
+        '''
+        if initial_guess is not None and not isinstance(initial_guess, dict):
+            initial_guess = dict(zip(self.variables, np.asarray(initial_guess, dtype=np.float64).tolist()))
+        stored = None
+        if warm_start:
+            import guess_store
+            key = guess_store.system_key(self.equations, self.constants_str)
+            stored = guess_store.default_store.get(key)
+            if stored:
+                initial_guess = {**stored, **(initial_guess or {})}
+        if decompose:
+            results = solve_by_blocks(self.module, self.equations, initial_guess or None,
+                                      constants_text=self.constants_str, callback=callback, **self.options)
+        else:
+            s = self.new_solution()
+            if self.solver_name == "gekko":
+                options = {**self.options, "model": self.gekko_model(), "constants": self.coefficients}
+            else:
+                s.precompiled = self.compiled
+                options = self.options
+            results = s.solution(self.equations, initial_guess=initial_guess or None, callback=callback,
+                                 **options)
+        timings = profiling.Timings()
+        timings.add(self.timings.spans)
+        timings.add(results.get("timings", {}))
+        results["timings"] = timings.as_dict()
+        if warm_start:
+            if stored:
+                results["log"] = "\nWarm start: last converged solution from the guess store\n" + results["log"]
+            guess_store.default_store.put(key, results["solution_dict"],
+                                          self.residual_norm(results["solution_dict"]), self.solver_name)
+            results["warm_start"] = bool(stored)
+        return results
+
+# Compiled systems shared within a process, keyed by system ID
+MAX_SYSTEMS = 32
+_systems = OrderedDict()
+_systems_lock = threading.Lock()
+# GEKKO models, keyed by residual equations, constant names and backend: systems differing only
+# in constant values (e.g. a web re-solve with edited constants, or the start of each sweep)
+# share one model and set their constants on it (see CompiledSystem.gekko_model)
+_gekko_models = OrderedDict()
+
+def get_system(solver_name, equations_list, constants_str=None, **options):
+    '''Returns the registered CompiledSystem for this system, creating it on first use.
+
+    Up to MAX_SYSTEMS systems are kept; the least recently used is dropped first.
+    '''
+    key = system_id(solver_name, equations_list, constants_str or None, options)
+    with _systems_lock:
+        system = _systems.get(key)
+        if system is not None:
+            _systems.move_to_end(key)
+            return system
+    system = CompiledSystem(solver_name, equations_list, constants_str, **options)
+    with _systems_lock:
+        system = _systems.setdefault(key, system)
+        while len(_systems) > MAX_SYSTEMS:
+            _systems.popitem(last=False)
+    return system
+
+def find_system(key):
+    '''Returns a registered CompiledSystem by system ID, or None.'''
+    with _systems_lock:
+        system = _systems.get(key)
+        if system is not None:
+            _systems.move_to_end(key)
+        return system
+
+def warm_up(solver_names):
+    '''Imports the given backends and solves a one-variable system with each.
+
+    A backend's first solve imports SymPy/SciPy/GEKKO and builds the code
+    generation namespaces. Warming up when a server starts keeps that cost
+    out of the first request, and forked job processes inherit the loaded modules.
+
+    Returns:
+    - Dictionary of solver name -> seconds taken, or the error message if it failed.
+    '''
+    report = {}
+    for solver_name in solver_names:
+        start = time.perf_counter()
+        try:
+            CompiledSystem(solver_name, ["x**2 - 2 = 0"]).solve({"x": 1.0})
+            report[solver_name] = round(time.perf_counter() - start, 4)
+        except Exception as e:
+            report[solver_name] = str(e)
+    return report
+
+def extract_var(solver_name, equations_list, constants_str=None):
+    return CompiledSystem(solver_name, equations_list, constants_str).variables
+
+def solve_by_blocks(selected_solver, equations_list, initial_guesses=None, constantspath=None, constants_text=None,
+                    callback=None, **options):
+    '''Solves the system as a sequence of strongly connected blocks.
+
+    Falls back to solving the whole system at once when it cannot be
+    decomposed (non-square or structurally singular). options are passed to
+    the solver's solution() for every block (e.g. backend='cse', sparse=True).
+    '''
+    import block_decomposition
+
+    def new_solution():
+        s = selected_solver.Solution()
+        s.constantspath = constantspath
+        s.constants_text = constants_text
+        return s
+
+    s = new_solution()
+    s.parse_constants_file()
+    try:
+        return block_decomposition.solve_by_blocks(equations_list, s.coefficients, new_solution,
+                                                   initial_guess=initial_guesses, callback=callback,
+                                                   options=options)
+    except block_decomposition.DecompositionError as e:
+        answers = new_solution().solution(equations_list, initial_guess=initial_guesses, callback=callback,
+                                          **options)
+        answers["log"] = f"\nBlock decomposition skipped: {e}\n" + answers["log"]
+        return answers
+
+def solve_equations(solver_name, equations_list, initial_guesses=None, constants_str=None, decompose=False):
+    system = CompiledSystem(solver_name, equations_list, constants_str)
+    return system.solve(initial_guesses, decompose=decompose)
+
+def solve_job(solver_name, equations_list, initial_guesses=None, constants_str=None, decompose=False,
+              callback=None, profile=False, trace_memory=False, warm_start=True, seed=None):
+    '''Solves a system and returns a JSON-serializable result; used for queued web jobs.
+
+    With warm_start the solve starts from the system's last converged
+    solution in the guess store (see CompiledSystem.solve). A seed makes the
+    random guesses of variables without one reproducible.
+
+    With profile / trace_memory the solve runs under cProfile / tracemalloc
+    and the result gains "profile" / "memory" (see profiling.capture).
+    '''
+    system = get_system(solver_name, equations_list, constants_str)
+    if seed is not None:
+        # Jobs run in their own process, so reseeding does not affect other solves
+        random.seed(seed)
+        np.random.seed(seed)
+    with profiling.capture(cprofile=profile, memory=trace_memory) as report:
+        results = system.solve(initial_guesses or None, decompose=decompose, callback=callback,
+                               warm_start=warm_start)
+    return {
+        "solution": results['log'],
+        "solution_dict": {str(k): float(v) for k, v in results['solution_dict'].items()},
+        "system_id": system.system_id,
+        "warm_start": results.get('warm_start', False),
+        "timings": results.get('timings', {}),
+        **report,
+    }
@@ -0,0 +1,385 @@
+import ast
+import functools
+import math
+import operator
+import os
+
+import numpy as np
+
+import profiling
+
+# Functions allowed in equations and constants, and names that are never variables
+FUNCTIONS = ('sqrt', 'sin', 'cos', 'tan', 'log', 'ln', 'exp')
+RESERVED = frozenset(FUNCTIONS) | {'pi'}
+
+MATH_NAMES = {
+    'sqrt': math.sqrt, 'sin': math.sin, 'cos': math.cos, 'tan': math.tan,
+    'log': math.log, 'ln': math.log, 'exp': math.exp,
+    'pi': math.pi, 'e': math.e,
+}
+NUMPY_NAMES = {
+    'sqrt': np.sqrt, 'sin': np.sin, 'cos': np.cos, 'tan': np.tan,
+    'log': np.log, 'ln': np.log, 'exp': np.exp,
+    'pi': math.pi, 'e': math.e,
+}
+
+_BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+}
+_UNARY = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+
+class Expression:
+    '''One parsed, validated arithmetic expression.
+
+    - text: the source text.
+    - tree: the expression's ast node.
+    - names: names it uses, in order of first appearance (function names in
+      call position excluded).
+    '''
+    def __init__(self, text, tree, names):
+        self.text = text
+        self.tree = tree
+        self.names = names
+
+
+def _check(node, text, names):
+    '''Validates node and collects the names it uses.'''
+    if isinstance(node, ast.BinOp):
+        if type(node.op) not in _BINARY:
+            hint = " Use ** for powers instead of ^." if isinstance(node.op, ast.BitXor) else ""
+            raise ValueError(f"Unsupported operator in '{text}'.{hint}")
+        _check(node.left, text, names)
+        _check(node.right, text, names)
+    elif isinstance(node, ast.UnaryOp):
+        if type(node.op) not in _UNARY:
+            raise ValueError(f"Unsupported operator in '{text}'.")
+        _check(node.operand, text, names)
+    elif isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+            raise ValueError(f"Unsupported function call in '{text}'. Allowed functions: {', '.join(FUNCTIONS)}.")
+        for arg in node.args:
+            _check(arg, text, names)
+    elif isinstance(node, ast.Name):
+        if node.id not in names:
+            names[node.id] = None
+    elif isinstance(node, ast.Constant):
+        if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+            raise ValueError(f"Unsupported constant {node.value!r} in '{text}'.")
+    else:
+        raise ValueError(f"Unsupported syntax in '{text}'.")
+
+
+@functools.lru_cache(maxsize=8192)
+def parse_expression(text):
+    '''Parses an arithmetic expression (cached, so each text is parsed once per process).
+
+    Raises ValueError for anything but numbers, names, + - * / **, unary
+    minus and calls of FUNCTIONS.
+    '''
+    try:
+        tree = ast.parse(text.strip(), mode='eval').body
+    except SyntaxError as e:
+        raise ValueError(f"Cannot parse '{text}': {e.msg}")
+    names = {}
+    _check(tree, text, names)
+    return Expression(text, tree, tuple(names))
+
+
+def residual_text(equation):
+    '''The residual expression of an equation: lhs for 'lhs = 0', '(lhs) - (rhs)' otherwise.'''
+    lhs, _, rhs = equation.partition('=')
+    lhs, rhs = lhs.strip(), rhs.strip()
+    if rhs in ('', '0'):
+        return lhs
+    return f"({lhs}) - ({rhs})"
+
+
+def lower(expression, names, number=None):
+    '''Evaluates a parsed expression with the given meaning for every name.
+
+    This is how the backends lower the IR: with SymPy objects in `names` it
+    builds a SymPy expression, with GEKKO variables and m.sin etc. a GEKKO
+    expression, with floats and math functions a number.
+
+    Parameters:
+    - expression: Expression from parse_expression.
+    - names: mapping of every name (variables, constants, functions) to its value.
+    - number: optional conversion applied to numeric literals (e.g. sympy.sympify).
+    '''
+    def visit(node):
+        if isinstance(node, ast.BinOp):
+            return _BINARY[type(node.op)](visit(node.left), visit(node.right))
+        if isinstance(node, ast.UnaryOp):
+            return _UNARY[type(node.op)](visit(node.operand))
+        if isinstance(node, ast.Call):
+            return names[node.func.id](*[visit(arg) for arg in node.args])
+        if isinstance(node, ast.Name):
+            try:
+                return names[node.id]
+            except KeyError:
+                raise ValueError(f"name '{node.id}' is not defined")
+        return node.value if number is None else number(node.value)
+    return visit(expression.tree)
+
+
+class Constants:
+    '''A parsed constants file.
+
+    - definitions: (name, expression text) pairs in file order.
+    - values: name -> float, each evaluated with the math functions and the
+      constants defined above it.
+    - dependencies: name -> names of the constants its expression uses. A
+      constant can only use constants defined above it, so file order is a
+      topological order of this graph.
+    '''
+    def __init__(self, definitions, values):
+        self.definitions = definitions
+        self.values = values
+        defined = set()
+        self.dependencies = {}
+        for key, value in definitions:
+            self.dependencies[key] = tuple(name for name in parse_expression(value).names if name in defined)
+            defined.add(key)
+
+    def dependents(self, names):
+        '''Constants depending on any of names, directly or through other constants, in file order.'''
+        changed = set(names)
+        result = []
+        for key, _ in self.definitions:
+            if key not in changed and changed.intersection(self.dependencies[key]):
+                changed.add(key)
+                result.append(key)
+        return result
+
+    def evaluate(self, overrides):
+        '''Re-evaluates the constants with some of them replaced.
+
+        Only the constants depending on an override are recomputed, in
+        topological order; the others keep their parsed values.
+
+        Parameters:
+        - overrides: dictionary of constant name -> value (a number or a 1-D array).
+
+        Returns:
+        - Dictionary of all constants; constants depending on an array
+          override (directly or through other constants) become arrays as well.
+        '''
+        unknown = set(overrides) - set(self.dependencies)
+        if unknown:
+            raise ValueError(f"Constants not defined in the constants file: {sorted(unknown)}")
+        values = dict(self.values)
+        values.update(overrides)
+        stale = set(self.dependents(overrides))
+        for key, value in self.definitions:
+            if key in stale:
+                values[key] = lower(parse_expression(value), {**NUMPY_NAMES, **values})
+        return values
+
+
+@functools.lru_cache(maxsize=256)
+def parse_constants(text):
+    '''Parses the contents of a constants file (cached; do not modify the result).'''
+    definitions = []
+    values = {}
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()  # remove comment and trim
+        if '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        key = key.strip()
+        value = value.strip()
+        definitions.append((key, value))
+        try:
+            # Constants may use the math functions and the constants defined above them
+            values[key] = lower(parse_expression(value), {**MATH_NAMES, **values})
+        except Exception as e:
+            raise ValueError(f"Invalid expression for '{key}': '{value}' → {e}")
+    return Constants(tuple(definitions), values)
+
+
+class EquationSystem:
+    '''The intermediate representation shared by all backends.
+
+    - residuals: residual expression texts, one per equation.
+    - expressions: parsed Expression per residual.
+    - names: every name used, in order of first appearance.
+    '''
+    def __init__(self, residuals):
+        self.residuals = residuals
+        self.expressions = [parse_expression(text) for text in residuals]
+        seen = {}
+        for expression in self.expressions:
+            for name in expression.names:
+                seen.setdefault(name, None)
+        self.names = tuple(seen)
+
+    def variables(self, coefficients=()):
+        '''Names that are not constants or math names, in order of first appearance.'''
+        return [name for name in self.names if name not in RESERVED and name not in coefficients]
+
+    def constants(self, coefficients):
+        '''Names of the constants the residuals use, in order of first appearance.'''
+        return [name for name in self.names if name not in RESERVED and name in coefficients]
+
+    def incidence(self, variables):
+        '''For each equation, the indices of the variables it contains.'''
+        index = {name: j for j, name in enumerate(variables)}
+        return [[index[name] for name in expression.names if name in index] for expression in self.expressions]
+
+    def to_sympy(self, symbols):
+        '''Lowers every residual to a SymPy expression.
+
+        Parameters:
+        - symbols: name -> SymPy object for every variable and constant.
+        '''
+        import sympy as sp
+        names = {'sqrt': sp.sqrt, 'sin': sp.sin, 'cos': sp.cos, 'tan': sp.tan,
+                 'log': sp.log, 'ln': sp.log, 'exp': sp.exp, 'pi': sp.pi, **symbols}
+        return [lower(expression, names, sp.sympify) for expression in self.expressions]
+
+    def to_gekko(self, m, gekko_vars, coefficients):
+        '''Lowers every residual to a GEKKO expression on model m (add with m.Equation(r == 0)).'''
+        names = {'sqrt': m.sqrt, 'sin': m.sin, 'cos': m.cos, 'tan': m.tan,
+                 'log': m.log, 'ln': m.log, 'exp': m.exp, 'pi': math.pi,
+                 **coefficients, **gekko_vars}
+        return [lower(expression, names) for expression in self.expressions]
+
+    def to_numpy(self, variables, coefficients):
+        '''Lowers the residuals to one Python function of the variable values.
+
+        Returns:
+        - Callable f(x) returning the list of residuals; uses NumPy functions,
+          so x may hold arrays, and invalid operations give nan instead of raising.
+        '''
+        arguments = ", ".join(variables)
+        body = ", ".join(ast.unparse(expression.tree) for expression in self.expressions)
+        source = f"def residuals({arguments}):\n    return [{body}]\n"
+        namespace = {**NUMPY_NAMES, **coefficients}
+        exec(compile(source, "<residuals>", "exec"), namespace)
+        f = namespace["residuals"]
+        return lambda x: f(*x)
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_system(residuals):
+    return EquationSystem(list(residuals))
+
+
+def parse_system(equations):
+    '''Parses a list of equations ('expression = 0') or residual expressions (cached).'''
+    return _parse_system(tuple(residual_text(eq) for eq in equations))
+
+
+def clear_caches():
+    '''Empties the parse caches (expressions, constants files and systems).'''
+    parse_expression.cache_clear()
+    parse_constants.cache_clear()
+    _parse_system.cache_clear()
+
+
+def load_equations(paths):
+    '''Reads equation files: one equation per line; '#' starts a comment.
+
+    Returns:
+    - List of equations as strings, in file order.
+    '''
+    equations = []
+    for eq_file in paths:
+        if not os.path.isfile(eq_file):
+            raise FileNotFoundError(f"Equations file not found: {eq_file}")
+        with open(eq_file, 'r') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()  # Remove comments and trailing spaces
+                if line:
+                    equations.append(line)
+    return equations
+
+
+def load_guesses(path):
+    '''Reads an initial guesses file (name = value per line).'''
+    guesses = {}
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if '=' in line:
+                key, value = line.split('=', 1)
+                guesses[key.strip()] = float(value)
+    return guesses
+
+
+class FrontEnd:
+    '''Equation and constants handling shared by the backend Solution classes.'''
+    def __init__(self):
+        self.equations = []
+        self.variables = []
+        self.coefficients = {}
+        self.constant_definitions = []  # (name, expression) pairs in file order
+        self.constantspath = None
+        self.constants_text = None  # constants file contents, used instead of constantspath when set
+        self.timings = profiling.Timings()  # phase spans of the last solve
+        self.system = None  # EquationSystem of the last parse
+        self.compiled = None  # system_cache.CompiledFunctions of the last solve
+        self.precompiled = None  # preset CompiledFunctions for these equations; skips parsing and compiling
+
+    def process_equations(self, equations):
+        '''Removes '= 0' from each equation string.'''
+        self.equations = [residual_text(eq) for eq in equations]
+        return self.equations
+
+    def read_constants(self):
+        if self.constants_text:
+            return self.constants_text
+        if self.constantspath:
+            with open(self.constantspath, 'r') as file:
+                return file.read()
+        return None
+
+    def parse_constants_file(self):
+        text = self.read_constants()
+        if text:
+            constants = parse_constants(text)
+            self.constant_definitions = list(constants.definitions)
+            self.coefficients.update(constants.values)
+
+    def evaluate_constants(self, overrides):
+        '''Re-evaluates the constants file with some constants replaced (see Constants.evaluate).'''
+        return Constants(tuple(self.constant_definitions), self.coefficients).evaluate(overrides)
+
+    def get_variables(self, equations):
+        with self.timings.span("parse_constants"):
+            self.parse_constants_file()
+        with self.timings.span("get_variables"):
+            self.system = parse_system(equations)
+            self.variables = self.system.variables(self.coefficients)
+
+    def create_symbolic_system(self, equations, jacobian=True, backend='lambdify'):
+        '''Parameters:
+        - equations: list of equations as strings.
+        - jacobian: also compile the analytic Jacobian (self.compiled.jac).
+        - backend: code generation backend, 'lambdify', 'cse' or 'ad'.
+
+        Returns:
+        - f_lambdified: numerical function evaluating the equations.
+        - variables: variable names, in the order f_lambdified takes them.
+        '''
+        import system_cache
+        equations = self.process_equations(equations)
+        compiled = self.precompiled
+        # A preset compiled system (see core_runner.CompiledSystem) skips parsing and compiling
+        if compiled is None or compiled.backend != backend or (jacobian and compiled.jac is None):
+            self.get_variables(equations)
+            with self.timings.span("compile"):
+                compiled = system_cache.get_bound(equations, self.variables, self.coefficients,
+                                                  self.system.constants(self.coefficients), jacobian=jacobian,
+                                                  backend=backend, timings=self.timings)
+        self.compiled = compiled
+        self.variables = compiled.variables
+        return compiled.f, list(self.variables)
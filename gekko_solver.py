@@ -1,143 +1,230 @@
 from gekko import GEKKO
-from sympy import *
-import re
-import ast
+import os
 import random
-import contextlib
-import io
 import math
+import multiprocessing.util
+import shutil
+import tempfile
+import threading
+import numpy as np
+import frontend
+import profiling
+import progress
 random.seed(42) 
 
-class Solution():
-    def __init__(self):
-        self.equations = []
-        self.variables = []
-        self.coefficients = {} 
-        self.constantspath = None
-
-    def process_equations(self, equations):
-        # for i in range(len(equations)):
-        #     equations[i] = re.sub(r'e\*\*', 'e', equations[i])
-        equations = [x.replace('=', '==') for x in equations]
-        equations = [x.replace('sin', 'm.sin') for x in equations]
-        equations = [x.replace('cos', 'm.cos') for x in equations]
-        equations = [x.replace('tan', 'm.tan') for x in equations]
-        equations = [x.replace('sqrt', 'm.sqrt') for x in equations]
-        equations = [x.replace('log', 'm.log') for x in equations]
-        equations = [x.replace('ln', 'm.log') for x in equations]
-        #equations = [x.replace('exp', '2.718281828459') for x in equations]
-        equations = [x.replace('pi', 'm.pi') for x in equations]
-        equations = [x.replace('exp', 'm.exp') for x in equations]
-        #equations = [x.replace('e', '2.718281828459') for x in equations]
-        #equations = [x.replace('E', '2.718281828459') for x in equations]
-        return equations
-                        
-
-    def parse_constants_file(self):
-        if self.constantspath:
-            filepath = self.constantspath
-            with open(filepath, 'r') as file:
-                lines = file.readlines()
-
-            # First, preprocess lines to strip comments and empty lines
-            cleaned_lines = []
-            for line in lines:
-                line = line.split('#', 1)[0].strip()  # remove comment and trim
-                if line:  # skip empty lines
-                    cleaned_lines.append(line)
-
-            # Allowed math functions/constants
-            safe_math = {
-                'sqrt': math.sqrt,
-                'sin': math.sin,
-                'cos': math.cos,
-                'tan': math.tan,
-                'log': math.log,  # natural log
-                'ln': math.log,   # alias for natural log
-                'exp': math.exp,
-                'pi': math.pi,
-                'e': math.e
-            }
-
-            # Evaluate constants in order; constants may depend on previous ones
-            for line in cleaned_lines:
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    try:
-                        # Combine safe math functions with previously defined constants
-                        self.coefficients[key] = eval(value, {"__builtins__": {}}, {**safe_math, **self.coefficients})
-                    except Exception as e:
-                        raise ValueError(f"Invalid expression for '{key}': '{value}' → {e}")
-
-
-    def get_variables(self, equations):
-        self.parse_constants_file()
-        var_pattern = re.compile(r'\b[a-zA-Z_][a-zA-Z0-9_]*\b')
-        to_remove = set(['sin', 'cos', 'tan', 'sqrt', 'log', 'ln', 'exp', 'pi']) | set(self.coefficients.keys())
-        
-        variables = set()
-        for eq in equations:
-            for var in var_pattern.findall(eq):
-                if var not in to_remove:
-                    variables.add(var)
+def _remove_directory(path, pid):
+    # A forked process may inherit the finalizer; only the creating process removes the directory
+    if os.getpid() == pid:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def add_cse_equations(m, system, g_vars, constants):
+    '''Adds the equations to the model with shared subexpressions factored out.
+
+    sympy.cse finds subexpressions repeated across the equations; each one
+    becomes a GEKKO Intermediate that is evaluated once per iteration.
+    constants maps each constant to a number or to the m.Param standing for it.
+    '''
+    import sympy as sp  # only this backend needs SymPy
+    sym_table = {var: sp.Symbol(var) for var in g_vars}
+    sym_table.update({k: sp.Symbol(k) for k in constants})
+    residuals = system.to_sympy(sym_table)
+
+    replacements, reduced = sp.cse(residuals, symbols=sp.numbered_symbols('_cse'))
+    namespace = {
+        **constants, **g_vars,
+        'sqrt': m.sqrt, 'sin': m.sin, 'cos': m.cos, 'tan': m.tan,
+        'log': m.log, 'exp': m.exp, 'pi': math.pi, 'E': math.e
+    }
+    for sym, expr in replacements:
+        namespace[str(sym)] = m.Intermediate(frontend.lower(frontend.parse_expression(str(expr)), namespace))
+    for expr in reduced:
+        m.Equation(frontend.lower(frontend.parse_expression(str(expr)), namespace) == 0)
+    return len(replacements)
+
+
+class Model:
+    '''A GEKKO model built once and solved many times.
+
+    Every constant used by the equations becomes an m.Param, so constants can
+    change between solves without rebuilding the model, and the model file is
+    written only once. Each solve starts from the previous solution unless
+    other guesses are given. The model's temporary directory is removed by
+    close() (or when the Model is garbage collected).
+
+    A Model inherited by a forked process (e.g. a web job's worker) solves in
+    a private copy of the directory, removed when that solve finishes.
+
+    Parameters:
+    - system: frontend.EquationSystem of the residuals.
+    - variables: variable names, in order.
+    - coefficients: constant name -> value.
+    - constant_definitions: (name, expression) pairs from the constants file,
+      so that constants defined in terms of a changed one follow it.
+    - initial_guess: optional dictionary of variable name -> first starting value;
+      missing variables start at random values.
+    - backend: 'cse' to factor repeated subexpressions into GEKKO Intermediates.
+    '''
+    def __init__(self, system, variables, coefficients, constant_definitions=(), initial_guess=None, backend=None):
+        self.system = system
         self.variables = list(variables)
-        
+        self.coefficients = dict(coefficients)
+        self.constant_definitions = tuple(constant_definitions)
+        self.iterations = None
+        self.solve_time = None
+        self.n_intermediates = None
+        self._lock = threading.Lock()
 
-    def solution(self, equations, initial_guess=None):  # initial_guess is a dictionary
-        original_eqs = [eq.strip() for eq in equations]  # keep original for residuals
-        equations = self.process_equations(equations)
-        self.get_variables(equations)
         m = GEKKO(remote=False)
-
-        if initial_guess is None:
-            g_vars = {var: m.Var(value=random.uniform(0, 2), name=var) for var in self.variables}
+        self.m = m
+        self._pid = os.getpid()
+        # Unlike weakref.finalize, this also runs when a pool worker process exits
+        self._finalizer = multiprocessing.util.Finalize(self, _remove_directory, args=(m._path, self._pid),
+                                                        exitpriority=0)
+
+        initial_guess = initial_guess or {}
+        # Starting point of the next solve: the given guesses or random values, then the last solution
+        self.start = {var: initial_guess[var] if var in initial_guess else random.uniform(0, 2)
+                      for var in self.variables}
+        self.g_vars = {var: m.Var(value=self.start[var], name=var) for var in self.variables}
+        used = set(system.names)
+        self.params = {name: m.Param(value=value, name=name)
+                       for name, value in self.coefficients.items() if name in used}
+
+        # Lower the parsed equations straight to GEKKO expressions
+        if backend == 'cse':
+            self.n_intermediates = add_cse_equations(m, system, self.g_vars, self.params)
         else:
-            g_vars = {}
-            for var in self.variables:
-                if var in initial_guess:
-                    g_vars[var] = m.Var(value=initial_guess[var], name=var)
-                else:
-                    g_vars[var] = m.Var(value=random.uniform(0, 2), name=var)
-
-        # Inject coefficient values directly into locals
-        local_context = {**g_vars, **self.coefficients, "m": m}
-
-        # Add equations
-        for eq_str in equations:
-            m.Equation(eval(eq_str, {}, local_context))
-
-        output_log = io.StringIO()
-        with contextlib.redirect_stdout(output_log):
-            print("\nSolving using GEKKO: ")
-            m.solve(disp=True)
-            solution_dict = {str(var): g_vars[var].value[0] for var in self.variables if var != 'm'}
-            print("\nFinal Solution: ")
-            for var, val in solution_dict.items():
-                print(f"{var} = {val:.6f}")
-
-            # --- Residual Computation ---
-            print("\nResiduals:")
-            sym_table = {k: v for k, v in solution_dict.items()}
-            sym_table.update(self.coefficients)
-            sym_table.update({
-                'sqrt': math.sqrt, 'sin': math.sin, 'cos': math.cos, 'tan': math.tan,
-                'log': math.log, 'ln': math.log, 'exp': math.exp, 'pi': math.pi
-            })
-
-            for i, eq in enumerate(original_eqs, 1):
-                try:
-                    # Convert equation to residual form: lhs - rhs
-                    lhs, rhs = eq.split('=')
-                    lhs_val = eval(lhs.strip(), {}, sym_table)
-                    rhs_val = eval(rhs.strip(), {}, sym_table)
-                    residual = lhs_val - rhs_val
-                    print(f"Eq{i}: {residual:.6e}")
-                except Exception as e:
-                    print(f"Eq{i}: Could not compute residual → {e}")
+            for residual in system.to_gekko(m, self.g_vars, self.params):
+                m.Equation(residual == 0)
+        # Write the model file now; later solves only write the variable and parameter values
+        m._build_model()
+        m._model = 'provided'
+
+    def set_constants(self, values):
+        '''Changes constants (name -> value) for the following solves.
+
+        Constants derived from a changed one are recomputed; others keep their current values.
+        '''
+        if self.constant_definitions:
+            coefficients = frontend.Constants(self.constant_definitions, self.coefficients).evaluate(values)
+        else:
+            unknown = set(values) - set(self.coefficients)
+            if unknown:
+                raise ValueError(f"Constants not defined in the constants file: {sorted(unknown)}")
+            coefficients = {**self.coefficients, **values}
+        self.coefficients.update({name: float(value) for name, value in coefficients.items()})
+        for name, param in self.params.items():
+            param.value = self.coefficients[name]
+
+    def solve(self, initial_guess=None, constants=None):
+        '''Solves the model.
+
+        Parameters:
+        - initial_guess: optional dictionary of variable name -> starting value;
+          other variables start from the previous solution.
+        - constants: optional dictionary of constant name -> value to solve
+          with, set first (see set_constants).
+
+        Returns:
+        - Dictionary of variable name -> value.
+        '''
+        with self._lock:
+            if constants and any(self.coefficients.get(k) != v for k, v in constants.items()):
+                self.set_constants(constants)
+            self.start.update({var: value for var, value in (initial_guess or {}).items() if var in self.g_vars})
+            for var, g_var in self.g_vars.items():
+                # Assigning marks the value changed, so GEKKO writes it instead of the model file's value
+                g_var.value = self.start[var]
+            m = self.m
+            path = m._path
+            private = os.getpid() != self._pid
+            if private:
+                m._path = tempfile.mkdtemp(suffix=m._model_name)
+                shutil.copytree(path, m._path, dirs_exist_ok=True)
+            try:
+                m.solve(disp=False)
+            finally:
+                if private:
+                    shutil.rmtree(m._path, ignore_errors=True)
+                    m._path = path
+            self.iterations = m.options.ITERATIONS
+            self.solve_time = m.options.SOLVETIME
+            self.start = {str(var): self.g_vars[var].value[0] for var in self.variables}
+            return dict(self.start)
+
+    def close(self):
+        '''Removes the model's temporary directory.'''
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Solution(frontend.FrontEnd):
+    def build_model(self, equations, initial_guess=None, backend=None):
+        '''Parses the system and builds a reusable Model (see Model); close it when done.'''
+        equations = self.process_equations(equations)
+        self.get_variables(equations)
+        with self.timings.span("build_model"):
+            return Model(self.system, self.variables, self.coefficients, self.constant_definitions,
+                         initial_guess=initial_guess, backend=backend)
+
+    def solution(self, equations, initial_guess=None, backend=None, callback=None, model=None,
+                 constants=None):  # initial_guess is a dictionary
+        '''Parameters:
+        - equations: list of equations as strings.
+        - initial_guess: optional dictionary of variable name -> starting value.
+        - backend: 'cse' to factor repeated subexpressions into GEKKO
+          Intermediates; otherwise each equation is added as written.
+        - callback: optional callable receiving a dictionary with "iteration",
+          "residual_norm", "step_norm" and "elapsed". GEKKO's solvers run as an
+          external process, so it is called once, when the solve finishes.
+        - model: optional Model of these equations (from build_model) to solve
+          again instead of building a new one; variables without a guess start
+          from its previous solution.
+        - constants: with model, dictionary of constant name -> value to solve
+          with (see Model.set_constants); default the model's current values.
+
+        Returns:
+        - Dictionary with "solution_dict", "log" and "timings" (seconds per
+          phase, see profiling.Timings; "external_solve" is the APOPT/IPOPT process).
+        '''
+        self.timings = profiling.Timings()
+        if model is None:
+            with self.build_model(equations, initial_guess, backend) as model:
+                return self._solve_model(model, None, callback)
+        self.system, self.variables = model.system, model.variables
+        return self._solve_model(model, initial_guess, callback, constants)
+
+    def _solve_model(self, model, initial_guess, callback, constants=None):
+        log = progress.SolveLog(callback)
+        log.print("\nSolving using GEKKO: ")
+        if model.n_intermediates is not None:
+            log.print(f"Common subexpressions: {model.n_intermediates} intermediates")
+        with self.timings.span("external_solve"):
+            solution_dict = model.solve(initial_guess, constants)
+        self.coefficients = dict(model.coefficients) if constants is None else {**model.coefficients, **constants}
+        log.print(f"Iterations: {model.iterations}")
+        log.print(f"Solve time: {model.solve_time:.4f} seconds")
+        log.print("\nFinal Solution: ")
+        for var, val in solution_dict.items():
+            log.print(f"{var} = {val:.6f}")
+
+        # --- Residual Computation ---
+        log.print("\nResiduals:")
+        residual_function = self.system.to_numpy(self.variables, self.coefficients)
+        with np.errstate(all='ignore'):
+            residuals = [float(r) for r in residual_function([solution_dict[var] for var in self.variables])]
+        for i, residual in enumerate(residuals, 1):
+            log.print(f"Eq{i}: {residual:.6e}")
+        log.iteration(model.iterations, math.sqrt(sum(r * r for r in residuals)))
 
         return {
             "solution_dict": solution_dict,
-            "log": output_log.getvalue()
+            "log": log.getvalue(),
+            "timings": self.timings.as_dict(),
         }
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+import frontend
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), "nlsolver_guesses.sqlite")
+
+_SCHEMA = '''CREATE TABLE IF NOT EXISTS guesses (
+    key TEXT PRIMARY KEY,
+    solution TEXT NOT NULL,
+    residual_norm REAL NOT NULL,
+    solver TEXT,
+    updated REAL NOT NULL
+)'''
+
+
+def system_key(equations, constants_text=None):
+    '''Solver-independent identifier of a system: its residuals and constants file.'''
+    residuals = [frontend.residual_text(eq) for eq in equations]
+    payload = json.dumps([residuals, constants_text or ""])
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class GuessStore:
+    '''The last converged solution of each system, kept in a SQLite file.
+
+    Solves use the stored solution as their starting point instead of random
+    guesses, so a system that converged once starts next to its root in later
+    runs and in other processes. The store is a cache: when the file cannot be
+    read or written the solve goes on with random guesses.
+
+    Parameters:
+    - path: SQLite file; None disables the store.
+    - tol: a solution is only stored when the 2-norm of its residuals is at most tol.
+    '''
+    def __init__(self, path=None, tol=1e-6):
+        self.path = path
+        self.tol = tol
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute(_SCHEMA)
+        return connection
+
+    def get(self, key):
+        '''Returns the stored solution (variable name -> value) for key, or None.'''
+        if not self.path:
+            return None
+        try:
+            connection = self._connect()
+            try:
+                row = connection.execute("SELECT solution FROM guesses WHERE key = ?", (key,)).fetchone()
+            finally:
+                connection.close()
+        except (OSError, sqlite3.Error):
+            return None
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, solution, residual_norm, solver=None):
+        '''Stores solution for key if residual_norm shows it converged.
+
+        Returns:
+        - True if the solution was stored.
+        '''
+        if not self.path or not residual_norm <= self.tol:  # also rejects nan
+            return False
+        row = (key, json.dumps({str(k): float(v) for k, v in solution.items()}),
+               float(residual_norm), solver, time.time())
+        try:
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.execute("INSERT OR REPLACE INTO guesses VALUES (?, ?, ?, ?, ?)", row)
+            finally:
+                connection.close()
+        except (OSError, sqlite3.Error):
+            return False
+        return True
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+default_store = GuessStore(os.environ.get("NLSOLVER_GUESS_DB") or None)
+
+
+def configure(path=None, tol=None):
+    '''Sets the file (enabling the store) and tolerance of the process-wide store.'''
+    if path is not None:
+        default_store.path = path
+    if tol is not None:
+        default_store.tol = tol
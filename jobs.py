@@ -0,0 +1,220 @@
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMEOUT = "timeout"
+FINISHED = (DONE, FAILED, CANCELLED, TIMEOUT)
+
+# How often a waiting dispatcher thread checks for cancellation (seconds)
+POLL_INTERVAL = 0.05
+
+
+def process_context():
+    '''multiprocessing context for solve processes: fork where the platform has it.
+
+    Forked processes inherit the parent's imported backends and compiled
+    systems. Under spawn (the default on macOS and Windows) every process
+    would import the main module again and redo that work.
+    '''
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+class Job:
+    '''One queued solve. Read its state through JobQueue.get(...).to_dict().'''
+    def __init__(self, timeout=None):
+        self.id = uuid.uuid4().hex
+        self.status = QUEUED
+        self.timeout = timeout
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self._callbacks = []
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._changed = threading.Condition()
+
+    def add_done_callback(self, fn):
+        '''Calls fn(job) once the job has finished, or at once if it already has.'''
+        with self._changed:
+            if self.status not in FINISHED:
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def to_dict(self):
+        elapsed = None
+        if self.started is not None:
+            elapsed = round((self.finished or time.time()) - self.started, 4)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "elapsed": elapsed,
+            "progress": self.events[-1] if self.events else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+def _run_in_child(conn, fn, args, kwargs, progress):
+    if progress:
+        kwargs = {**kwargs, "callback": lambda event: conn.send(("progress", event))}
+    try:
+        conn.send(("result", fn(*args, **kwargs)))
+    except Exception as e:
+        conn.send(("error", str(e)))
+    finally:
+        conn.close()
+
+
+class JobQueue:
+    '''Runs jobs on a bounded pool, each in its own worker process.
+
+    At most max_workers jobs run at once; the rest wait in FIFO order. Running
+    every job in a separate process lets CPU-bound solves use all cores and
+    makes cancellation and timeouts hard guarantees: the process is terminated.
+
+    Parameters:
+    - max_workers: number of jobs run concurrently (default: os.cpu_count()).
+    - timeout: default per-job time limit in seconds (None for no limit).
+    - max_jobs: finished jobs kept for status queries; the oldest are dropped first.
+    '''
+    def __init__(self, max_workers=None, timeout=None, max_jobs=256):
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="solve-job")
+        self._context = process_context()
+
+    def submit(self, fn, *args, timeout=None, progress=False, **kwargs):
+        '''Queues fn(*args, **kwargs) and returns the Job. fn must be a module-level function.
+
+        With progress=True fn is also given a `callback` keyword argument; every
+        dictionary passed to it is appended to job.events (see wait_events).
+        '''
+        job = Job(timeout if timeout is not None else self.timeout)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._pool.submit(self._run, job, fn, args, kwargs, progress)
+        return job
+
+    def completed(self, result):
+        '''Registers a job that is already done with result (e.g. served from a cache) and returns it.'''
+        job = Job()
+        job.started = time.time()
+        with self._lock:
+            self._jobs[job.id] = job
+            self._finish(job, DONE, result=result)
+            self._prune()
+        return job
+
+    def wait_events(self, job, start, timeout=None):
+        '''Waits until the job has events beyond index `start` or has finished.
+
+        Returns:
+        - (new events, whether the job has finished).
+        '''
+        with job._changed:
+            job._changed.wait_for(lambda: len(job.events) > start or job.status in FINISHED, timeout)
+            return job.events[start:], job.status in FINISHED
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id, wait=1.0):
+        '''Cancels a queued or running job. Returns False if it is unknown or already finished.
+
+        Waits up to `wait` seconds for a running job's process to be terminated.
+        '''
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        job._cancel.set()
+        with self._lock:
+            if job.status == QUEUED:
+                self._finish(job, CANCELLED)
+        job._done.wait(wait)
+        return True
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.max_workers, "jobs": counts}
+
+    def _prune(self):
+        finished = [key for key, job in self._jobs.items() if job.status in FINISHED]
+        for key in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[key]
+
+    def _finish(self, job, status, result=None, error=None):
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished = time.time()
+        job._done.set()
+        with job._changed:
+            job._changed.notify_all()
+            callbacks, job._callbacks = job._callbacks, []
+        for fn in callbacks:
+            fn(job)
+
+    def _run(self, job, fn, args, kwargs, progress):
+        with self._lock:
+            if job._cancel.is_set():
+                return
+            job.status = RUNNING
+            job.started = time.time()
+
+        receiver, sender = self._context.Pipe(duplex=False)
+        process = self._context.Process(target=_run_in_child,
+                                        args=(sender, fn, args, kwargs, progress), daemon=True)
+        process.start()
+        sender.close()
+        deadline = job.started + job.timeout if job.timeout else None
+        try:
+            while True:
+                if receiver.poll(POLL_INTERVAL):
+                    try:
+                        kind, value = receiver.recv()
+                    except EOFError:
+                        self._finish(job, FAILED, error="Worker process exited unexpectedly.")
+                        break
+                    if kind == "progress":
+                        with job._changed:
+                            job.events.append(value)
+                            job._changed.notify_all()
+                    else:
+                        if kind == "result":
+                            self._finish(job, DONE, result=value)
+                        else:
+                            self._finish(job, FAILED, error=value)
+                        break
+                if job._cancel.is_set():
+                    self._finish(job, CANCELLED)
+                    break
+                if deadline is not None and time.time() > deadline:
+                    self._finish(job, TIMEOUT, error=f"Job exceeded the time limit of {job.timeout} seconds.")
+                    break
+        finally:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+            receiver.close()
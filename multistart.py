@@ -0,0 +1,165 @@
+import functools
+import os
+import warnings
+
+import numpy as np
+
+import jobs
+from core_runner import get_system
+
+SAMPLING_METHODS = ('uniform', 'lhs', 'sobol')
+
+
+def sample_starts(n_starts, variables, method='uniform', low=0.0, high=2.0, seed=None):
+    '''Draws start points for a multistart solve.
+
+    Parameters:
+    - n_starts: number of start points.
+    - variables: variable names (one column each).
+    - method: 'uniform' (independent uniform draws, as the solvers use for
+      missing guesses), 'lhs' (Latin hypercube) or 'sobol' (scrambled Sobol sequence).
+    - low, high: bounds of the sampled box, scalars or one value per variable.
+    - seed: optional random seed.
+
+    Returns:
+    - List of dictionaries of variable name -> start value.
+    '''
+    d = len(variables)
+    if method == 'uniform':
+        unit = np.random.default_rng(seed).random((n_starts, d))
+    elif method in ('lhs', 'sobol'):
+        from scipy.stats import qmc
+        sampler = qmc.LatinHypercube(d, seed=seed) if method == 'lhs' else qmc.Sobol(d, seed=seed)
+        with warnings.catch_warnings():
+            # Sobol balance warning for sample sizes that are not powers of two
+            warnings.simplefilter("ignore", UserWarning)
+            unit = sampler.random(n_starts)
+    else:
+        raise ValueError(f"Unknown sampling method '{method}'. Choose one of {SAMPLING_METHODS}.")
+    points = np.asarray(low) + unit * (np.asarray(high) - np.asarray(low))
+    return [dict(zip(variables, row.tolist())) for row in points]
+
+
+def _solve_start(solver_name, equations, constants_text, options, guess):
+    '''Solves from one start point; runs inside a worker process.'''
+    # Registered per process, so each worker compiles the system only once
+    system = get_system(solver_name, equations, constants_text, **options)
+    try:
+        answers = system.solve(guess)
+    except Exception as e:
+        return {"success": False, "error": str(e), "initial_guess": guess}
+    x = [float(answers["solution_dict"][var]) for var in system.variables]
+    norm = float(np.linalg.norm(system.residual(x)))
+    return {
+        "success": bool(np.isfinite(norm)),
+        "solution_dict": dict(zip(system.variables, x)),
+        "residual_norm": norm,
+        "initial_guess": guess,
+        "log": answers["log"],
+    }
+
+
+def _same_root(a, b, tol):
+    a, b = np.asarray(a), np.asarray(b)
+    return bool(np.all(np.abs(a - b) <= tol * (1 + np.abs(b))))
+
+
+def distinct_roots(results, variables, tol=1e-6):
+    '''Groups converged results whose solutions agree to a relative tolerance.
+
+    Returns:
+    - List of dictionaries with "solution_dict", "residual_norm" (best in the
+      group) and "count", sorted by residual norm.
+    '''
+    roots = []
+    for result in sorted(results, key=lambda r: r["residual_norm"]):
+        x = [result["solution_dict"][var] for var in variables]
+        for root in roots:
+            if _same_root(x, root["x"], tol):
+                root["count"] += 1
+                break
+        else:
+            roots.append({"x": x, "solution_dict": result["solution_dict"],
+                          "residual_norm": result["residual_norm"], "count": 1})
+    for root in roots:
+        del root["x"]
+    return roots
+
+
+def multistart(solver_name, equations, constants_text=None, n_starts=16, workers=None,
+               sampling='uniform', tol=1e-6, stop_on_first=True, dedup_tol=1e-6,
+               bounds=(0.0, 2.0), seed=None, initial_guess=None, **options):
+    '''Solves a system from many start points in parallel.
+
+    Parameters:
+    - solver_name: 'numpy', 'scipyroot', 'scipyls' or 'gekko'.
+    - equations: list of equations as strings.
+    - constants_text: optional contents of a constants file.
+    - n_starts: number of start points K.
+    - workers: number of worker processes (default: os.cpu_count()); 1 solves
+      in the current process.
+    - sampling: 'uniform', 'lhs' or 'sobol'.
+    - tol: residual norm a solution must reach to count as converged.
+    - stop_on_first: stop once one start converges; the worker processes are
+      terminated, so starts already running stop too.
+    - dedup_tol: relative tolerance for treating two roots as the same.
+    - bounds: (low, high) of the start box.
+    - seed: random seed for the start points.
+    - initial_guess: optional dictionary of fixed values; these variables are
+      not sampled.
+    - options: passed to the solver's solution() (e.g. backend='cse').
+
+    Returns:
+    - Dictionary with "solution_dict" and "log" of the best converged start,
+      "roots" (distinct converged roots), "starts" (starts completed),
+      "converged" and "cancelled" (starts not completed) counts. Raises
+      ValueError if no start converges.
+    '''
+    system = get_system(solver_name, equations, constants_text, **options)
+    fixed = initial_guess or {}
+    sampled = [var for var in system.variables if var not in fixed]
+    starts = [{**fixed, **guess} for guess in
+              sample_starts(n_starts, sampled, sampling, bounds[0], bounds[1], seed)]
+
+    workers = workers or os.cpu_count() or 1
+    results = []
+    cancelled = 0
+    if workers == 1:
+        for guess in starts:
+            results.append(_solve_start(solver_name, equations, constants_text, options, guess))
+            if stop_on_first and results[-1]["success"] and results[-1]["residual_norm"] <= tol:
+                cancelled = len(starts) - len(results)
+                break
+    else:
+        # Compile before the pool starts, so forked workers inherit the compiled functions
+        system.compiled
+        solve_start = functools.partial(_solve_start, solver_name, equations, constants_text, options)
+        # Leaving the with block terminates the workers, including starts still running
+        with jobs.process_context().Pool(processes=min(workers, len(starts))) as pool:
+            for result in pool.imap_unordered(solve_start, starts):
+                results.append(result)
+                if stop_on_first and result["success"] and result["residual_norm"] <= tol:
+                    cancelled = len(starts) - len(results)
+                    break
+
+    converged = [r for r in results if r["success"] and r["residual_norm"] <= tol]
+    failed = len(results) - len(converged)
+    summary = (f"\nMultistart ({sampling}, {len(starts)} starts): {len(results)} completed, "
+               f"{len(converged)} converged, {failed} failed, {cancelled} cancelled")
+    if not converged:
+        errors = sorted({r.get("error", "residual above tolerance") for r in results})
+        raise ValueError(summary.strip() + ". Errors: " + "; ".join(errors))
+
+    roots = distinct_roots(converged, system.variables, dedup_tol)
+    best = min(converged, key=lambda r: r["residual_norm"])
+    summary += f"\nDistinct roots: {len(roots)}"
+    for k, root in enumerate(roots, 1):
+        summary += f"\nRoot {k}: found {root['count']} times, residual norm {root['residual_norm']:.4e}"
+    return {
+        "solution_dict": best["solution_dict"],
+        "log": summary + "\n\nBest start:\n" + best["log"],
+        "roots": roots,
+        "starts": len(results),
+        "converged": len(converged),
+        "cancelled": cancelled,
+    }
@@ -0,0 +1,288 @@
+import time
+import warnings
+
+import numpy as np
+import scipy.linalg
+
+GLOBALIZATIONS = (None, 'armijo', 'dogleg')
+JACOBIAN_UPDATES = ('newton', 'chord', 'shamanskii', 'broyden')
+
+# Armijo sufficient-decrease constant and smallest step length tried
+ARMIJO_C = 1e-4
+MIN_STEP = 1e-6
+# Trust-region acceptance and radius update thresholds
+ACCEPT_RATIO = 1e-4
+SHRINK_RATIO = 0.25
+EXPAND_RATIO = 0.75
+# Initial trust radius relative to the scaled starting point (as in MINPACK)
+TRUST_FACTOR = 100.0
+
+SINGULAR = "Jacobian is singular. Cannot proceed."
+
+
+class FactoredJacobian:
+    '''A factorized Jacobian, optionally corrected by Broyden rank-one updates.
+
+    The matrix in use is B = J + sum(u_k v_k^T). Solves with B reuse the one
+    factorization of J through the Sherman-Morrison formula, so an update
+    costs two vectors and no refactorization.
+
+    Parameters:
+    - J: dense ndarray or scipy.sparse matrix.
+    - linear_solver: 'direct' (LU; sparse LU for sparse J) or a Krylov method
+      from sparse_jacobian.KRYLOV_METHODS, which solves with J directly.
+    '''
+    def __init__(self, J, linear_solver='direct'):
+        self.J = J
+        self.sparse = not isinstance(J, np.ndarray)
+        self.linear_solver = linear_solver
+        self.factorizations = 0
+        self._updates = []
+        if linear_solver != 'direct':
+            return
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            try:
+                if self.sparse:
+                    from scipy.sparse import linalg as splinalg
+                    self._lu = splinalg.splu(J.tocsc())
+                else:
+                    self._lu = scipy.linalg.lu_factor(J)
+            except (RuntimeError, Warning, ValueError):
+                raise ValueError(SINGULAR)
+        self.factorizations = 1
+
+    @property
+    def n_updates(self):
+        return len(self._updates)
+
+    def _base_solve(self, rhs):
+        if self.linear_solver != 'direct':
+            import sparse_jacobian
+            self.factorizations += 1  # incomplete LU preconditioner
+            return sparse_jacobian.solve(self.J, rhs, method=self.linear_solver)
+        if self.sparse:
+            return self._lu.solve(rhs)
+        return scipy.linalg.lu_solve(self._lu, rhs)
+
+    def solve(self, rhs):
+        '''Solves B @ x = rhs.'''
+        x = self._base_solve(rhs)
+        for u, v, w, denominator in self._updates:
+            x = x - w * (v @ x) / denominator
+        if not np.all(np.isfinite(x)):
+            raise ValueError(SINGULAR)
+        return x
+
+    def matvec(self, s):
+        out = self.J @ s
+        for u, v, _, _ in self._updates:
+            out = out + u * (v @ s)
+        return out
+
+    def rmatvec(self, F):
+        out = self.J.T @ F
+        for u, v, _, _ in self._updates:
+            out = out + v * (u @ F)
+        return out
+
+    def update(self, s, dF):
+        '''Applies the ("good") Broyden update for step s and residual change dF.
+
+        Returns False, leaving B unchanged, when the update would make B singular.
+        '''
+        ss = s @ s
+        if ss == 0:
+            return False
+        u = (dF - self.matvec(s)) / ss
+        w = self.solve(u)
+        denominator = 1 + s @ w
+        if abs(denominator) < 1e-12:
+            return False
+        self._updates.append((u, s, w, denominator))
+        return True
+
+
+def _column_norms(J):
+    if isinstance(J, np.ndarray):
+        return np.linalg.norm(J, axis=0)
+    return np.sqrt(np.asarray(J.multiply(J).sum(axis=0)).ravel())
+
+
+def _dogleg(factor, F, radius, scale):
+    '''Dogleg step for the model 0.5 * ||F + B p||^2 within ||scale * p|| <= radius.
+
+    Working in the scaled variables scale * p (MINPACK's column-norm scaling)
+    keeps the trust region meaningful when variables differ by orders of magnitude.
+    '''
+    p_newton = factor.solve(-F)
+    if np.linalg.norm(scale * p_newton) <= radius:
+        return p_newton
+    # Steepest descent direction and Cauchy point in the scaled variables
+    g = factor.rmatvec(F) / scale
+    Bg = factor.matvec(g / scale)
+    gg = g @ g
+    if gg == 0 or Bg @ Bg == 0:
+        return p_newton * (radius / np.linalg.norm(scale * p_newton))
+    p_cauchy = -(gg / (Bg @ Bg)) * g
+    if np.linalg.norm(p_cauchy) >= radius:
+        return -(radius / np.sqrt(gg)) * g / scale
+    # Point where the path from the Cauchy point to the Newton point leaves the region
+    d = scale * p_newton - p_cauchy
+    a, b, c = d @ d, 2 * (p_cauchy @ d), p_cauchy @ p_cauchy - radius ** 2
+    tau = (-b + np.sqrt(b * b - 4 * a * c)) / (2 * a)
+    return (p_cauchy + tau * d) / scale
+
+
+def solve(residual, jacobian, x0, tol=1e-6, max_iter=50, globalization=None, jacobian_update='newton',
+          refresh_every=3, stall_ratio=0.5, max_updates=20, linear_solver='direct', log=None):
+    '''Newton's method with optional globalization and Jacobian reuse.
+
+    Parameters:
+    - residual: callable x -> F(x).
+    - jacobian: callable x -> J(x), a dense ndarray or scipy.sparse matrix.
+    - x0: starting point.
+    - tol: residual norm at which the iteration stops.
+    - max_iter: maximum number of iterations.
+    - globalization: None (full Newton steps), 'armijo' (backtracking line
+      search on ||F||) or 'dogleg' (trust region on 0.5 * ||F||^2).
+    - jacobian_update: how the Jacobian is kept between iterations:
+      'newton' evaluates and factorizes it every iteration; 'chord' keeps the
+      factorization until progress stalls; 'shamanskii' refreshes it every
+      refresh_every iterations or when progress stalls; 'broyden' applies
+      rank-one updates to the factorized Jacobian and refreshes it when
+      progress stalls or after max_updates updates.
+    - stall_ratio: a step that does not reduce ||F|| by this factor counts as a
+      stall and triggers a Jacobian refresh (not used by 'newton').
+    - linear_solver: 'direct' or a sparse Krylov method (sparse Jacobians only).
+    - log: optional progress.SolveLog for per-iteration output and callbacks.
+
+    Returns:
+    - Dictionary with "x", "F", "iterations", "function_evaluations",
+      "jacobian_evaluations", "factorizations" and "wall_time".
+    Raises ValueError if the Jacobian is singular or the iteration fails.
+    '''
+    if globalization not in GLOBALIZATIONS:
+        raise ValueError(f"Unknown globalization '{globalization}'. Choose one of {GLOBALIZATIONS}.")
+    if jacobian_update not in JACOBIAN_UPDATES:
+        raise ValueError(f"Unknown Jacobian update '{jacobian_update}'. Choose one of {JACOBIAN_UPDATES}.")
+
+    start = time.perf_counter()
+    counts = {"function_evaluations": 0, "jacobian_evaluations": 0, "factorizations": 0}
+
+    def evaluate(x):
+        counts["function_evaluations"] += 1
+        return np.asarray(residual(x), dtype=np.float64)
+
+    x = np.array(x0, dtype=np.float64)
+    F = evaluate(x)
+    norm = np.linalg.norm(F)
+    factor = None
+    current = False  # factor was evaluated at x (no step accepted since)
+    stale = True
+    age = 0
+    radius = None
+    scale = np.ones_like(x)
+    step_norm = None
+    iteration = 0
+
+    def finished():
+        if factor is not None:
+            counts["factorizations"] += factor.factorizations
+        return {"x": x, "F": F, "iterations": iteration, **counts,
+                "wall_time": time.perf_counter() - start}
+
+    while True:
+        if log is not None:
+            log.iteration(iteration, norm, step_norm)
+        if norm < tol:
+            if log is not None:
+                log.print(f"\nConverged in {iteration} iterations")
+            return finished()
+        if not np.isfinite(norm):
+            raise ValueError("Residuals are not finite at the current point; "
+                             "try another initial guess or a globalization.")
+        if iteration >= max_iter:
+            raise ValueError("Newton method did not converge within the maximum number of iterations.")
+
+        # After a rejected step x has not moved, so a Jacobian evaluated there is kept
+        refresh = factor is None or not current and (
+            stale or jacobian_update == 'newton'
+            or (jacobian_update == 'shamanskii' and age >= refresh_every)
+            or (jacobian_update == 'broyden' and factor.n_updates >= max_updates))
+        if refresh:
+            J = jacobian(x)
+            counts["jacobian_evaluations"] += 1
+            if J.shape[0] != J.shape[1]:
+                raise ValueError(f"Newton's method needs a square system, got {J.shape[0]} equations "
+                                 f"and {J.shape[1]} variables.")
+            if factor is not None:
+                counts["factorizations"] += factor.factorizations
+            factor = FactoredJacobian(J, linear_solver)
+            if globalization == 'dogleg':
+                norms = _column_norms(J)
+                scale = np.maximum(scale, np.where(norms > 0, norms, 1.0))
+                if radius is None:
+                    radius = TRUST_FACTOR * (np.linalg.norm(scale * x) or 1.0)
+            stale = False
+            current = True
+            age = 0
+        age += 1
+
+        accepted = True
+        if globalization == 'dogleg':
+            p = _dogleg(factor, F, radius, scale)
+            predicted = 0.5 * (norm ** 2 - np.linalg.norm(F + factor.matvec(p)) ** 2)
+            F_new = evaluate(x + p)
+            norm_new = np.linalg.norm(F_new)
+            ratio = 0.5 * (norm ** 2 - norm_new ** 2) / predicted if predicted > 0 else -1.0
+            p_norm = np.linalg.norm(scale * p)
+            if ratio < SHRINK_RATIO:
+                radius = SHRINK_RATIO * p_norm
+            elif ratio > EXPAND_RATIO and p_norm >= 0.99 * radius:
+                radius = 2 * radius
+            accepted = ratio > ACCEPT_RATIO and np.isfinite(norm_new)
+            step_info = f"trust radius {radius:.4e}" + ("" if accepted else ", step rejected")
+            if not accepted and radius < 1e-12 * max(1.0, np.linalg.norm(scale * x)):
+                raise ValueError("Trust region collapsed; no descent step found.")
+        else:
+            p = factor.solve(-F)
+            alpha = 1.0
+            F_new = evaluate(x + p)
+            norm_new = np.linalg.norm(F_new)
+            if globalization == 'armijo':
+                while not (norm_new <= (1 - ARMIJO_C * alpha) * norm):
+                    alpha *= 0.5
+                    if alpha < MIN_STEP:
+                        accepted = False
+                        break
+                    F_new = evaluate(x + alpha * p)
+                    norm_new = np.linalg.norm(F_new)
+                if accepted:
+                    p = alpha * p
+                elif current:
+                    raise ValueError("Line search failed to reduce the residual.")
+            step_info = f"step length {alpha:g}" if accepted else "line search failed"
+
+        if log is not None:
+            log.print(f"\nIteration {iteration + 1}:")
+            log.print(" Residuals: ", np.round(F, 6))
+            log.print(" Residual Norm: ", norm)
+            log.print(f" Jacobian: {'evaluated' if refresh else 'reused'}, {step_info}")
+
+        iteration += 1
+        if not accepted:
+            # A rejected step with a reused Jacobian is retried with a fresh one
+            stale = stale or not current
+            step_norm = 0.0
+            continue
+
+        if jacobian_update == 'broyden':
+            if not factor.update(p, F_new - F):
+                stale = True
+        if norm_new > stall_ratio * norm and jacobian_update != 'newton':
+            stale = True
+        x = x + p
+        current = False
+        F, norm = F_new, norm_new
+        step_norm = np.linalg.norm(p)
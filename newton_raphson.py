@@ -1,87 +1,56 @@
 import numpy as np
-import sympy as sp
-import ast
-import re
 import random
-import io
-import contextlib
-import math
+import frontend
+import profiling
+import progress
+import system_cache
 random.seed(42)
 
-class Solution:
-    def __init__(self):
-        self.equations = []
-        self.variables = []
-        self.coefficients = {}
-        self.constantspath = None
-
-    def process_equations(self, equations):
-        return [eq.split('=')[0].strip() for eq in equations]
-
-    def parse_constants_file(self):
-        if self.constantspath:
-            filepath = self.constantspath
-            with open(filepath, 'r') as file:
-                lines = file.readlines()
-
-            # First, preprocess lines to strip comments and empty lines
-            cleaned_lines = []
-            for line in lines:
-                line = line.split('#', 1)[0].strip()  # remove comment and trim
-                if line:  # skip empty lines
-                    cleaned_lines.append(line)
-
-            # Allowed math functions/constants
-            safe_math = {
-                'sqrt': math.sqrt,
-                'sin': math.sin,
-                'cos': math.cos,
-                'tan': math.tan,
-                'log': math.log,  # natural log
-                'ln': math.log,   # alias for natural log
-                'exp': math.exp,
-                'pi': math.pi,
-                'e': math.e
-            }
-
-            # Evaluate constants in order; constants may depend on previous ones
-            for line in cleaned_lines:
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    try:
-                        # Combine safe math functions with previously defined constants
-                        self.coefficients[key] = eval(value, {"__builtins__": {}}, {**safe_math, **self.coefficients})
-                    except Exception as e:
-                        raise ValueError(f"Invalid expression for '{key}': '{value}' → {e}")
-
-    def get_variables(self, equations):
-        self.parse_constants_file()
-        var_pattern = re.compile(r'\b[a-zA-Z_][a-zA-Z0-9_]*\b')
-        to_remove = set(['sin', 'cos', 'tan', 'sqrt', 'log', 'ln', 'exp', 'pi']) | set(self.coefficients.keys())
-        variables = set()
-        for eq in equations:
-            for var in var_pattern.findall(eq):
-                if var not in to_remove:
-                    variables.add(var)
-        self.variables = list(variables)
-
-    def create_symbolic_system(self, equations):
-        equations = self.process_equations(equations)
-        self.get_variables(equations)
-        sym_vars = sp.symbols(self.variables)
-        var_map = dict(zip(self.variables, sym_vars))
-        sym_table = {**var_map, **{k: sp.sympify(v) for k, v in self.coefficients.items()}}
-        sym_eqs = [sp.sympify(eq_str, locals=sym_table) for eq_str in equations]
-        jacobian = sp.Matrix(sym_eqs).jacobian(sym_vars)
+# Arithmetic of batch_solution: float64 throughout, or float32 with float64 refinement
+PRECISIONS = ('double', 'mixed')
+# Rows per batched linear solve in batch_solution; their dense Jacobians are the largest buffer
+SOLVE_CHUNK = 1024
+
+class Solution(frontend.FrontEnd):
+    def solution(self, equations, initial_guess=None, tol=1e-6, max_iter=50, sparse=False,
+                 linear_solver='direct', backend='lambdify', callback=None, globalization=None,
+                 jacobian_update='newton', refresh_every=3):
+        '''Parameters:
+        - equations: list of equations as strings.
+        - initial_guess: optional dictionary of variable name -> starting value.
+        - tol: residual norm at which the iteration stops.
+        - max_iter: maximum number of Newton steps.
+        - sparse: evaluate the Jacobian in CSR form and solve with scipy.sparse.linalg.
+        - linear_solver: sparse linear solver, 'direct' or a Krylov method
+          ('gmres', 'lgmres', 'bicgstab'). Ignored when sparse is False.
+        - backend: 'lambdify', or 'cse' to evaluate residuals and Jacobian in
+          one common-subexpression-eliminated function per iteration, or 'ad'
+          to skip SymPy and evaluate a NumPy tape with a forward-mode Jacobian.
+        - callback: optional callable receiving a dictionary per iteration with
+          "iteration", "residual_norm", "step_norm" and "elapsed".
+        - globalization: None for full Newton steps, 'armijo' for a
+          backtracking line search or 'dogleg' for a trust region.
+        - jacobian_update: 'newton' (fresh Jacobian every iteration), 'chord'
+          or 'shamanskii' (reuse the LU factors until progress stalls, or every
+          refresh_every iterations for 'shamanskii') or 'broyden' (rank-one
+          updates of the factorized Jacobian). See newton_engine.solve.
+        - refresh_every: Jacobian refresh interval for 'shamanskii'.
 
-        f_lambdified = sp.lambdify(sym_vars, sym_eqs, modules='numpy')
-        jac_lambdified = sp.lambdify(sym_vars, jacobian, modules='numpy')
-        return f_lambdified, jac_lambdified, sym_vars
+        Returns:
+        - Dictionary with "solution_dict", "log", "function_evaluations",
+          "jacobian_evaluations", "factorizations", "wall_time" and "timings"
+          (seconds per phase, see profiling.Timings).
+        '''
+        import newton_engine
 
-    def solution(self, equations, initial_guess=None, tol=1e-6, max_iter=50):
-        f_lambdified, jac_lambdified, sym_vars = self.create_symbolic_system(equations)
+        self.timings = profiling.Timings()
+        f_lambdified, variables = self.create_symbolic_system(equations, backend=backend)
+        compiled = self.compiled
+        jac_lambdified = compiled.jac
+        fused = compiled.fused is not None
+        if sparse:
+            import sparse_jacobian
+            jac_lambdified = sparse_jacobian.CSRJacobian(compiled)
 
         if initial_guess is None:
             x = np.random.uniform(0, 2, size=len(self.variables))
@@ -93,45 +62,244 @@ class Solution:
                 else:
                     x.append(random.uniform(0, 2))
 
-        output_log = io.StringIO()
-        with contextlib.redirect_stdout(output_log):
-            print("\nSolving using Newton's Raphson Method:")
-            print("\nInitial Guess Used:")
-            for var, val in zip(self.variables, x):
-                print(f" {var} = {val:.4f}")
+        log = progress.SolveLog(callback)
+        log.print("\nSolving using Newton's Raphson Method:")
+        if sparse:
+            log.print(f"Sparse Jacobian: {jac_lambdified.nnz} nonzeros, linear solver: {linear_solver}")
+        if globalization or jacobian_update != 'newton':
+            log.print(f"Globalization: {globalization or 'none'}, Jacobian update: {jacobian_update}")
+        log.print("\nInitial Guess Used:")
+        for var, val in zip(self.variables, x):
+            log.print(f" {var} = {val:.4f}")
 
-            for iteration in range(max_iter):
-                F = np.array(f_lambdified(*x), dtype=np.float64)
-                J = np.array(jac_lambdified(*x), dtype=np.float64)
+        # Preallocated outputs for the fused residual/Jacobian evaluation
+        F_buffer = np.empty(compiled.n_equations)
+        J_values = np.empty(compiled.nnz)
 
-                if np.linalg.norm(F) < tol:
-                    print(f"\nConverged in {iteration} iterations")
-                    break
+        def residual(x):
+            return np.array(f_lambdified(*x), dtype=np.float64)
 
-                try:
-                    delta = np.linalg.solve(J, -F)
-                except np.linalg.LinAlgError:
-                    raise ValueError("Jacobian is singular. Cannot proceed.")
+        def jacobian(x):
+            if fused:
+                values = compiled.evaluate(x, F_buffer, J_values)[1]
+            else:
+                values = compiled.jac_entries(*x)
+            if sparse:
+                return jac_lambdified.from_values(values)
+            J = np.zeros((compiled.n_equations, len(self.variables)))
+            J[compiled.jac_rows, compiled.jac_cols] = values
+            return J
 
-                x += delta
+        with self.timings.span("iterations"):
+            result = newton_engine.solve(residual, jacobian, x, tol=tol, max_iter=max_iter,
+                                         globalization=globalization, jacobian_update=jacobian_update,
+                                         refresh_every=refresh_every,
+                                         linear_solver=linear_solver if sparse else 'direct', log=log)
+        x, F = result["x"], result["F"]
 
-                print(f"\nIteration {iteration + 1}:")
-                print(" Residuals: ", np.round(F, 6))
-                print(" Residual Norm: ", np.linalg.norm(F))
+        log.print("\nFinal Solution:")
+        for var, val in zip(variables, x):
+            log.print(f" {var} = {val:.6f}")
 
-            else:
-                raise ValueError("Newton method did not converge within the maximum number of iterations.")
+        log.print("\nResiduals:")
+        for i, res in enumerate(F):
+            log.print(f"Eq{i+1}: {res:.6e}")       
+        log.print(f"\nFinal Residual Norm: {np.linalg.norm(F):.4e}")
+        log.print(f"Function Evaluations: {result['function_evaluations']}")
+        log.print(f"Jacobian Evaluations: {result['jacobian_evaluations']}")
+        log.print(f"Factorizations: {result['factorizations']}")
+        log.print(f"Wall Time: {result['wall_time']:.4f} seconds")
 
-            print("\nFinal Solution:")
-            for var, val in zip(sym_vars, x):
-                print(f" {var} = {val:.6f}")
+        return {
+            "solution_dict": {str(var): val for var, val in zip(variables, x)},
+            "log": log.getvalue(),
+            "function_evaluations": result["function_evaluations"],
+            "jacobian_evaluations": result["jacobian_evaluations"],
+            "factorizations": result["factorizations"],
+            "wall_time": result["wall_time"],
+            "timings": self.timings.as_dict(),
+        }
+
+    def batch_solution(self, equations, initial_guesses, constants=None, constant_names=None,
+                       variables=None, tol=1e-6, max_iter=50, precision='double', output=None):
+        '''Runs Newton's method on many starting points / parameter sets at once.
 
-            print("\nResiduals:")
-            for i, res in enumerate(F):
-                print(f"Eq{i+1}: {res:.6e}")       
-            print(f"\nFinal Residual Norm: {np.linalg.norm(F):.4e}")
+        Parameters:
+        - equations: list of equations as strings.
+        - initial_guesses: (N, n_vars) array of starting points, or a single
+          (n_vars,) point shared by every row.
+        - constants: optional (N, n_params) array of constant values; column k
+          overrides the constant named constant_names[k]. Constants derived
+          from an overridden one are recomputed per row.
+        - constant_names: names of the overridden constants.
+        - variables: order of the columns of initial_guesses (and of the
+          returned solutions); defaults to self.variables.
+        - precision: 'double', or 'mixed' to evaluate residuals and Jacobian
+          entries in float32, halving their memory traffic. A row's residuals switch
+          to float64 once its float32 residual norm stops halving; the float32
+          Jacobian then refines the solution to float64 accuracy (iterative
+          refinement), and only float64 residuals count towards tol.
+        - output: optional result store directory (see result_store.py) the rows
+          are appended to: one column per variable and overridden constant,
+          plus "residual_norm", "iterations" and "converged". Solving a large
+          set in slices into the same store keeps only one slice in memory.
+
+        Returns:
+        - Dictionary with "variables", "solutions" (N, n_vars), "iterations" (N,),
+          "converged" (N,) and "residual_norms" (N,).
+        '''
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}'. Choose one of {list(PRECISIONS)}.")
+        equations = self.process_equations(equations)
+        self.get_variables(equations)
+        if variables is None:
+            variables = list(self.variables)
+        elif sorted(variables) != sorted(self.variables):
+            raise ValueError(f"Variables must be a permutation of {sorted(self.variables)}")
+
+        guesses = np.atleast_2d(np.asarray(initial_guesses, dtype=np.float64))
+        n_rows = guesses.shape[0]
+        overrides = {}
+        if constants is not None:
+            if not constant_names:
+                raise ValueError("constant_names is required when constants are given.")
+            constants = np.asarray(constants, dtype=np.float64)
+            if n_rows == 1:
+                n_rows = constants.shape[0]
+            constants = constants.reshape(n_rows, len(constant_names))
+            overrides = {name: constants[:, k] for k, name in enumerate(constant_names)}
+        if guesses.shape[1] != len(variables):
+            raise ValueError(f"Expected {len(variables)} columns of initial guesses, got {guesses.shape[1]}.")
+        guesses = np.broadcast_to(guesses, (n_rows, len(variables)))
+
+        # Every constant is a parameter, so the entry is shared with the other solves of the system;
+        # constants that do not vary across rows are broadcast
+        values = self.evaluate_constants(overrides) if overrides else dict(self.coefficients)
+        parameters = self.system.constants(values)
+        compiled = system_cache.get_compiled(equations, self.variables, {k: values[k] for k in parameters},
+                                             jacobian=True, parameters=parameters)
+        self.variables = compiled.variables
+        n_eqs, n_vars = compiled.n_equations, len(compiled.variables)
+        if n_eqs != n_vars:
+            raise ValueError(f"Batch Newton needs a square system, got {n_eqs} equations and {n_vars} variables.")
+
+        # Rows are columns of (n, N) arrays, the layout the compiled functions broadcast over. The
+        # active rows are packed at the front, so each iteration evaluates into views of these
+        # buffers instead of allocating its residuals and Jacobian entries
+        mixed = precision == 'mixed'
+        dtype = np.float32 if mixed else np.float64
+        order = [variables.index(v) for v in compiled.variables]
+        x = np.array(guesses[:, order].T, dtype=np.float64)
+        # Constants shared by every row are passed as numbers, only the others per row
+        args = [float(values[name]) if np.ndim(values[name]) == 0 else None for name in compiled.parameters]
+        varying = [k for k, value in enumerate(args) if value is None]
+        params = np.empty((len(varying), n_rows))
+        for j, k in enumerate(varying):
+            params[j] = values[compiled.parameters[k]]
+        F = np.empty((n_eqs, n_rows))
+        J_entries = np.empty((compiled.nnz, n_rows), dtype=dtype)
+        # Dense Jacobians exist only for one chunk of rows at a time; only the nonzero pattern is written
+        J = np.zeros((min(SOLVE_CHUNK, n_rows), n_eqs, n_vars))
+        per_row = [x, params, F, J_entries]
+        if mixed:
+            # Constants stay float64 for the refining residuals; the float32 evaluation gets a copy
+            params_low = params.astype(np.float32)
+            per_row.append(params_low)
+            x_low = np.empty((n_vars, n_rows), dtype=np.float32)
+            F_low = np.empty((n_eqs, n_rows), dtype=np.float32)
+            F_refine = np.empty((n_eqs, n_rows))
+            refine = np.zeros(n_rows, dtype=bool)  # rows whose residuals are evaluated in float64
+            previous = np.full(n_rows, np.inf)  # last float32 residual norm of each row
+            per_row += [refine, previous]
+
+        rows = np.arange(n_rows)  # original row of each packed column
+        solutions = np.empty((n_rows, n_vars))
+        iterations = np.full(n_rows, max_iter, dtype=np.int64)
+        converged = np.zeros(n_rows, dtype=bool)
+        norms = np.full(n_rows, np.inf)
+
+        def pack(keep):
+            # Moves the columns in keep to the front of every per-row buffer; returns the new count
+            if keep.size < m:
+                for array in per_row:
+                    array[..., :keep.size] = array[..., keep]
+                rows[:keep.size] = rows[keep]
+            return keep.size
+
+        def parameters(columns, low=False):
+            source = params_low if low else params
+            for j, k in enumerate(varying):
+                args[k] = source[j, columns]
+            return args
+
+        m = n_rows
+        # Rows that overflow or turn nan are dropped, so their warnings are noise
+        with np.errstate(all='ignore'):
+            for iteration in range(max_iter + 1):
+                if m == 0:
+                    break
+                if mixed:
+                    np.copyto(x_low[:, :m], x[:, :m], casting='same_kind')
+                    compiled.evaluate(x_low[:, :m], F_low[:, :m], J_entries[:, :m],
+                                     parameters(slice(0, m), low=True))
+                    F[:, :m] = F_low[:, :m]
+                    r = np.flatnonzero(refine[:m])
+                    if r.size:
+                        compiled.residuals_into(x[:, r], F_refine[:, :r.size], parameters(r))
+                        F[:, r] = F_refine[:, :r.size]
+                else:
+                    compiled.evaluate(x[:, :m], F[:, :m], J_entries[:, :m], parameters(slice(0, m)))
+                row_norms = np.linalg.norm(F[:, :m], axis=0)
+                norms[rows[:m]] = row_norms
+                done = row_norms < tol
+                if mixed:
+                    done &= refine[:m]
+                    refine[:m] |= (row_norms < tol) | (row_norms > 0.5 * previous[:m])
+                    previous[:m] = row_norms
+                converged[rows[:m][done]] = True
+                iterations[rows[:m][done]] = iteration
+                # Rows that blew up are dropped rather than iterated further
+                keep = ~done & np.isfinite(row_norms)
+                solutions[rows[:m][~keep]] = x[:, :m][:, ~keep].T
+                m = pack(np.flatnonzero(keep))
+                if m == 0 or iteration == max_iter:
+                    break
+
+                delta = np.empty((m, n_vars))
+                singular = np.zeros(m, dtype=bool)
+                for start in range(0, m, SOLVE_CHUNK):
+                    stop = min(start + SOLVE_CHUNK, m)
+                    J_chunk = J[:stop - start]
+                    J_chunk[:, compiled.jac_rows, compiled.jac_cols] = J_entries[:, start:stop].T
+                    try:
+                        delta[start:stop] = np.linalg.solve(J_chunk, -F[:, start:stop].T[..., None])[..., 0]
+                    except np.linalg.LinAlgError:
+                        # A singular row fails the whole batched call; retry row by row and drop the singular ones
+                        for k in range(start, stop):
+                            try:
+                                delta[k] = np.linalg.solve(J_chunk[k - start], -F[:, k])
+                            except np.linalg.LinAlgError:
+                                singular[k] = True
+                if singular.any():
+                    solutions[rows[:m][singular]] = x[:, :m][:, singular].T
+                    delta = delta[~singular]
+                    m = pack(np.flatnonzero(~singular))
+                x[:, :m] += delta.T
+        solutions[rows[:m]] = x[:, :m].T
 
+        results = np.empty_like(solutions)
+        results[:, order] = solutions
+        if output is not None:
+            import result_store
+            columns = dict(zip(variables, results.T))
+            columns.update(overrides)
+            columns.update(residual_norm=norms, iterations=iterations, converged=converged)
+            with result_store.ResultStore(output) as store:
+                store.extend(columns)
         return {
-            "solution_dict": {str(var): val for var, val in zip(sym_vars, x)},
-            "log": output_log.getvalue()  
+            "variables": variables,
+            "solutions": results,
+            "iterations": iterations,
+            "converged": converged,
+            "residual_norms": norms,
         }
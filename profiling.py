@@ -0,0 +1,70 @@
+import contextlib
+import time
+
+
+class Timings:
+    '''Named wall-clock spans for the phases of one solve.
+
+    Spans with the same name accumulate. Nested phases use dotted names
+    ("compile.jacobian" inside "compile"), so the flat dictionary still shows
+    which span contains which. A span costs two perf_counter calls, so the
+    timings are always recorded.
+    '''
+    def __init__(self):
+        self.spans = {}
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[name] = self.spans.get(name, 0.0) + time.perf_counter() - start
+
+    def add(self, spans, prefix=''):
+        '''Adds the spans of another Timings dictionary, e.g. from a sub-solve.'''
+        for name, seconds in spans.items():
+            self.spans[prefix + name] = self.spans.get(prefix + name, 0.0) + seconds
+
+    def as_dict(self):
+        return {name: round(seconds, 6) for name, seconds in self.spans.items()}
+
+
+@contextlib.contextmanager
+def capture(cprofile=False, memory=False, top=25):
+    '''Profiles the enclosed code with cProfile and/or tracemalloc.
+
+    Yields a dictionary that is filled in when the block exits:
+    - "profile": the `top` functions by cumulative time (pstats text).
+    - "memory": {"peak_kb", "top"}: peak traced memory and the `top`
+      allocation sites still alive at the end.
+    With both options off nothing is imported or started.
+    '''
+    report = {}
+    profiler = None
+    if memory:
+        import tracemalloc
+        tracemalloc.start()
+    if cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield report
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            report["memory"] = {
+                "peak_kb": round(peak / 1024, 1),
+                "top": [str(stat) for stat in snapshot.statistics('lineno')[:top]],
+            }
+        if profiler is not None:
+            import io
+            import pstats
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(top)
+            report["profile"] = text.getvalue()
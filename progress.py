@@ -0,0 +1,62 @@
+import io
+import time
+
+import numpy as np
+
+
+class SolveLog:
+    '''Collects one solve's log text and reports its iterations to a callback.
+
+    Every solve gets its own SolveLog, so concurrent solves never mix their
+    output (contextlib.redirect_stdout swaps the process-wide sys.stdout).
+
+    Parameters:
+    - callback: optional callable receiving one dictionary per iteration with
+      "iteration", "residual_norm", "step_norm" (None for the starting point)
+      and "elapsed" (seconds since the solve started). An exception raised by
+      the callback aborts the solve.
+    '''
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.start = time.perf_counter()
+        self._buffer = io.StringIO()
+
+    def print(self, *args, sep=' ', end='\n'):
+        print(*args, sep=sep, end=end, file=self._buffer)
+
+    def getvalue(self):
+        return self._buffer.getvalue()
+
+    def iteration(self, iteration, residual_norm, step_norm=None, **extra):
+        '''Reports one iteration to the callback, if any.'''
+        if self.callback is None:
+            return
+        self.callback({
+            "iteration": int(iteration),
+            "residual_norm": float(residual_norm),
+            "step_norm": None if step_norm is None else float(step_norm),
+            "elapsed": round(time.perf_counter() - self.start, 6),
+            **extra,
+        })
+
+
+class ResidualMonitor:
+    '''Wraps a residual function to report every evaluation as an iteration.
+
+    Used for solvers without a per-iteration hook (MINPACK's hybr and lm):
+    each residual evaluation at a new trial point becomes one event.
+    '''
+    def __init__(self, residual, log):
+        self.residual = residual
+        self.log = log
+        self.evaluations = 0
+        self._last_x = None
+
+    def __call__(self, x):
+        F = self.residual(x)
+        x = np.array(x, dtype=np.float64)
+        step = None if self._last_x is None else np.linalg.norm(x - self._last_x)
+        self.log.iteration(self.evaluations, np.linalg.norm(F), step)
+        self.evaluations += 1
+        self._last_x = x
+        return F
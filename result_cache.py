@@ -0,0 +1,166 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import jobs
+
+
+def result_key(system_id, initial_guesses=None, **options):
+    '''Identifier of one solve: the system (solver, equations, constants and
+    solver options, see core_runner.system_id), the initial guesses and the
+    solve options (decompose, warm start, seed).'''
+    payload = json.dumps([system_id, initial_guesses or {}, options], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class _Flight:
+    '''A solve in flight and the requests waiting for it.'''
+    def __init__(self):
+        self.job = None
+        self.waiters = 0
+        self.ready = threading.Event()  # set once job is submitted (or submitting failed)
+
+
+class ResultCache:
+    '''Results of finished solves, evicted by age and least recent use.
+
+    Identical solves requested while one is in flight share its job instead
+    of starting another (request coalescing); the job's result is cached when
+    it finishes successfully. Sizes are those of the results' JSON encoding.
+
+    Parameters:
+    - max_size: maximum number of results kept.
+    - max_age: results older than this many seconds are discarded (None = never).
+    - max_bytes: maximum total size of the kept results; larger results are not cached.
+    '''
+    def __init__(self, max_size=256, max_age=None, max_bytes=64 * 2**20):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()  # key -> (created, size, result)
+        self._flights = {}  # key -> _Flight
+        self._lock = threading.Lock()
+
+    def _expired(self, created):
+        return self.max_age is not None and time.time() - created > self.max_age
+
+    def _remove(self, key):
+        self.bytes -= self._entries.pop(key)[1]
+
+    def solve(self, key, start):
+        '''Returns (result, job) for a solve: a cached result, or the job computing it.
+
+        On a miss, start() is called to submit a job (see jobs.JobQueue.submit)
+        unless an identical solve is already in flight, whose job is returned
+        instead. Pair every call that returns a job with leave(key, job).
+
+        Returns:
+        - (result, None) on a hit, (None, job) otherwise.
+        '''
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and self._expired(item[0]):
+                self._remove(key)
+                item = None
+            if item is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return item[2], None
+            flight = self._flights.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+            flight.waiters += 1
+        if not owner:
+            flight.ready.wait()
+            if flight.job is None:  # the owner failed to submit; try on our own
+                return self.solve(key, start)
+            return None, flight.job
+        # Submitted outside the lock: the job queue calls back into the cache when a job finishes
+        try:
+            flight.job = start()
+        except BaseException:
+            with self._lock:
+                del self._flights[key]
+            raise
+        finally:
+            flight.ready.set()
+        flight.job.add_done_callback(lambda job: self._finished(key, flight, job))
+        return None, flight.job
+
+    def leave(self, key, job):
+        '''Drops one request waiting for key's solve by job (see solve).
+
+        Returns:
+        - True when no other request waits for the solve, so it may be cancelled.
+        '''
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None or flight.job is not job:  # finished, cancelled, or a later solve of key
+                return True
+            flight.waiters -= 1
+            if flight.waiters > 0:
+                return False
+            # A request arriving now starts a new solve instead of joining one about to be cancelled
+            del self._flights[key]
+            return True
+
+    def cancellable(self, job_id):
+        '''True unless job_id is a solve that several requests wait for (see solve).
+
+        A solve only one request waits for stops being shared, so an identical
+        request arriving next starts a new solve instead of joining the
+        cancelled one.
+        '''
+        with self._lock:
+            for key, flight in self._flights.items():
+                if flight.job is not None and flight.job.id == job_id:
+                    if flight.waiters > 1:
+                        return False
+                    del self._flights[key]
+                    break
+            return True
+
+    def _finished(self, key, flight, job):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if job.status != jobs.DONE:
+                return
+            size = len(json.dumps(job.result).encode())
+            if size > self.max_bytes:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time(), size, job.result)
+            self.bytes += size
+            while len(self._entries) > self.max_size or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = self.hits = self.misses = self.coalesced = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights),
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
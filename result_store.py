@@ -0,0 +1,240 @@
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+INDEX = "index.json"
+FORMAT = 1
+CHUNK_ROWS = 65536
+EXTENSION = ".store"
+
+
+def is_store(path):
+    '''True for paths that name a result store (a directory ending in .store).'''
+    return os.path.splitext(os.path.normpath(path))[1].lower() == EXTENSION
+
+
+def _chunk_name(number):
+    return f"chunk_{number:06d}.npy"
+
+
+def _replace(path, write):
+    '''Calls write(tmp_path) for a temporary file next to path, then renames it to path.'''
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class ResultStore:
+    '''Columnar store of solve results: a directory of fixed-size .npy chunks and a small index.
+
+    Every column is float64 (counts and flags are stored as numbers). A chunk
+    holds chunk_rows rows as a (columns, rows) array, so each column of a
+    chunk is contiguous in its file, and reads memory-map the chunks instead
+    of loading them. Rows are written straight into the memory-mapped chunk
+    being filled. index.json records the columns, the chunk size, the number
+    of rows written and free-form metadata; it is rewritten atomically after
+    the chunk data is flushed, so rows past its count (e.g. written just
+    before a crash) are ignored, and a reopened store appends after the last
+    recorded row.
+
+    Parameters:
+    - path: directory of the store (see is_store); created if missing.
+    - columns: column names. Must match those of an existing store; a new
+      store without them takes the keys of the first row written.
+    - chunk_rows: rows per chunk file (new stores only).
+    - metadata: dictionary saved in the index of a new store, e.g. how the results were produced.
+    - mode: 'a' to append (creating the store if missing), 'w' to replace an
+      existing store, or 'r' to read only.
+    - flush_interval: seconds between automatic flushes while writing; rows
+      written since the last flush are lost if the process dies.
+    '''
+    def __init__(self, path, columns=None, chunk_rows=CHUNK_ROWS, metadata=None, mode='a', flush_interval=1.0):
+        if mode not in ('a', 'w', 'r'):
+            raise ValueError(f"Unknown mode '{mode}'; use 'a', 'w' or 'r'.")
+        self.path = path
+        self.mode = mode
+        self.flush_interval = flush_interval
+        self._chunk = None  # (number, writable memory map) of the chunk being filled
+        self._flushed_at = time.monotonic()
+        index_path = os.path.join(path, INDEX)
+        exists = os.path.exists(index_path)
+        if mode == 'r' and not exists:
+            raise FileNotFoundError(f"No result store at {path}")
+        if mode == 'w' and exists:
+            for name in os.listdir(path):
+                if name == INDEX or (name.startswith("chunk_") and name.endswith(".npy")):
+                    os.remove(os.path.join(path, name))
+            exists = False
+
+        if exists:
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+            if index.get("format") != FORMAT:
+                raise ValueError(f"{path} was written by an incompatible version of result_store.")
+            if columns is not None and list(columns) != index["columns"]:
+                raise ValueError(f"Columns {list(columns)} do not match the store's {index['columns']}.")
+            self.columns = index["columns"]
+            self.chunk_rows = index["chunk_rows"]
+            self.rows = index["rows"]
+            self.metadata = index["metadata"]
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.columns = list(columns) if columns is not None else None
+            self.chunk_rows = int(chunk_rows)
+            self.rows = 0
+            self.metadata = dict(metadata or {})
+            if self.columns is not None:
+                self._write_index()
+
+    def __len__(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _chunk_path(self, number):
+        return os.path.join(self.path, _chunk_name(number))
+
+    def _write_index(self):
+        index = {"format": FORMAT, "columns": self.columns, "chunk_rows": self.chunk_rows,
+                 "rows": self.rows, "metadata": self.metadata}
+
+        def write(tmp_path):
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f, indent=1)
+        _replace(os.path.join(self.path, INDEX), write)
+
+    def _writable(self, number):
+        '''Memory map of chunk `number` at its full size, creating or regrowing the file as needed.'''
+        if self._chunk is not None:
+            if self._chunk[0] == number:
+                return self._chunk[1]
+            self._chunk[1].flush()
+        shape = (len(self.columns), self.chunk_rows)
+        path = self._chunk_path(number)
+        if os.path.exists(path) and np.load(path, mmap_mode='r').shape == shape:
+            chunk = np.load(path, mmap_mode='r+')
+        else:
+            # A chunk trimmed by close() (or missing) is rebuilt at full size; the
+            # rename keeps its recorded rows readable if the process dies meanwhile
+            kept = np.load(path) if os.path.exists(path) else None
+
+            def write(tmp_path):
+                new = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float64, shape=shape)
+                if kept is not None:
+                    new[:, :kept.shape[1]] = kept
+                new.flush()
+                del new
+            _replace(path, write)
+            chunk = np.load(path, mmap_mode='r+')
+        self._chunk = (number, chunk)
+        return chunk
+
+    def _check_writable(self):
+        if self.mode == 'r':
+            raise ValueError(f"Result store {self.path} is open read-only.")
+
+    def write(self, row):
+        '''Appends one row, a dictionary of column name -> value.'''
+        self._check_writable()
+        if self.columns is None:
+            self.columns = list(row)
+        number, offset = divmod(self.rows, self.chunk_rows)
+        chunk = self._writable(number)
+        chunk[:, offset] = [row[name] for name in self.columns]
+        self.rows += 1
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def extend(self, columns):
+        '''Appends many rows at once from a dictionary of column name -> 1-D array (all of one length).'''
+        self._check_writable()
+        if self.columns is None:
+            self.columns = list(columns)
+        arrays = [np.asarray(columns[name], dtype=np.float64) for name in self.columns]
+        n = len(arrays[0]) if arrays else 0
+        done = 0
+        while done < n:
+            number, offset = divmod(self.rows, self.chunk_rows)
+            count = min(n - done, self.chunk_rows - offset)
+            chunk = self._writable(number)
+            for k, array in enumerate(arrays):
+                chunk[k, offset:offset + count] = array[done:done + count]
+            done += count
+            self.rows += count
+        self.flush()
+
+    def flush(self):
+        '''Makes every row written so far durable: syncs the chunk data, then records the row count.'''
+        if self.mode == 'r' or self.columns is None:
+            return
+        if self._chunk is not None:
+            self._chunk[1].flush()
+        self._write_index()
+        self._flushed_at = time.monotonic()
+
+    def close(self):
+        '''Flushes and trims the last chunk to the rows it holds.'''
+        if self.mode == 'r' or self.columns is None:
+            return
+        self.flush()
+        if self._chunk is None:
+            return
+        number, chunk = self._chunk
+        self._chunk = None
+        used = self.rows - number * self.chunk_rows
+        if used < self.chunk_rows:
+            rows = np.array(chunk[:, :used])
+            del chunk
+
+            def write(tmp_path):
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, rows)
+            _replace(self._chunk_path(number), write)
+
+    def chunks(self, columns=None):
+        '''Yields, per chunk, a dictionary of column name -> read-only array of that chunk's rows.
+
+        The arrays are views of memory-mapped files: nothing is copied until they are used.
+        '''
+        names = list(columns) if columns is not None else list(self.columns or [])
+        positions = [self.columns.index(name) for name in names]
+        for number in range((self.rows + self.chunk_rows - 1) // self.chunk_rows):
+            chunk = np.load(self._chunk_path(number), mmap_mode='r')
+            used = min(self.rows - number * self.chunk_rows, self.chunk_rows)
+            yield {name: chunk[k, :used] for name, k in zip(names, positions)}
+
+    def column(self, name):
+        '''All values of one column; a memory-mapped view when the store has a single chunk, else a copy.'''
+        parts = [chunk[name] for chunk in self.chunks([name])]
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.empty(0)
+
+    def read(self, columns=None):
+        '''Dictionary of column name -> all its values (see column).'''
+        return {name: self.column(name) for name in (columns or self.columns or [])}
+
+    def last(self):
+        '''The last row as a dictionary of column name -> float, or None if the store is empty.'''
+        if self.rows == 0:
+            return None
+        number, offset = divmod(self.rows - 1, self.chunk_rows)
+        chunk = np.load(self._chunk_path(number), mmap_mode='r')
+        return dict(zip(self.columns, chunk[:, offset].tolist()))
+
+
+def open_store(path):
+    '''Opens a result store read-only (see ResultStore).'''
+    return ResultStore(path, mode='r')
@@ -1,87 +1,54 @@
-from scipy.optimize import least_squares
 import numpy as np
-import sympy as sp
-import re
-import ast
 import random
-import io
-import contextlib
-import math
+import frontend
+import profiling
+import progress
+import system_cache
 random.seed(42)
 
-class Solution():
-    def __init__(self):
-        self.equations = []
-        self.variables = []
-        self.coefficients = {}
-        self.constantspath = None
-
-    def process_equations(self, equations):
-        self.equations = [eq.split('=')[0].strip() for eq in equations]
-        return self.equations
-
-    def parse_constants_file(self):
-        if self.constantspath:
-            filepath = self.constantspath
-            with open(filepath, 'r') as file:
-                lines = file.readlines()
-
-            # First, preprocess lines to strip comments and empty lines
-            cleaned_lines = []
-            for line in lines:
-                line = line.split('#', 1)[0].strip()  # remove comment and trim
-                if line:  # skip empty lines
-                    cleaned_lines.append(line)
-
-            # Allowed math functions/constants
-            safe_math = {
-                'sqrt': math.sqrt,
-                'sin': math.sin,
-                'cos': math.cos,
-                'tan': math.tan,
-                'log': math.log,  # natural log
-                'ln': math.log,   # alias for natural log
-                'exp': math.exp,
-                'pi': math.pi,
-                'e': math.e
-            }
-
-            # Evaluate constants in order; constants may depend on previous ones
-            for line in cleaned_lines:
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    try:
-                        # Combine safe math functions with previously defined constants
-                        self.coefficients[key] = eval(value, {"__builtins__": {}}, {**safe_math, **self.coefficients})
-                    except Exception as e:
-                        raise ValueError(f"Invalid expression for '{key}': '{value}' → {e}")
-
-
-    def get_variables(self, equations):
-        self.parse_constants_file()
-        var_pattern = re.compile(r'\b[a-zA-Z_][a-zA-Z0-9_]*\b')
-        to_remove = set(['sin', 'cos', 'tan', 'sqrt', 'log', 'ln', 'exp', 'pi']) | set(self.coefficients.keys())
-        variables = set()
-        for eq in equations:
-            for var in var_pattern.findall(eq):
-                if var not in to_remove:
-                    variables.add(var)
-        self.variables = list(variables)
-
-    def create_symbolic_system(self, equations):
-        equations = self.process_equations(equations)
-        self.get_variables(equations)
-        sym_vars = sp.symbols(self.variables)
-        var_map = dict(zip(self.variables, sym_vars))
-        sym_table = {**var_map, **{k: sp.sympify(v) for k, v in self.coefficients.items()}}
-        equations = [sp.sympify(eq_str, locals=sym_table) for eq_str in equations]
-        f_lambdified = sp.lambdify(sym_vars, equations, modules='numpy')
-        return f_lambdified, sym_vars
-
-    def solution(self, equations, initial_guess=None):
-        f_lambdified, sym_vars = self.create_symbolic_system(equations)
+# Stopping rule of the sparse trust-region solve (see Solution.solution)
+SPARSE_TOL = 1e-8
+SPARSE_MAX_ITER = 200
+
+class Solution(frontend.FrontEnd):
+    def solution(self, equations, initial_guess=None, sparse=False, numerical_jacobian=False,
+                 backend='lambdify', callback=None):
+        '''Parameters:
+        - equations: list of equations as strings.
+        - initial_guess: optional dictionary of variable name -> starting value.
+        - sparse: evaluate the Jacobian in CSR form. Square systems are solved
+          with a dogleg trust region whose Newton step comes from a sparse LU
+          factorization (newton_engine.solve), iterating until the residual
+          norm falls below SPARSE_TOL. With numerical_jacobian the CSR Jacobian
+          comes from finite differences grouped by the symbolic sparsity
+          pattern. Non-square systems fall back to least_squares with sparse
+          LSMR subproblems, which can need many more evaluations than the
+          dense mode or fail to converge.
+        - numerical_jacobian: let SciPy approximate the Jacobian with finite
+          differences instead of passing the exact symbolic one.
+        - backend: 'lambdify', or 'cse' to evaluate residuals and Jacobian in
+          one common-subexpression-eliminated function, or 'ad' to skip SymPy
+          and evaluate a NumPy tape with a forward-mode Jacobian.
+        - callback: optional callable receiving a dictionary per iteration with
+          "iteration", "residual_norm", "step_norm" and "elapsed".
+
+        Returns:
+        - Dictionary with "solution_dict", "log", "function_evaluations",
+          "jacobian_evaluations" and "timings" (seconds per phase, see profiling.Timings).
+        '''
+        from scipy.optimize import least_squares
+        self.timings = profiling.Timings()
+        f_lambdified, variables = self.create_symbolic_system(equations, jacobian=not numerical_jacobian or sparse,
+                                                              backend=backend)
+        csr_jacobian = None
+        jac_sparsity = None
+        if sparse:
+            import sparse_jacobian
+            csr_jacobian = sparse_jacobian.CSRJacobian(self.compiled)
+            if numerical_jacobian:
+                jac_sparsity = csr_jacobian.pattern()
+        functions = system_cache.ScipyFunctions(self.compiled, csr=csr_jacobian)
+        jac = '2-point' if numerical_jacobian else functions.jacobian
 
         if initial_guess is None:
             initial_guesses = np.random.uniform(0, 2, size=len(self.variables))
@@ -93,35 +60,71 @@ class Solution():
                 else:
                     initial_guesses.append(random.uniform(0, 2))
 
-        # Start capturing output
-        output_log = io.StringIO()
-        with contextlib.redirect_stdout(output_log):
-            print("\nSolving using Scipy's optimize.least_squares:")
-            def func(x):
-                return np.array(f_lambdified(*x), dtype=np.float64)
+        # least_squares only offers LSMR subproblems for sparse Jacobians, which stall on
+        # stiff systems; a dogleg step with an exact sparse LU Newton step does not
+        trust_region = sparse and csr_jacobian.shape[0] == csr_jacobian.shape[1]
 
-            print("\nInitial Guess Used:")
-            for var, val in zip(self.variables, initial_guesses):
-                print(f"{var} = {val:.4f}")
-
-            print("\n--- Solving Using Least Squares ---")
-            sol = least_squares(func, initial_guesses, verbose=2)
+        log = progress.SolveLog(callback)
+        if trust_region:
+            log.print("\nSolving using a dogleg trust region with sparse LU Newton steps:")
+        else:
+            log.print("\nSolving using Scipy's optimize.least_squares:")
+        log.print("\nInitial Guess Used:")
+        for var, val in zip(self.variables, initial_guesses):
+            log.print(f"{var} = {val:.4f}")
+
+        if not trust_region:
+            log.print("\n--- Solving Using Least Squares ---")
+            log.print(f"{'Iteration':>10} {'Cost':>14} {'Residual Norm':>14} {'Step Norm':>14}")
+        last_x = np.array(initial_guesses, dtype=np.float64)
+
+        def report(intermediate_result):
+            nonlocal last_x
+            step = np.linalg.norm(intermediate_result.x - last_x)
+            norm = np.linalg.norm(intermediate_result.fun)
+            last_x = intermediate_result.x.copy()
+            log.print(f"{intermediate_result.nit:>10} {intermediate_result.cost:>14.4e} {norm:>14.4e} {step:>14.4e}")
+            log.iteration(intermediate_result.nit, norm, step)
+
+        if trust_region:
+            import newton_engine
+            import sparse_jacobian
+            if numerical_jacobian:
+                jac = sparse_jacobian.FiniteDifferenceJacobian(functions.residual, csr_jacobian)
+            with self.timings.span("iterations"):
+                result = newton_engine.solve(functions.residual, jac, initial_guesses, tol=SPARSE_TOL,
+                                             max_iter=SPARSE_MAX_ITER, globalization='dogleg', log=log)
+            x, F = result["x"], result["F"]
+            jacobian_evaluations = result["jacobian_evaluations"] if numerical_jacobian \
+                else functions.jacobian_evaluations
+        else:
+            with self.timings.span("iterations"):
+                sol = least_squares(functions.residual, initial_guesses, jac=jac, jac_sparsity=jac_sparsity,
+                                    callback=report)
 
             if not sol.success:
                 raise ValueError(f"Solver failed: {sol.message}")
+            x, F = sol.x, sol.fun
+            jacobian_evaluations = sol.njev if numerical_jacobian else functions.jacobian_evaluations
 
-            print("\nFinal Solution:")
-            for var, val in zip(sym_vars, sol.x):
-                print(f"{var} = {val:.6f}")
+        log.print("\nFinal Solution:")
+        for var, val in zip(variables, x):
+            log.print(f"{var} = {val:.6f}")
 
-            print("\nResiduals: ")
-            for i, val in enumerate(sol.fun):
-                print(f"Eq{i+1}: {val:.4e},")
+        log.print("\nResiduals: ")
+        for i, val in enumerate(F):
+            log.print(f"Eq{i+1}: {val:.4e},")
 
 
-            print(f"\nFinal Residual Norm: {np.linalg.norm(sol.fun):.4e}")
+        log.print(f"\nFinal Residual Norm: {np.linalg.norm(F):.4e}")
+        log.print(f"Jacobian: {'finite differences' if numerical_jacobian else 'analytic'}")
+        log.print(f"Function Evaluations: {functions.residual_evaluations}")
+        log.print(f"Jacobian Evaluations: {jacobian_evaluations}")
 
         return {
-            "solution_dict": {str(var): val for var, val in zip(sym_vars, sol.x)},
-            "log": output_log.getvalue()  # This will include verbose=2 output
+            "solution_dict": {str(var): val for var, val in zip(variables, x)},
+            "log": log.getvalue(),
+            "function_evaluations": functions.residual_evaluations,
+            "jacobian_evaluations": jacobian_evaluations,
+            "timings": self.timings.as_dict(),
         }
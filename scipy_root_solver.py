@@ -1,115 +1,38 @@
-from scipy.optimize import root
 import numpy as np
-import sympy as sp
-import re
-import ast
 import random
-import io
-import contextlib
-import math
+import frontend
+import profiling
+import progress
+import system_cache
 random.seed(42) 
 
-class Solution():
-    def __init__(self):
-        self.equations = []
-        self.variables = []
-        self.coefficients = {} 
-        self.constantspath = None
-    
-    def process_equations(self, equations):
-        """
-        Removes '= 0' from each equation string.
-        Assumes all equations are of the form 'expression = 0'.
-        """
-        return [eq.split('=')[0].strip() for eq in equations]
-            
-    def parse_constants_file(self):
-        if self.constantspath:
-            filepath = self.constantspath
-            with open(filepath, 'r') as file:
-                lines = file.readlines()
-
-            # First, preprocess lines to strip comments and empty lines
-            cleaned_lines = []
-            for line in lines:
-                line = line.split('#', 1)[0].strip()  # remove comment and trim
-                if line:  # skip empty lines
-                    cleaned_lines.append(line)
-
-            # Allowed math functions/constants
-            safe_math = {
-                'sqrt': math.sqrt,
-                'sin': math.sin,
-                'cos': math.cos,
-                'tan': math.tan,
-                'log': math.log,  # natural log
-                'ln': math.log,   # alias for natural log
-                'exp': math.exp,
-                'pi': math.pi,
-                'e': math.e
-            }
-
-            # Evaluate constants in order; constants may depend on previous ones
-            for line in cleaned_lines:
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    try:
-                        # Combine safe math functions with previously defined constants
-                        self.coefficients[key] = eval(value, {"__builtins__": {}}, {**safe_math, **self.coefficients})
-                    except Exception as e:
-                        raise ValueError(f"Invalid expression for '{key}': '{value}' → {e}")
-
-                    
-
-    def get_variables(self, equations):
-        self.parse_constants_file()
-        var_pattern = re.compile(r'\b[a-zA-Z_][a-zA-Z0-9_]*\b')
-        to_remove = set(['sin', 'cos', 'tan', 'sqrt', 'log', 'ln', 'exp', 'pi']) | set(self.coefficients.keys())
-        
-        variables = set()
-        for eq in equations:
-            for var in var_pattern.findall(eq):
-                if var not in to_remove:
-                    variables.add(var)
-        self.variables = list(variables)
-    
-    def create_symbolic_system(self, equations):
+class Solution(frontend.FrontEnd):
+    def solution(self, equations, initial_guess=None, method='hybr', numerical_jacobian=False,
+                 backend='lambdify', callback=None):
         '''Parameters:
-        - variables: list of variable names as strings.
-        - equations: list of equations as strings.
-        - coefficients: dictionary of constant names and values.
-
-        Returns:
-        - f_lambdified: numerical function evaluating the equations.
-        - sym_vars: symbolic variables in the same order as 'variables'.
-        '''
-
-        equations = self.process_equations(equations)
-        self.get_variables(equations)
-        sym_vars = sp.symbols(self.variables)
-        var_map = dict(zip(self.variables, sym_vars))
-        sym_table = {**var_map, **{k: sp.sympify(v) for k, v in self.coefficients.items()}}
-
-        equations = [sp.sympify(eq_str, locals=sym_table) for eq_str in equations]
-        f_lambdified = sp.lambdify(sym_vars, equations, modules='numpy')
-
-        return f_lambdified, sym_vars
-
-    def solution(self, equations, initial_guess=None, method='hybr'):
-        '''Parameters:
-        - coefficients: dictionary of named constants used in the equations.
-        - variables: list of variable names as strings.
         - equations: list of equations as strings.
         - initial_guess: optional initial guess for the variables.
         - method: root-finding method ('hybr', 'lm', 'broyden1', etc.)
+        - numerical_jacobian: let SciPy approximate the Jacobian with finite
+          differences instead of passing the exact symbolic one.
+        - backend: 'lambdify', or 'cse' to evaluate residuals and Jacobian in
+          one common-subexpression-eliminated function, or 'ad' to skip SymPy
+          and evaluate a NumPy tape with a forward-mode Jacobian.
+        - callback: optional callable receiving a dictionary per iteration with
+          "iteration", "residual_norm", "step_norm" and "elapsed". hybr and lm
+          have no iteration hook, so there every residual evaluation is reported.
 
         Returns:
-        - Dictionary mapping variable names to their solved values.
+        - Dictionary with "solution_dict", "log", "function_evaluations",
+          "jacobian_evaluations" and "timings" (seconds per phase, see profiling.Timings).
+          Without the analytic Jacobian, "jacobian_evaluations" is SciPy's njev,
+          or None for methods that do not report it.
         '''
-        
-        f_lambdified, sym_vars = self.create_symbolic_system(equations)
+        from scipy.optimize import root
+        self.timings = profiling.Timings()
+        # Only hybr and lm make use of a user-supplied Jacobian
+        use_jacobian = not numerical_jacobian and method in ('hybr', 'lm')
+        f_lambdified, variables = self.create_symbolic_system(equations, jacobian=use_jacobian, backend=backend)
         if initial_guess is None:
             initial_guesses = np.random.uniform(0, 2, size=len(self.variables))
         else:
@@ -120,33 +43,53 @@ class Solution():
                 else:
                     initial_guesses.append(random.uniform(0, 2))
 
-        def func(x):
-            return np.array(f_lambdified(*x), dtype=np.float64)
-
-        sol = root(func, initial_guesses, method=method)
+        functions = system_cache.ScipyFunctions(self.compiled)
+        log = progress.SolveLog(callback)
+        residual = functions.residual
+        iteration_callback = None
+        if callback is not None:
+            if method in ('hybr', 'lm'):
+                residual = progress.ResidualMonitor(functions.residual, log)
+            else:
+                last = {"x": np.array(initial_guesses, dtype=np.float64), "iteration": 0}
+
+                def iteration_callback(x, f):
+                    last["iteration"] += 1
+                    log.iteration(last["iteration"], np.linalg.norm(f), np.linalg.norm(x - last["x"]))
+                    last["x"] = np.array(x, dtype=np.float64)
+
+        with self.timings.span("iterations"):
+            sol = root(residual, initial_guesses, method=method,
+                       jac=functions.jacobian if use_jacobian else None, callback=iteration_callback)
 
         if not sol.success:
             raise ValueError(f"Solver failed: {sol.message}")
+        # SciPy differentiates internally without our Jacobian; it reports njev for some methods only
+        jacobian_evaluations = functions.jacobian_evaluations if use_jacobian else sol.get('njev')
         
-        output_log = io.StringIO()
-        with contextlib.redirect_stdout(output_log):
-            print("\nSolving using SciPy's optimize.root:")
-            print("\nInitial Guess Used:")
-            for var, val in zip(self.variables, initial_guesses):
-                print(f" {var} = {val:.4f}")
+        log.print("\nSolving using SciPy's optimize.root:")
+        log.print("\nInitial Guess Used:")
+        for var, val in zip(self.variables, initial_guesses):
+            log.print(f" {var} = {val:.4f}")
         
-            print("\nFinal Solution:")
-            for var, val in zip(sym_vars, sol.x):
-                print(f" {var} = {val:.6f}")
+        log.print("\nFinal Solution:")
+        for var, val in zip(variables, sol.x):
+            log.print(f" {var} = {val:.6f}")
 
-            print("\nResiduals:")
-            for i, val in enumerate(sol.fun):
-                print(f"Eq{i+1}: {val:.4e},")
+        log.print("\nResiduals:")
+        for i, val in enumerate(sol.fun):
+            log.print(f"Eq{i+1}: {val:.4e},")
 
-            print(f"\nFinal Residual Norm: {np.linalg.norm(sol.fun):.4e}")
+        log.print(f"\nFinal Residual Norm: {np.linalg.norm(sol.fun):.4e}")
+        log.print(f"Jacobian: {'analytic' if use_jacobian else 'finite differences'}")
+        log.print(f"Function Evaluations: {functions.residual_evaluations}")
+        log.print(f"Jacobian Evaluations: {jacobian_evaluations}")
 
         
         return {
-            "solution_dict": {str(var): val for var, val in zip(sym_vars, sol.x)},
-            "log": output_log.getvalue() 
+            "solution_dict": {str(var): val for var, val in zip(variables, sol.x)},
+            "log": log.getvalue(),
+            "function_evaluations": functions.residual_evaluations,
+            "jacobian_evaluations": jacobian_evaluations,
+            "timings": self.timings.as_dict(),
         }
\ No newline at end of file
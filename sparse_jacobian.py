@@ -0,0 +1,143 @@
+import warnings
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import linalg as splinalg
+
+KRYLOV_METHODS = {
+    'gmres': splinalg.gmres,
+    'lgmres': splinalg.lgmres,
+    'bicgstab': splinalg.bicgstab,
+}
+
+
+class CSRJacobian:
+    '''CSR evaluator for the Jacobian of a compiled system.
+
+    The sparsity pattern comes from the structurally nonzero entries found
+    symbolically when the system was compiled, so it is fixed per system and
+    only the data array is refreshed on each call.
+
+    Parameters:
+    - compiled: system_cache.CompiledFunctions compiled with jacobian=True.
+    '''
+    def __init__(self, compiled):
+        if compiled.jac_entries is None:
+            raise ValueError("The system was compiled without a Jacobian.")
+        self.compiled = compiled
+        self.shape = (compiled.n_equations, len(compiled.variables))
+        rows, cols = compiled.jac_rows, compiled.jac_cols
+        # Order the entries row-major once; every evaluation reuses the permutation
+        self._order = np.lexsort((cols, rows))
+        self.indices = cols[self._order].astype(np.int32)
+        self.indptr = np.searchsorted(rows[self._order], np.arange(self.shape[0] + 1)).astype(np.int32)
+
+    @property
+    def nnz(self):
+        return self.indices.size
+
+    def pattern(self):
+        '''Returns the sparsity pattern as a CSR matrix of ones.'''
+        return sparse.csr_matrix((np.ones(self.nnz), self.indices, self.indptr), shape=self.shape)
+
+    def from_values(self, values):
+        '''Builds the CSR matrix from Jacobian entries in the compiled (jac_rows, jac_cols) order.'''
+        data = np.asarray(values, dtype=np.float64)[self._order]
+        return sparse.csr_matrix((data, self.indices, self.indptr), shape=self.shape)
+
+    def __call__(self, *args):
+        return self.from_values(self.compiled.jac_entries(*args))
+
+
+def column_groups(J):
+    '''Groups the columns of a sparse matrix so that no two columns of a group share a row.
+
+    Greedy coloring in column order; one finite-difference evaluation per group
+    then recovers every column of the group.
+
+    Returns:
+    - Array with the group number of each column.
+    '''
+    csc = sparse.csc_matrix(J)
+    csr = csc.tocsr()
+    groups = np.full(J.shape[1], -1, dtype=np.int64)
+    for col in range(J.shape[1]):
+        rows = csc.indices[csc.indptr[col]:csc.indptr[col + 1]]
+        # Groups already used by a column sharing one of these rows
+        neighbours = np.concatenate([csr.indices[csr.indptr[r]:csr.indptr[r + 1]] for r in rows]) \
+            if rows.size else np.empty(0, dtype=np.int64)
+        taken = set(groups[neighbours][groups[neighbours] >= 0].tolist())
+        group = 0
+        while group in taken:
+            group += 1
+        groups[col] = group
+    return groups
+
+
+class FiniteDifferenceJacobian:
+    '''CSR Jacobian from forward differences, one residual evaluation per column group.
+
+    Parameters:
+    - residual: callable x -> F(x).
+    - csr: CSRJacobian giving the sparsity pattern.
+    '''
+    def __init__(self, residual, csr):
+        self.residual = residual
+        self.csr = csr
+        self.shape = csr.shape
+        self.groups = column_groups(csr.pattern())
+        self.n_groups = int(self.groups.max()) + 1 if self.groups.size else 0
+        self._rows = np.repeat(np.arange(self.shape[0]), np.diff(csr.indptr))
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        F0 = np.asarray(self.residual(x), dtype=np.float64)
+        # Same relative step as SciPy's '2-point' scheme
+        h = np.sqrt(np.finfo(np.float64).eps) * np.maximum(1.0, np.abs(x))
+        h = (x + h) - x
+        differences = np.empty((self.n_groups, self.shape[0]))
+        for group in range(self.n_groups):
+            step = np.where(self.groups == group, h, 0.0)
+            differences[group] = np.asarray(self.residual(x + step), dtype=np.float64) - F0
+        cols = self.csr.indices
+        data = differences[self.groups[cols], self._rows] / h[cols]
+        return sparse.csr_matrix((data, cols, self.csr.indptr), shape=self.shape)
+
+
+def solve(J, rhs, method='direct', rtol=1e-10):
+    '''Solves J @ x = rhs for a sparse Jacobian.
+
+    Parameters:
+    - J: scipy.sparse matrix.
+    - rhs: right-hand side vector.
+    - method: 'direct' (sparse LU via spsolve) or one of 'gmres', 'lgmres',
+      'bicgstab' (Krylov, preconditioned with an incomplete LU when possible).
+    - rtol: relative tolerance for the Krylov methods.
+
+    Returns:
+    - Solution vector.
+    '''
+    if method == 'direct':
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", splinalg.MatrixRankWarning)
+            try:
+                x = splinalg.spsolve(J.tocsc(), rhs)
+            except (splinalg.MatrixRankWarning, RuntimeError):
+                raise ValueError("Jacobian is singular. Cannot proceed.")
+        if not np.all(np.isfinite(x)):
+            raise ValueError("Jacobian is singular. Cannot proceed.")
+        return x
+
+    if method not in KRYLOV_METHODS:
+        raise ValueError(f"Unknown sparse linear solver '{method}'. "
+                         f"Choose 'direct' or one of {sorted(KRYLOV_METHODS)}.")
+    try:
+        ilu = splinalg.spilu(J.tocsc())
+        M = splinalg.LinearOperator(J.shape, ilu.solve)
+    except RuntimeError:
+        # Exactly singular factor; run the Krylov method unpreconditioned
+        M = None
+    x, info = KRYLOV_METHODS[method](J, rhs, rtol=rtol, M=M)
+    if info != 0:
+        raise ValueError(f"Sparse {method} solve did not converge (info={info}).")
+    return x
@@ -9,6 +9,41 @@ function readTextFile(input, callback) {
     reader.readAsText(file);
 }
 
+let currentJob = null;
+let currentStream = null;  // AbortController of the open /solve/stream request
+let latestSolve = 0;  // number of the most recent Solve click
+
+// Reads a server-sent event stream from a fetch() response and calls onEvent(name, data)
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+            const chunk = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let name = 'message';
+            let data = '';
+            chunk.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) name = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            if (data) onEvent(name, JSON.parse(data));
+        }
+    }
+}
+
+function formatIteration(event) {
+    let line = 'Iteration ' + event.iteration + ': residual norm ' + event.residual_norm.toExponential(4);
+    if (event.step_norm !== null) line += ', step norm ' + event.step_norm.toExponential(4);
+    if (event.block !== undefined) line = 'Block ' + event.block + ', ' + line;
+    return line + ' (' + event.elapsed.toFixed(3) + ' s)';
+}
+
 $(document).ready(function () {
     $('#equationFiles').on('change', function () {
     const files = this.files;
@@ -42,6 +77,7 @@ $(document).ready(function () {
         const equations = $('#equations').val();
         const constants = $('#constants').val();
         const initialGuessText = $('#initial_guesses').val();
+        const decompose = $('#decompose').is(':checked');
         let initial_guesses = {};
 
         initialGuessText.split('\n').forEach(line => {
@@ -55,26 +91,64 @@ $(document).ready(function () {
             }
         });
 
-        $.ajax({
-            url: '/solve',
-            type: 'POST',
-            contentType: 'application/json',
-            data: JSON.stringify({
-                solver: solver,
-                equations: equations,
-                constants: constants,
-                initial_guesses: initial_guesses
-            }),
-            success: function (response) {
-                if (response.success) {
-                    $('#solutionBox').text(response.solution);
-                } else {
-                    $('#solutionBox').text("Error: " + response.error);
-                }
-            },
-            error: function () {
-                $('#solutionBox').text("An unexpected error occurred.");
+        const request = {
+            solver: solver,
+            equations: equations,
+            constants: constants,
+            initial_guesses: initial_guesses,
+            decompose: decompose
+        };
+        const progress = [];
+        const solveNumber = ++latestSolve;
+        // Closing the previous stream lets the server cancel its solve (unless other requests share it)
+        if (currentStream) currentStream.abort();
+        const stream = new AbortController();
+        currentStream = stream;
+        currentJob = null;
+        $('#cancelBtn').prop('disabled', true);
+        $('#solutionBox').text("Queued...");
+
+        fetch('/solve/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(request),
+            signal: stream.signal
+        }).then(response => readEventStream(response, function (name, data) {
+            // A newer solve replaced this one; also covers an error sent before any job event
+            if (solveNumber !== latestSolve) return;
+            if (name === 'job') {
+                currentJob = data.job_id;
+                $('#cancelBtn').prop('disabled', false);
+                return;
+            }
+            if (name === 'iteration') {
+                progress.push(formatIteration(data));
+                $('#solutionBox').text("Solving...\n" + progress.slice(-20).join('\n'));
+            } else if (name === 'result') {
+                $('#cancelBtn').prop('disabled', true);
+                $('#solutionBox').text(data.solution);
+            } else if (name === 'error') {
+                $('#cancelBtn').prop('disabled', true);
+                $('#solutionBox').text(data.status === 'cancelled' ? "Solve cancelled." : "Error: " + data.error);
             }
+        })).catch(function () {
+            if (solveNumber !== latestSolve || stream.signal.aborted) return;
+            $('#cancelBtn').prop('disabled', true);
+            $('#solutionBox').text("An unexpected error occurred.");
+        });
+    });
+
+    $('#cancelBtn').click(function () {
+        if (!currentJob) return;
+        const job = currentJob;
+        $.post('/jobs/' + job + '/cancel').fail(function () {
+            // Other requests share the solve, so it goes on; stop waiting for it instead
+            if (job !== currentJob) return;
+            currentStream.abort();
+            currentStream = null;
+            currentJob = null;
+            $('#cancelBtn').prop('disabled', true);
+            $('#solutionBox').text("Solve cancelled.");
         });
     });
 
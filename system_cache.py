@@ -0,0 +1,777 @@
+import ast
+import builtins
+import copy
+import functools
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import frontend
+import profiling
+
+# Bump whenever the layout of a cached entry changes so stale disk entries are ignored
+CACHE_FORMAT = 5
+
+# Code generation backends accepted by compile_system
+BACKENDS = ('lambdify', 'cse', 'ad')
+
+
+def system_key(equations, coefficients, parameters=(), backend='lambdify'):
+    '''Returns a hex digest identifying a system.
+
+    Parameters:
+    - equations: list of residual expressions (the part left of '= 0').
+    - coefficients: dictionary of parsed constant values.
+    - parameters: names of constants kept symbolic; their values are not part of the key.
+    - backend: code generation backend ('lambdify', 'cse' or 'ad').
+
+    Whitespace inside the equations is ignored, so reformatting a file does not
+    invalidate its compiled functions.
+    '''
+    h = hashlib.sha256()
+    h.update(f"format={CACHE_FORMAT};backend={backend}\n".encode())
+    for eq in equations:
+        h.update(re.sub(r'\s+', '', eq).encode())
+        h.update(b"\n")
+    h.update(b"---\n")
+    for name in sorted(coefficients):
+        if name not in parameters:
+            h.update(f"{name}={coefficients[name]!r}\n".encode())
+    h.update(b"---\n")
+    for name in parameters:
+        h.update(f"{name}\n".encode())
+    return h.hexdigest()
+
+
+_namespace_template = None
+
+# Name of the residual and Jacobian functions in the generated (and cached) source
+GENERATED_FUNCTION = "_lambdifygenerated"
+
+
+def _lambdify_namespace():
+    # Same globals sympy.lambdify(modules='numpy') gives its generated functions, built once per
+    # process without importing SymPy, so loading a cached system does not pay for the SymPy import
+    global _namespace_template
+    if _namespace_template is None:
+        namespace = {}
+        exec("import numpy; from numpy import *; from numpy.linalg import *", namespace)
+        namespace.update({"I": 1j, "Abs": abs, "Heaviside": np.heaviside, "range": range, "builtins": builtins})
+        _namespace_template = namespace
+    return dict(_namespace_template)
+
+
+def _function_from_source(source):
+    namespace = _lambdify_namespace()
+    exec(compile(source, "<cached system>", "exec"), namespace)
+    return namespace[GENERATED_FUNCTION]
+
+
+def _in_place_function(source):
+    '''Compiles the in-place twin of a generated function: _out[i] = ... instead of returning a list.
+
+    The twin takes the output array as its first argument and returns it, so
+    evaluating into a preallocated buffer materializes no list of arrays.
+    '''
+    tree = ast.parse(source)
+    function = tree.body[0]
+    outputs = function.body[-1].value.elts
+    function.args.args.insert(0, ast.arg("_out"))
+    function.body[-1:] = [
+        ast.Assign(targets=[ast.Subscript(ast.Name("_out", ast.Load()), ast.Constant(i), ast.Store())], value=output)
+        for i, output in enumerate(outputs)
+    ] + [ast.Return(ast.Name("_out", ast.Load()))]
+    namespace = _lambdify_namespace()
+    exec(compile(ast.fix_missing_locations(tree), "<cached system>", "exec"), namespace)
+    return namespace[GENERATED_FUNCTION]
+
+
+def _floating(x):
+    # float32 stays float32 (see CompiledFunctions.evaluate); anything else becomes float64
+    x = np.asarray(x)
+    return x if x.dtype == np.float32 else x.astype(np.float64, copy=False)
+
+
+class CompiledFunctions:
+    '''Numerical residual and Jacobian callables for one system.
+
+    All callables take the variables positionally, in the order of `variables`,
+    followed by the values of `parameters` (constants kept symbolic), if any.
+    bind() fixes the parameter values, giving callables of the variables only.
+
+    - f returns the residuals.
+    - jac_entries returns the structurally nonzero Jacobian entries, located
+      at (jac_rows[k], jac_cols[k]). Entries broadcast, so array arguments
+      evaluate many points at once.
+    - jac returns the dense Jacobian for scalar arguments.
+    - evaluate computes residuals and Jacobian entries together into
+      preallocated arrays; with the 'cse' and 'ad' backends this is a single
+      fused call. residuals_into writes only the residuals. Both keep float32
+      arguments in float32.
+
+    The Jacobian attributes are None when the entry was compiled without one.
+    '''
+    def __init__(self, variables, f, f_source, parameters=(), n_equations=0,
+                 jac_entries=None, jac_source=None, jac_rows=None, jac_cols=None, cse_source=None, tape=None,
+                 derived_source=None):
+        self.variables = list(variables)
+        self.parameters = list(parameters)
+        self.n_equations = n_equations
+        self.f_source = f_source
+        self.jac_source = jac_source
+        self.jac_rows = None if jac_rows is None else np.asarray(jac_rows, dtype=np.intp)
+        self.jac_cols = None if jac_cols is None else np.asarray(jac_cols, dtype=np.intp)
+        self.cse_source = cse_source
+        self.tape = tape
+        # Values computed from the parameters alone (such as P_atm / R / T3 when P_atm is a
+        # parameter); every call appends them to the parameter values, bind() computes them once
+        self.derived_source = derived_source
+        self.derived = _function_from_source(derived_source) if derived_source else None
+        self.bound = None  # parameter values followed by the derived values, set by bind()
+        # The generated callables take the variables, the parameters and the derived values
+        self._f, self._jac_entries, self._fused = f, jac_entries, None
+        self._f_into = self._jac_into = None  # in-place twins of f and jac_entries, see _in_place
+        if cse_source is not None:
+            import codegen
+            self._residuals_into, self._fused = codegen.load(cse_source)
+        elif tape is not None:
+            self._residuals_into = tape.residuals
+            self._fused = tape.fused if self.jac_rows is not None else None
+        self.backend = 'ad' if tape is not None else 'lambdify' if cse_source is None else 'cse'
+        self._wire()
+
+    def _wire(self):
+        self.fused = self._fused
+        if self.cse_source is not None or self.tape is not None:
+            self.f = self._fused_residuals
+            self.jac_entries = self._fused_jac_entries if self.jac_rows is not None else None
+        elif self.derived is None and self.bound is None:
+            self.f, self.jac_entries = self._f, self._jac_entries
+        else:
+            self.f = self._with_params(self._f)
+            self.jac_entries = None if self._jac_entries is None else self._with_params(self._jac_entries)
+        self.jac = self._dense_jacobian if self.jac_entries is not None else None
+
+    def _derive(self, params):
+        params = tuple(params)
+        return params + tuple(self.derived(*params)) if self.derived is not None else params
+
+    def _params(self, params):
+        return self.bound if self.bound is not None else self._derive(params)
+
+    def _with_params(self, function):
+        n = len(self.variables)
+
+        def call(*args):
+            return function(*args[:n], *self._params(args[n:]))
+        return call
+
+    def bind(self, values):
+        '''Returns a copy whose callables take only the variables, with the parameters fixed.
+
+        Parameters:
+        - values: parameter values, in the order of `parameters`.
+
+        The values derived from the parameters are computed once, here.
+        '''
+        if len(values) != len(self.parameters):
+            raise ValueError(f"Expected {len(self.parameters)} parameter values, got {len(values)}.")
+        bound = copy.copy(self)
+        if self.tape is not None:
+            # The tape's operations on the parameters alone run once, in Tape.bind
+            bound.tape = self.tape.bind(values)
+            bound._residuals_into = bound.tape.residuals
+            bound._fused = bound.tape.fused if self.jac_rows is not None else None
+            bound.bound = ()
+        else:
+            bound.bound = self._derive(values)
+        bound._wire()
+        return bound
+
+    @property
+    def nnz(self):
+        return 0 if self.jac_rows is None else len(self.jac_rows)
+
+    def _split(self, args):
+        n = len(self.variables)
+        return args[:n], self._params(args[n:]), np.broadcast_shapes(*(np.shape(a) for a in args))
+
+    def _fused_residuals(self, *args):
+        x, params, shape = self._split(args)
+        return self._residuals_into(x, np.empty((self.n_equations,) + shape), params)
+
+    def _fused_jac_entries(self, *args):
+        x, params, shape = self._split(args)
+        F = np.empty((self.n_equations,) + shape)
+        return self._fused(x, F, np.empty((self.nnz,) + shape), params)[1]
+
+    def _dense_jacobian(self, *args):
+        J = np.zeros((self.n_equations, len(self.variables)))
+        J[self.jac_rows, self.jac_cols] = self.jac_entries(*args)
+        return J
+
+    def residual(self, x, *params):
+        '''Residual vector at the point x (array-in, array-out form used by SciPy).'''
+        return np.array(self.f(*x, *params), dtype=np.float64)
+
+    def jacobian(self, x, *params):
+        '''Dense Jacobian at the point x (array-in, array-out form used by SciPy).'''
+        return self._dense_jacobian(*x, *params)
+
+    def _in_place(self):
+        # Compiled on first use: most entries are only ever evaluated through f and jac_entries
+        if self._f_into is None:
+            self._jac_into = _in_place_function(self.jac_source) if self.jac_source else None
+            self._f_into = _in_place_function(self.f_source)
+        return self._f_into, self._jac_into
+
+    def residuals_into(self, x, F, params=()):
+        '''Writes the residuals at x into F (shape (n_equations, ...)) and returns F.'''
+        x = _floating(x)
+        params = self._params(params)
+        if self.cse_source is not None or self.tape is not None:
+            return self._residuals_into(x.tolist() if x.ndim == 1 else x, F, params)
+        return self._in_place()[0](F, *x, *params)
+
+    def evaluate(self, x, F=None, J=None, params=()):
+        '''Evaluates residuals and Jacobian entries at x in one call.
+
+        Parameters:
+        - x: variable values, shape (n_vars,) or (n_vars, N); float32 values
+          are evaluated in float32, others in float64.
+        - F, J: optional output arrays of shape (n_equations, ...) and (nnz, ...).
+        - params: parameter values, if the system has parameters and is not bound.
+
+        Returns:
+        - (F, J) with J holding the nonzero entries in jac_rows/jac_cols order.
+        '''
+        x = _floating(x)
+        shape = x.shape[1:]
+        if F is None:
+            F = np.empty((self.n_equations,) + shape, dtype=x.dtype)
+        if J is None:
+            J = np.empty((self.nnz,) + shape, dtype=x.dtype)
+        params = self._params(params)
+        if self._fused is not None:
+            # Python floats are much faster than NumPy scalars in the generated scalar code
+            self._fused(x.tolist() if x.ndim == 1 else x, F, J, params)
+        else:
+            f_into, jac_into = self._in_place()
+            f_into(F, *x, *params)
+            jac_into(J, *x, *params)
+        return F, J
+
+    def to_dict(self):
+        return {
+            "variables": self.variables,
+            "parameters": self.parameters,
+            "n_equations": self.n_equations,
+            "f_source": self.f_source,
+            "jac_source": self.jac_source,
+            "jac_rows": None if self.jac_rows is None else self.jac_rows.tolist(),
+            "jac_cols": None if self.jac_cols is None else self.jac_cols.tolist(),
+            "cse_source": self.cse_source,
+            "tape": None if self.tape is None else self.tape.to_dict(),
+            "derived_source": self.derived_source,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        f = _function_from_source(data["f_source"]) if data["f_source"] else None
+        jac_entries = _function_from_source(data["jac_source"]) if data["jac_source"] else None
+        tape = None
+        if data["tape"]:
+            import ad_tape
+            tape = ad_tape.Tape.from_dict(data["tape"], data["jac_rows"], data["jac_cols"])
+        return cls(data["variables"], f, data["f_source"], data["parameters"], data["n_equations"],
+                   jac_entries, data["jac_source"], data["jac_rows"], data["jac_cols"], data["cse_source"], tape,
+                   data["derived_source"])
+
+
+class ScipyFunctions:
+    '''Residual and Jacobian callables in the x -> array form SciPy expects.
+
+    Counts evaluations, and with the 'cse' and 'ad' backends every residual evaluation
+    also computes the Jacobian entries in the same fused call, so a Jacobian
+    requested at the last residual point costs nothing extra.
+
+    Parameters:
+    - compiled: CompiledFunctions.
+    - csr: optional sparse_jacobian.CSRJacobian; Jacobians are then returned in CSR form.
+    '''
+    def __init__(self, compiled, csr=None):
+        self.compiled = compiled
+        self.csr = csr
+        self.residual_evaluations = 0
+        self.jacobian_evaluations = 0
+        self._last_x = None
+        self._last_jac = None
+
+    def residual(self, x):
+        self.residual_evaluations += 1
+        if self.compiled.fused is None or self.compiled.jac_rows is None:
+            return self.compiled.residual(x)
+        F, J = self.compiled.evaluate(x)
+        self._last_x, self._last_jac = np.array(x, dtype=np.float64), J
+        return F
+
+    def jacobian(self, x):
+        self.jacobian_evaluations += 1
+        if self._last_x is not None and np.array_equal(x, self._last_x):
+            values = self._last_jac
+        else:
+            values = self.compiled.jac_entries(*x)
+        if self.csr is not None:
+            return self.csr.from_values(values)
+        J = np.zeros((self.compiled.n_equations, len(self.compiled.variables)))
+        J[self.compiled.jac_rows, self.compiled.jac_cols] = values
+        return J
+
+
+def compile_system(equations, variables, coefficients, jacobian=True, parameters=(), backend='lambdify',
+                   timings=None):
+    '''Runs the symbolic pipeline (sympify, jacobian, code generation) for a system.
+
+    The symbolic work is cached per equation (see _equation), so only
+    equations not seen before are sympified and differentiated.
+
+    Parameters:
+    - equations: list of residual expressions as strings.
+    - variables: list of variable names as strings.
+    - coefficients: dictionary of constant names and values.
+    - jacobian: also derive and compile the Jacobian.
+    - parameters: names of constants to keep symbolic; they become trailing
+      arguments of the compiled functions instead of being substituted, and
+      values computed from them alone are derived once per call (or once in
+      CompiledFunctions.bind).
+    - backend: 'lambdify' (one NumPy function each for residuals and
+      Jacobian, as sympy.lambdify would generate), 'cse' (common subexpressions shared between residuals and
+      Jacobian, see codegen.py) or 'ad' (a NumPy tape of the parsed equations
+      with a forward-mode Jacobian, see ad_tape.py; no SymPy, so setup is
+      linear in the size of the equations).
+    - timings: optional profiling.Timings; receives "compile.sympify",
+      "compile.jacobian" and "compile.codegen" spans ("compile.tape" and
+      "compile.jacobian" with the 'ad' backend).
+
+    Returns:
+    - CompiledFunctions holding the residual and (optionally) Jacobian callables.
+    '''
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Choose one of {list(BACKENDS)}.")
+    timings = timings if timings is not None else profiling.Timings()
+    if backend == 'ad':
+        import ad_tape
+        system = frontend.parse_system(equations)
+        with timings.span("compile.tape"):
+            tape = ad_tape.build(system, variables, coefficients, parameters)
+        rows = cols = None
+        if jacobian:
+            with timings.span("compile.jacobian"):
+                rows, cols, colors = ad_tape.jacobian_pattern(system, variables)
+                tape.seed(rows, cols, colors)
+        return CompiledFunctions(variables, None, None, parameters, len(system.expressions),
+                                 jac_rows=rows, jac_cols=cols, tape=tape)
+    with timings.span("compile.sympify"):
+        import sympy as sp  # only needed on a cache miss
+        constants = set(coefficients) | set(parameters)
+        keys = [_equation_key(eq, constants) for eq in equations]
+        entries = [_equation(*key) for key in keys]
+        hoisted = [item for entry in entries for item in entry[3]]
+        columns = {name: j for j, name in enumerate(variables)}
+        for _, eq_variables, _, _ in entries:
+            for name in eq_variables:
+                if name not in columns:
+                    raise ValueError(f"name '{name}' is not defined")
+
+    rows, cols, jac_entries = None, None, []
+    if jacobian:
+        with timings.span("compile.jacobian"):
+            # Only the structurally nonzero entries are compiled; the dense matrix is scattered from them
+            rows, cols = [], []
+            for i, key in enumerate(keys):
+                row, row_hoisted = _equation_jacobian(*key)
+                hoisted += row_hoisted
+                for name, value, code in sorted(row, key=lambda entry: columns[entry[0]]):
+                    rows.append(i)
+                    cols.append(columns[name])
+                    jac_entries.append((value, code))
+
+    with timings.span("compile.codegen"):
+        sym_vars = [sp.Symbol(_symbol_name(name)) for name in variables]
+        sym_params = [sp.Symbol(_symbol_name(name)) for name in parameters]
+        # Subexpressions of fixed constants become numbers; those involving parameters become
+        # derived values, computed from the parameters alone and passed after them
+        values, computed = _bind_hoisted(hoisted, parameters, coefficients)
+        derived = [name for name, _ in computed]
+        derived_source = None
+        if computed:
+            derived_source = _function_source([_symbol_name(name) for name in parameters], values,
+                                              [code for _, code in computed])
+        if backend == 'cse':
+            import codegen
+            # Substituting the values lets SymPy fold the constants before the common subexpressions are found
+            substitutions = {sp.Symbol(_symbol_name(name)): sp.sympify(value)
+                             for name, value in coefficients.items() if name not in parameters}
+            substitutions.update({sp.Symbol(name): expression.xreplace(substitutions)
+                                  for name, expression, _ in hoisted if name not in derived})
+            sym_eqs = [expression.xreplace(substitutions) for expression, _, _, _ in entries]
+            jac_values = [value.xreplace(substitutions) for value, _ in jac_entries]
+            cse_source = codegen.generate(sym_eqs, jac_values, sym_vars,
+                                          sym_params + [sp.Symbol(name) for name in derived])
+            return CompiledFunctions(variables, None, None, parameters, len(entries),
+                                     jac_rows=rows, jac_cols=cols, cse_source=cse_source,
+                                     derived_source=derived_source)
+
+        # The per-equation code is joined into one function per output, with the constant values
+        # bound as defaults, so a constants-only edit does no symbolic work at all
+        used = sorted({name for key in keys for name in key[1] if name not in parameters})
+        values += [(_symbol_name(name), float(coefficients[name])) for name in used]
+        arguments = [_symbol_name(name) for name in list(variables) + list(parameters)] + derived
+        f_source = _function_source(arguments, values, [entry[2] for entry in entries])
+        jac_source = None
+        if jacobian:
+            jac_source = _function_source(arguments, values, [code for _, code in jac_entries])
+
+    return CompiledFunctions(variables, _function_from_source(f_source), f_source, parameters, len(entries),
+                             _function_from_source(jac_source) if jac_source else None, jac_source, rows, cols,
+                             derived_source=derived_source)
+
+
+def _symbol_name(name):
+    # Prefixed, so user identifiers can never clash with names used by the generated code
+    return f"_n_{name}"
+
+
+def _equation_key(residual, constants):
+    '''Cache key of one equation: its whitespace-free text and the constants it uses.'''
+    text = re.sub(r'\s+', '', residual)
+    return text, tuple(sorted(name for name in frontend.parse_expression(text).names if name in constants))
+
+
+class _ConstantFolder:
+    '''Hoists the subexpressions of constants only out of an equation's expressions.
+
+    Each hoisted subexpression, such as P_atm / R / T3, becomes a symbol named
+    after its code, which _bind_hoisted evaluates once per set of constant
+    values. Terms differing only in their constant factor are merged first,
+    as SymPy would do with numbers.
+
+    Parameters:
+    - constants: symbols of the equation's constants.
+    - variables: symbols of its variables.
+    - hoisted: optional (name, expression, code) triples hoisted before.
+    '''
+    def __init__(self, constants, variables, hoisted=()):
+        import sympy as sp
+        from sympy.printing.numpy import NumPyPrinter
+        self.sp = sp
+        self.printer = NumPyPrinter()
+        self.variables = tuple(variables)
+        self.expressions = {sp.Symbol(name): expression for name, expression, _ in hoisted}
+        self.fixed = set(constants) | set(self.expressions)
+        self.hoisted = {}
+
+    def hoist(self, e):
+        # Hoisted expressions only ever contain constants, never other hoisted symbols
+        e = e.xreplace(self.expressions)
+        code = self.printer.doprint(e)
+        symbol = self.sp.Symbol("_k_" + hashlib.sha1(code.encode()).hexdigest()[:12])
+        self.hoisted[str(symbol)] = (str(symbol), e, code)
+        self.expressions[symbol] = e
+        self.fixed.add(symbol)
+        return symbol
+
+    def __call__(self, e):
+        sp = self.sp
+        if not e.args:
+            return e
+        if e.free_symbols <= self.fixed:
+            return self.hoist(e) if e.free_symbols else e
+        if isinstance(e, sp.Add):
+            terms = {}
+            for arg in e.args:
+                coefficient, term = arg.as_independent(*self.variables, as_Add=False)
+                terms.setdefault(term, []).append(coefficient)
+            if len(terms) < len(e.args):
+                e = sp.Add(*[sp.Add(*coefficients) * term for term, coefficients in terms.items()])
+                if not isinstance(e, sp.Add):
+                    return self(e)
+        if isinstance(e, (sp.Add, sp.Mul)):
+            constant_args = [arg for arg in e.args if arg.free_symbols <= self.fixed]
+            if len(constant_args) > 1 and any(arg.free_symbols for arg in constant_args):
+                rest = [self(arg) for arg in e.args if not arg.free_symbols <= self.fixed]
+                return e.func(self.hoist(e.func(*constant_args)), *rest)
+        return e.func(*[self(arg) for arg in e.args])
+
+
+@functools.lru_cache(maxsize=4096)
+def _equation(text, constants):
+    '''Symbolic residual of one equation (cached per _equation_key).
+
+    Constants stay symbols, so the entry holds for any constant values and
+    only an edited equation is sympified again; subexpressions of constants
+    are hoisted (see _ConstantFolder).
+
+    Returns:
+    - (expression, variable names in order of appearance, NumPy code,
+      hoisted (name, expression, code) triples).
+    '''
+    import sympy as sp
+    expression = frontend.parse_expression(text)
+    names = [name for name in expression.names if name not in frontend.RESERVED]
+    symbols = {name: sp.Symbol(_symbol_name(name)) for name in names}
+    eq_variables = tuple(name for name in names if name not in constants)
+    fold = _ConstantFolder([symbols[name] for name in constants], [symbols[name] for name in eq_variables])
+    sym_eq = fold(frontend.parse_system([text]).to_sympy(symbols)[0])
+    return sym_eq, eq_variables, fold.printer.doprint(sym_eq), tuple(fold.hoisted.values())
+
+
+@functools.lru_cache(maxsize=4096)
+def _equation_jacobian(text, constants):
+    '''Jacobian row of one equation (cached per _equation_key).
+
+    Each equation is differentiated only with respect to the variables it contains.
+
+    Returns:
+    - (entries, hoisted): (variable name, derivative, NumPy code) for the
+      nonzero derivatives, and the constant subexpressions hoisted from them.
+    '''
+    import sympy as sp
+    sym_eq, eq_variables, _, hoisted = _equation(text, constants)
+    variables = [sp.Symbol(_symbol_name(name)) for name in eq_variables]
+    fold = _ConstantFolder([sp.Symbol(_symbol_name(name)) for name in constants], variables, hoisted)
+    row = []
+    for name, symbol in zip(eq_variables, variables):
+        value = sp.diff(sym_eq, symbol)
+        if value != 0:
+            value = fold(value)
+            row.append((name, value, fold.printer.doprint(value)))
+    return tuple(row), tuple(fold.hoisted.values())
+
+
+def _bind_hoisted(hoisted, parameters, coefficients):
+    '''Values of hoisted constant subexpressions (see _ConstantFolder).
+
+    Subexpressions of fixed constants are evaluated here, once; those
+    involving parameters are derived from the parameter values at run time
+    (see CompiledFunctions.bind).
+
+    Returns:
+    - (values, computed): (name, number) and (name, code) pairs.
+    '''
+    namespace = _lambdify_namespace()
+    namespace.update({_symbol_name(name): np.float64(value) for name, value in coefficients.items()})
+    parameter_names = {_symbol_name(name) for name in parameters}
+    hoisted = {name: (expression, code) for name, expression, code in hoisted}
+    values, computed = [], []
+    with np.errstate(all='ignore'):
+        for name in sorted(hoisted):
+            expression, code = hoisted[name]
+            if parameter_names & {str(symbol) for symbol in expression.free_symbols}:
+                computed.append((name, code))
+            else:
+                values.append((name, float(eval(code, namespace))))
+    return values, computed
+
+
+def _function_source(arguments, values, outputs):
+    '''Emits the source of one generated function returning the list of outputs.
+
+    arguments are the positional argument names; values ((name, number)
+    pairs) become keyword-only defaults, which Python binds faster than
+    assignments. Values the outputs do not use are left out.
+    '''
+    body = ", ".join(outputs)
+    used = set(re.findall(r'\b_[nk]_\w+', body))
+    defaults = [f"{name}={value!r}" for name, value in values if name in used]
+    if defaults:
+        arguments = list(arguments) + ["*"] + defaults
+    return f"def {GENERATED_FUNCTION}({', '.join(arguments)}):\n    return [{body}]\n"
+
+
+class SystemCache:
+    '''LRU cache of CompiledFunctions with optional on-disk persistence.
+
+    Parameters:
+    - max_size: maximum number of entries kept in memory (and on disk).
+    - max_age: entries older than this many seconds are discarded (None = never).
+    - disk_dir: directory for the on-disk cache (None = memory only).
+    '''
+    def __init__(self, max_size=32, max_age=None, disk_dir=None):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._entries = OrderedDict()  # key -> (created, CompiledFunctions)
+        self._lock = threading.Lock()
+
+    def _expired(self, created):
+        return self.max_age is not None and time.time() - created > self.max_age
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _load_from_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(data.get("created", 0)):
+            os.remove(path)
+            return None
+        return data["created"], CompiledFunctions.from_dict(data)
+
+    def _save_to_disk(self, key, created, entry):
+        if not self.disk_dir:
+            return
+        os.makedirs(self.disk_dir, exist_ok=True)
+        data = {"created": created, **entry.to_dict()}
+        # Write to a temporary file first so concurrent readers never see partial JSON
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._disk_path(key))
+        self._prune_disk()
+
+    def _prune_disk(self):
+        paths = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir)
+                 if name.endswith(".json")]
+        if len(paths) <= self.max_size:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_size]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get(self, key, jacobian=False):
+        '''Returns the cached entry for key, or None on a miss.
+
+        With jacobian=True an entry compiled without a Jacobian counts as a miss.
+        '''
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and self._expired(item[0]):
+                del self._entries[key]
+                item = None
+            if item is None:
+                item = self._load_from_disk(key)
+                if item is not None:
+                    self.disk_hits += 1
+                    self._store(key, item)
+            if item is None or (jacobian and item[1].jac is None):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, entry):
+        created = time.time()
+        with self._lock:
+            self._store(key, (created, entry))
+            self._save_to_disk(key, created, entry)
+
+    def _store(self, key, item):
+        self._entries[key] = item
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.disk_hits = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+            }
+
+
+def _env_float(name):
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+default_cache = SystemCache(
+    max_size=int(os.environ.get("NLSOLVER_CACHE_SIZE", 32)),
+    max_age=_env_float("NLSOLVER_CACHE_MAX_AGE"),
+    disk_dir=os.environ.get("NLSOLVER_CACHE_DIR") or None,
+)
+
+
+def configure(max_size=None, max_age=None, disk_dir=None):
+    '''Adjusts the process-wide cache used by the solver modules.'''
+    if max_size is not None:
+        default_cache.max_size = max_size
+    if max_age is not None:
+        default_cache.max_age = max_age
+    if disk_dir is not None:
+        default_cache.disk_dir = disk_dir
+
+
+def clear_caches():
+    '''Empties every in-process compile cache: default_cache, the per-equation SymPy
+    expressions and derivatives, SymPy's own cache and the front-end parse
+    caches, so the next compile starts cold. The on-disk cache is left alone.'''
+    default_cache.clear()
+    _equation.cache_clear()
+    _equation_jacobian.cache_clear()
+    frontend.clear_caches()
+    if "sympy" in sys.modules:
+        sys.modules["sympy"].core.cache.clear_cache()
+
+
+def get_compiled(equations, variables, coefficients, jacobian=True, parameters=(), backend='lambdify',
+                 cache=None, timings=None):
+    '''Returns compiled functions for the system, compiling only on a cache miss.
+
+    On a hit the returned entry's `variables` may be ordered differently from the
+    `variables` argument (e.g. when loaded from disk); callers must use the entry's order.
+    A profiling.Timings passed as `timings` receives the compile spans on a miss.
+    '''
+    cache = cache if cache is not None else default_cache
+    parameters = tuple(parameters)
+    key = system_key(equations, coefficients, parameters, backend)
+    entry = cache.get(key, jacobian=jacobian)
+    if entry is None:
+        entry = compile_system(equations, variables, coefficients, jacobian=jacobian,
+                               parameters=parameters, backend=backend, timings=timings)
+        cache.put(key, entry)
+    return entry
+
+
+def get_bound(equations, variables, coefficients, parameters, jacobian=True, backend='lambdify', cache=None,
+              timings=None):
+    '''Returns compiled functions of the variables only, with the constants bound to their values.
+
+    The constants in `parameters` (usually every constant the equations use,
+    see frontend.EquationSystem.constants) are compiled as parameters and
+    bound afterwards, so the cache entry does not depend on their values:
+    solving again with other constant values binds them without compiling.
+    '''
+    parameters = list(parameters)
+    compiled = get_compiled(equations, variables, {name: coefficients[name] for name in parameters},
+                            jacobian=jacobian, parameters=parameters, backend=backend, cache=cache,
+                            timings=timings)
+    return compiled.bind([coefficients[name] for name in compiled.parameters])
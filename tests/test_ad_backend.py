@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+import system_cache
+
+EQUATIONS = ["x**2 + sin(y) - a", "x*y - exp(-z/b)", "sqrt(z + 2) - log(x + 3) - a*b"]
+VARIABLES = ["x", "y", "z"]
+CONSTANTS = {"a": 1.5, "b": 2.0}
+
+
+def compile(backend, **options):
+    compiled = system_cache.compile_system(EQUATIONS, VARIABLES, CONSTANTS, backend=backend, **options)
+    return compiled.bind([CONSTANTS[name] for name in compiled.parameters])
+
+
+@pytest.mark.parametrize("parameters", [(), tuple(CONSTANTS)])
+def test_ad_matches_lambdify(parameters):
+    ad = compile('ad', parameters=parameters)
+    reference = compile('lambdify', parameters=parameters)
+    rng = np.random.default_rng(0)
+    for x in rng.uniform(0.1, 2, size=(5, 3)):
+        np.testing.assert_allclose(ad.residual(x), reference.residual(x), rtol=1e-12)
+        np.testing.assert_allclose(ad.jacobian(x), reference.jacobian(x), rtol=1e-12, atol=1e-14)
+
+
+def test_ad_evaluates_many_points_at_once():
+    ad = compile('ad', parameters=tuple(CONSTANTS))
+    points = np.random.default_rng(1).uniform(0.1, 2, size=(3, 50))
+    F = np.empty((3, 50))
+    J = np.empty((ad.nnz, 50))
+    ad.evaluate(points, F, J)
+    for k in range(50):
+        np.testing.assert_allclose(F[:, k], ad.residual(points[:, k]), rtol=1e-12)
+        np.testing.assert_allclose(J[:, k], ad.jacobian(points[:, k])[ad.jac_rows, ad.jac_cols], rtol=1e-12)
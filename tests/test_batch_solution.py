@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+import newton_raphson
+
+
+def solve(precision, rows=200, tol=1e-10):
+    s = newton_raphson.Solution()
+    s.constants_text = "a = 2\nb = 3"
+    constants = np.column_stack([np.linspace(1, 5, rows), np.linspace(0.5, 3, rows)])
+    result = s.batch_solution(["x**2 - a", "y - b*x"], np.ones(2), constants=constants,
+                              constant_names=["a", "b"], variables=["x", "y"], tol=tol, precision=precision)
+    exact = np.column_stack([np.sqrt(constants[:, 0]), constants[:, 1] * np.sqrt(constants[:, 0])])
+    return result, exact
+
+
+@pytest.mark.parametrize("precision", newton_raphson.PRECISIONS)
+def test_varying_constants_reach_double_accuracy(precision):
+    result, exact = solve(precision)
+    assert result["converged"].all()
+    assert np.abs(result["solutions"] - exact).max() < 1e-9
+
+
+def test_mixed_matches_double():
+    double, _ = solve('double')
+    mixed, _ = solve('mixed')
+    np.testing.assert_allclose(mixed["solutions"], double["solutions"], rtol=1e-10)
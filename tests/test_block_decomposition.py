@@ -0,0 +1,18 @@
+from core_runner import CompiledSystem
+
+# One 2x2 block (x, y) feeding a scalar block (z)
+EQUATIONS = ["x**2 + y - a", "x - y + 1", "z - x*y"]
+
+
+def test_blocks_solve_the_system():
+    system = CompiledSystem("numpy", EQUATIONS, "a = 3")
+    result = system.solve({"x": 1, "y": 1, "z": 1}, decompose=True)
+    assert sorted(result["blocks"]) == [1, 2]
+    assert system.residual_norm(result["solution_dict"]) < 1e-8
+
+
+def test_block_solves_use_the_system_options():
+    system = CompiledSystem("numpy", EQUATIONS, "a = 3", globalization='dogleg')
+    result = system.solve({"x": 1, "y": 1, "z": 1}, decompose=True)
+    assert "trust radius" in result["log"]
+    assert system.residual_norm(result["solution_dict"]) < 1e-8
@@ -0,0 +1,29 @@
+import ast
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_cli(tmp_path, *args):
+    equations = tmp_path / "equations.txt"
+    equations.write_text("x**2 + y - p = 0\nx - y = 0\n")
+    constants = tmp_path / "constants.txt"
+    constants.write_text("p = 2\n")
+    subprocess.run([sys.executable, os.path.join(ROOT, "code_runner.py"), "--equations", str(equations),
+                    "--constants", str(constants), "--answers", str(tmp_path), "--no-warm-start",
+                    "--guess-store", str(tmp_path / "guesses.sqlite"), *args],
+                   check=True, cwd=tmp_path, capture_output=True)
+    answers = (tmp_path / "_Answers.txt").read_text()
+    line = next(line for line in answers.splitlines() if line.startswith("timings = "))
+    return ast.literal_eval(line[len("timings = "):])
+
+
+@pytest.mark.parametrize("solver", ["numpy", "scipyroot", "scipyls"])
+def test_answers_include_build_phase_timings(tmp_path, solver):
+    timings = run_cli(tmp_path, "--solver", solver)
+    for phase in ("parse_constants", "get_variables", "compile", "iterations"):
+        assert phase in timings
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+import continuation
+import result_store
+
+# x**2 + x = p folds at p = -1/4: the branch from p = 2 turns back before reaching -3
+FOLD = ["x**2 + y - p", "x - y"]
+
+
+def test_arclength_stops_at_start_after_fold():
+    points = list(continuation.trace("numpy", FOLD, "p = 2", "p", 2, -3, method='arclength',
+                                     initial_guess={"x": 1, "y": 1}))
+    values = np.array([row["p"] for row in points])
+    assert len(points) < 1000
+    assert values.min() >= -0.25 - 1e-6 and values.max() <= 2
+    assert values.min() == pytest.approx(-0.25, abs=1e-2)
+    # Ends back at p = 2 on the other branch
+    assert points[-1]["p"] == 2
+    assert points[-1]["x"] == pytest.approx(-2, abs=1e-6)
+    assert max(row["residual_norm"] for row in points) < 1e-8
+
+
+def test_arclength_clips_last_point_to_stop():
+    points = list(continuation.trace("numpy", FOLD, "p = 0", "p", 0, 3, method='arclength',
+                                     initial_guess={"x": 1, "y": 1}))
+    assert points[-1]["p"] == 3
+    assert points[-1]["x"] == pytest.approx((-1 + np.sqrt(13)) / 2)
+
+
+def test_natural_sweep_follows_the_branch():
+    points = list(continuation.trace("numpy", ["x**2 - p"], "p = 1", "p", 1, 4, step=0.5,
+                                     initial_guess={"x": 1}))
+    assert [row["p"] for row in points][0] == 1 and points[-1]["p"] == 4
+    for row in points:
+        assert row["x"] == pytest.approx(np.sqrt(row["p"]), rel=1e-8)
+
+
+def test_resume_continues_an_interrupted_sweep(tmp_path):
+    output = str(tmp_path / "sweep.store")
+    complete = continuation.run(str(tmp_path / "all.store"), "numpy", ["x**2 - p"], "p = 1", "p", 1, 4,
+                                step=0.5, initial_guess={"x": 1})
+    # Interrupted: only the first part of the range was written
+    continuation.run(output, "numpy", ["x**2 - p"], "p = 1", "p", 1, 4, step=0.5, initial_guess={"x": 1},
+                     max_points=3)
+    first = result_store.open_store(output).column("p").tolist()
+    resumed = continuation.run(output, "numpy", ["x**2 - p"], "p = 1", "p", 1, 4, resume=True)
+    assert resumed["points"] > 0
+    p = result_store.open_store(output).column("p")
+    assert p[:len(first)].tolist() == first
+    assert np.all(np.diff(p) > 0)  # the last stored point is not written twice
+    assert p[-1] == 4 == complete["last"]["p"]
+    np.testing.assert_allclose(result_store.open_store(output).column("x"), np.sqrt(p), rtol=1e-8)
+
+
+def test_resume_refuses_another_sweep(tmp_path):
+    output = str(tmp_path / "sweep.store")
+    continuation.run(output, "numpy", ["x**2 - p"], "p = 1", "p", 1, 2, initial_guess={"x": 1}, max_points=3)
+    with pytest.raises(ValueError):
+        continuation.run(output, "numpy", ["x**2 - p"], "p = 1", "p", 1, 3, resume=True)
@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip("gekko")
+
+from core_runner import get_system
+
+EQUATIONS = ["x**2 - a", "y - b*x"]
+
+
+def test_constants_only_change_reuses_model():
+    first = get_system("gekko", EQUATIONS, "a = 4\nb = 2*a")
+    second = get_system("gekko", EQUATIONS, "a = 9\nb = 2*a")
+    assert first is not second
+    assert second.gekko_model() is first.gekko_model()
+    for system, x, y in ((first, 2, 16), (second, 3, 54), (first, 2, 16)):
+        result = system.solve({"x": 1, "y": 1})
+        assert result["solution_dict"]["x"] == pytest.approx(x, rel=1e-6)
+        assert result["solution_dict"]["y"] == pytest.approx(y, rel=1e-6)
+        assert system.residual_norm(result["solution_dict"]) < 1e-6
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import newton_engine
+
+
+def rosenbrock():
+    points = []
+
+    def residual(x):
+        return np.array([10 * (x[1] - x[0] ** 2), 1 - x[0]])
+
+    def jacobian(x):
+        points.append(tuple(x))
+        return np.array([[-20 * x[0], 10.0], [-1.0, 0.0]])
+    return residual, jacobian, points
+
+
+def test_dogleg_keeps_jacobian_after_rejected_step():
+    residual, jacobian, points = rosenbrock()
+    result = newton_engine.solve(residual, jacobian, [-1.2, 1.0], tol=1e-10, globalization='dogleg')
+    np.testing.assert_allclose(result["x"], [1, 1])
+    assert result["iterations"] > result["jacobian_evaluations"]  # some steps were rejected
+    # Never evaluated (or factorized) twice at the same point
+    assert len(set(points)) == len(points) == result["jacobian_evaluations"]
+    assert result["factorizations"] == result["jacobian_evaluations"]
+
+
+def broyden_system():
+    '''A mildly nonlinear 3x3 system with a root at (1, 2, 3).'''
+    def residual(x):
+        return np.array([x[0] ** 2 + x[1] - 3, x[1] * x[2] - 6 + 0.1 * np.sin(x[0] - 1), x[2] ** 3 - 27])
+
+    def jacobian(x):
+        return np.array([[2 * x[0], 1, 0], [0.1 * np.cos(x[0] - 1), x[2], x[1]], [0, 0, 3 * x[2] ** 2]])
+    return residual, jacobian
+
+
+@pytest.mark.parametrize("update", newton_engine.JACOBIAN_UPDATES)
+@pytest.mark.parametrize("globalization", newton_engine.GLOBALIZATIONS)
+def test_updates_converge(update, globalization):
+    residual, jacobian = broyden_system()
+    result = newton_engine.solve(residual, jacobian, [1.3, 1.5, 3.4], tol=1e-10, max_iter=100,
+                                 globalization=globalization, jacobian_update=update)
+    np.testing.assert_allclose(result["x"], [1, 2, 3], rtol=1e-8)
+    assert np.linalg.norm(result["F"]) < 1e-10
+
+
+@pytest.mark.parametrize("update", ['chord', 'shamanskii', 'broyden'])
+def test_updates_evaluate_fewer_jacobians(update):
+    residual, jacobian = broyden_system()
+    newton = newton_engine.solve(residual, jacobian, [1.3, 1.5, 3.4], tol=1e-10)
+    result = newton_engine.solve(residual, jacobian, [1.3, 1.5, 3.4], tol=1e-10, max_iter=100,
+                                 jacobian_update=update)
+    assert result["jacobian_evaluations"] < newton["jacobian_evaluations"]
+    assert result["factorizations"] == result["jacobian_evaluations"]
+
+
+def test_rejects_unknown_options():
+    residual, jacobian = broyden_system()
+    with pytest.raises(ValueError):
+        newton_engine.solve(residual, jacobian, [1, 2, 3], globalization='wolfe')
+    with pytest.raises(ValueError):
+        newton_engine.solve(residual, jacobian, [1, 2, 3], jacobian_update='bfgs')
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+import jobs
+import result_cache
+
+
+@pytest.fixture
+def queue():
+    return jobs.JobQueue(max_workers=2)
+
+
+def test_shared_solve_is_not_cancellable(queue):
+    cache = result_cache.ResultCache()
+    started = []
+
+    def start():
+        started.append(queue.submit(time.sleep, 5))
+        return started[-1]
+
+    _, first = cache.solve("k", start)
+    _, second = cache.solve("k", start)
+    assert first is second and len(started) == 1
+    assert not cache.cancellable(first.id)
+    # One waiter leaves; the other is then the only one and may cancel
+    assert not cache.leave("k", first)
+    assert cache.cancellable(first.id)
+    assert queue.cancel(first.id)
+    # Its stream closing afterwards does not touch a new solve of the same key
+    _, third = cache.solve("k", start)
+    assert third is not first
+    assert cache.leave("k", first)
+    assert cache.stats()["in_flight"] == 1
+    queue.cancel(third.id)
+
+
+def finished(queue, result):
+    return lambda: queue.completed(result)
+
+
+def test_hits_and_eviction(queue):
+    cache = result_cache.ResultCache(max_size=2)
+    for key in "abc":
+        cache.solve(key, finished(queue, {"key": key}))
+    assert cache.stats()["entries"] == 2
+    assert cache.solve("c", None) == ({"key": "c"}, None)  # a hit never calls start
+    # "a" was the least recently used
+    result, job = cache.solve("a", finished(queue, {"key": "a2"}))
+    assert result is None and job.result == {"key": "a2"}
+    assert cache.stats()["hits"] == 1
+
+
+def test_size_and_age_limits(queue):
+    cache = result_cache.ResultCache(max_bytes=40)
+    cache.solve("big", finished(queue, {"x": "y" * 100}))
+    cache.solve("small", finished(queue, {"x": 1}))
+    assert cache.stats()["entries"] == 1 and cache.stats()["bytes"] <= 40
+
+    cache = result_cache.ResultCache(max_age=0.05)
+    cache.solve("k", finished(queue, {"x": 1}))
+    time.sleep(0.1)
+    result, _ = cache.solve("k", finished(queue, {"x": 2}))
+    assert result is None
+
+
+def test_failed_solves_are_not_cached(queue):
+    cache = result_cache.ResultCache()
+    _, job = cache.solve("k", lambda: queue.submit(int, "not a number"))
+    queue.wait_events(job, 0, timeout=10)
+    assert job.status == jobs.FAILED
+    # The cache hears of the job's end from a done callback, run just after the waiters are woken
+    deadline = time.monotonic() + 5
+    while cache.stats()["in_flight"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.stats()["entries"] == 0 and cache.stats()["in_flight"] == 0
+
+
+def test_key_depends_on_guesses_and_options():
+    key = result_cache.result_key("system", {"x": 1}, seed=1)
+    assert key == result_cache.result_key("system", {"x": 1}, seed=1)
+    assert key != result_cache.result_key("system", {"x": 2}, seed=1)
+    assert key != result_cache.result_key("system", {"x": 1}, seed=2)
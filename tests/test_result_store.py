@@ -0,0 +1,59 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import result_store
+
+
+def test_rows_span_chunks_and_survive_reopening(tmp_path):
+    path = str(tmp_path / "runs.store")
+    with result_store.ResultStore(path, chunk_rows=4, metadata={"case": "a"}) as store:
+        for k in range(6):
+            store.write({"p": k, "x": k * k})
+        store.extend({"p": np.arange(6, 11), "x": np.arange(6, 11) ** 2})
+    assert sorted(name for name in os.listdir(path) if name.endswith(".npy")) == \
+        ["chunk_000000.npy", "chunk_000001.npy", "chunk_000002.npy"]
+
+    with result_store.ResultStore(path) as store:  # appends after the last row
+        store.write({"p": 11, "x": 121})
+    store = result_store.open_store(path)
+    assert len(store) == 12 and store.metadata == {"case": "a"}
+    np.testing.assert_array_equal(store.column("p"), np.arange(12))
+    np.testing.assert_array_equal(store.read()["x"], np.arange(12) ** 2)
+    assert store.last() == {"p": 11.0, "x": 121.0}
+    assert [len(chunk["x"]) for chunk in store.chunks(["x"])] == [4, 4, 4]
+
+
+def test_rows_past_the_index_are_ignored(tmp_path):
+    path = str(tmp_path / "runs.store")
+    store = result_store.ResultStore(path, flush_interval=3600)
+    store.write({"p": 1.0})
+    store.flush()
+    store.write({"p": 2.0})  # never flushed, as if the process died here
+    assert len(result_store.open_store(path)) == 1
+    with open(os.path.join(path, result_store.INDEX)) as f:
+        assert json.load(f)["rows"] == 1
+
+
+def test_modes(tmp_path):
+    path = str(tmp_path / "runs.store")
+    with pytest.raises(FileNotFoundError):
+        result_store.open_store(path)
+    with result_store.ResultStore(path, columns=["p"]) as store:
+        store.write({"p": 1.0})
+    with pytest.raises(ValueError):
+        result_store.ResultStore(path, columns=["q"])
+    with pytest.raises(ValueError):
+        result_store.open_store(path).write({"p": 2.0})
+    with result_store.ResultStore(path, columns=["q"], mode='w') as store:
+        store.write({"q": 3.0})
+    store = result_store.open_store(path)
+    assert store.columns == ["q"]
+    np.testing.assert_array_equal(store.column("q"), [3.0])
+
+
+def test_is_store():
+    assert result_store.is_store("out/sweep.store/")
+    assert not result_store.is_store("out/sweep.csv")
@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+import pytest
+
+import scipy_ls_solver
+from frontend import load_equations, load_guesses
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def solve(**options):
+    s = scipy_ls_solver.Solution()
+    s.constantspath = os.path.join(ROOT, "constants.txt")
+    equations = load_equations([os.path.join(ROOT, "system_of_equations_MBE.txt"),
+                                os.path.join(ROOT, "system_of_equations_TEE.txt")])
+    guesses = load_guesses(os.path.join(ROOT, "initial_guesses.txt"))
+    result = s.solution(equations, guesses, **options)
+    x = np.array([result["solution_dict"][var] for var in s.variables])
+    return result, x, np.linalg.norm(s.compiled.residual(x))
+
+
+@pytest.fixture(scope="module")
+def dense():
+    return solve()
+
+
+@pytest.mark.parametrize("options", [
+    {"sparse": True},
+    {"sparse": True, "numerical_jacobian": True},
+    {"sparse": True, "backend": "ad"},
+])
+def test_sparse_solves_bundled_system(dense, options):
+    result, x, norm = solve(**options)
+    assert norm < 1e-6
+    # Same root as the dense mode
+    dense_x = dense[1]
+    assert np.linalg.norm(x - dense_x) <= 1e-6 * np.linalg.norm(dense_x)
+    assert result["function_evaluations"] <= dense[0]["function_evaluations"] * 2
+
+
+def test_sparse_log_describes_the_trust_region(dense):
+    result, _, _ = solve(sparse=True)
+    assert "dogleg trust region" in result["log"]
+    assert "least_squares" not in result["log"] and "Cost" not in result["log"]
+    assert "least_squares" in dense[0]["log"]
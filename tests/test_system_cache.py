@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import system_cache
+
+EQUATIONS = ["x**2 + y - a", "x - y*b", "z - exp(a*x)"]
+VARIABLES = ["x", "y", "z"]
+CONSTANTS = {"a": 3.0, "b": 0.5}
+
+
+@pytest.fixture(autouse=True)
+def cold():
+    system_cache.clear_caches()
+    yield
+    system_cache.clear_caches()
+
+
+def test_editing_one_equation_rederives_only_its_row():
+    system_cache.compile_system(EQUATIONS, VARIABLES, CONSTANTS, parameters=tuple(CONSTANTS))
+    equations = system_cache._equation.cache_info().misses
+    rows = system_cache._equation_jacobian.cache_info().misses
+    edited = EQUATIONS[:1] + ["x - y*b**2"] + EQUATIONS[2:]
+    compiled = system_cache.compile_system(edited, VARIABLES, CONSTANTS, parameters=tuple(CONSTANTS))
+    assert system_cache._equation.cache_info().misses == equations + 1
+    assert system_cache._equation_jacobian.cache_info().misses == rows + 1
+    bound = compiled.bind([CONSTANTS[name] for name in compiled.parameters])
+    x = np.array([1.0, 2.0, 3.0])
+    np.testing.assert_allclose(bound.residual(x), [1 + 2 - 3, 1 - 2 * 0.25, 3 - np.exp(3)])
+
+
+def test_constants_edit_binds_the_cached_entry():
+    cache = system_cache.SystemCache()
+    first = system_cache.get_bound(EQUATIONS, VARIABLES, CONSTANTS, list(CONSTANTS), cache=cache)
+    second = system_cache.get_bound(EQUATIONS, VARIABLES, {"a": 1.0, "b": 2.0}, list(CONSTANTS), cache=cache)
+    assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 1
+    x = np.array([1.0, 2.0, 3.0])
+    np.testing.assert_allclose(first.residual(x), [0, 0, 3 - np.exp(3)])
+    np.testing.assert_allclose(second.residual(x), [2, -3, 3 - np.e])
+    np.testing.assert_allclose(second.jacobian(x), [[2, 1, 0], [1, -2, 0], [-np.e, 0, 1]])